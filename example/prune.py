@@ -0,0 +1,81 @@
+import optparse
+
+import pressagio.dbconnector
+
+###################################### Main
+
+
+def main():
+    # parse command line options
+    usage = "usage: %prog [options] database"
+    parser = optparse.OptionParser(usage=usage, version="%prog 0.1")
+    parser.add_option(
+        "-n", "--ngram", dest="ngram", type="int", help="Specify ngram cardinality N"
+    )
+    parser.add_option(
+        "-m",
+        "--min-count",
+        dest="min_counts",
+        action="append",
+        default=[],
+        help="Delete the N-grams with a count lower than C, given as N:C",
+    )
+    parser.add_option(
+        "-k",
+        "--top-k",
+        dest="top_k",
+        type="int",
+        help="Keep only the K most frequent n-grams of every context",
+    )
+    parser.add_option(
+        "-t",
+        "--threshold",
+        dest="threshold",
+        type="float",
+        help="Delete the n-grams with a relative entropy lower than T",
+    )
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error("Please provide a database.")
+
+    if not options.ngram:
+        parser.error("Please specify n-gram cardinality.")
+
+    min_counts = {}
+    for min_count in options.min_counts:
+        cardinality, count = min_count.split(":")
+        min_counts[int(cardinality)] = int(count)
+
+    print("Pruning {0}...".format(args[0]))
+    report = pressagio.dbconnector.prune_ngrams_sqlite(
+        args[0], options.ngram, min_counts, options.top_k, options.threshold
+    )
+
+    for cardinality, pruned in sorted(report["pruned"].items()):
+        print("{0}-grams: {1} deleted".format(cardinality, pruned))
+    before, after = report["size"]
+    print(
+        "Size: {0} bytes -> {1} bytes ({2:+.1f}%)".format(
+            before, after, percent(before, after)
+        )
+    )
+    before, after = report["latency"]
+    print(
+        "Latency: {0:.1f} us -> {1:.1f} us ({2:+.1f}%)".format(
+            before * 1e6, after * 1e6, percent(before, after)
+        )
+    )
+
+
+###################################### Helpers
+
+
+def percent(before, after):
+    if before == 0:
+        return 0.0
+    return (after - before) * 100.0 / before
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,13 @@ def main():
         help="Enable append mode for database",
     )
     parser.add_option("-o", "--output", dest="outfile", help="Output file name O")
+    parser.add_option(
+        "-s",
+        "--shards",
+        dest="shards",
+        type="int",
+        help="Write a sharded model with S shard files",
+    )
     (options, infiles) = parser.parse_args()
 
     if not infiles:
@@ -50,13 +57,33 @@ def main():
 
     # write to sqlite database
     print("Writing result to {0}...".format(options.outfile))
-    pressagio.dbconnector.insert_ngram_map_sqlite(
-        ngram_map, options.ngram, options.outfile, options.append
-    )
+    if options.shards:
+        pressagio.dbconnector.insert_ngram_map_sharded(
+            ngram_map,
+            options.ngram,
+            options.outfile,
+            options.shards,
+            options.append,
+            progress=print_progress,
+        )
+    else:
+        pressagio.dbconnector.insert_ngram_map_sqlite(
+            ngram_map,
+            options.ngram,
+            options.outfile,
+            options.append,
+            progress=print_progress,
+        )
+    print("")
 
 
 ###################################### Helpers
 
 
+def print_progress(rows, rows_per_second):
+    sys.stdout.write("\r{0} n-grams ({1:.0f} n-grams/s)".format(rows, rows_per_second))
+    sys.stdout.flush()
+
+
 if __name__ == "__main__":
     main()
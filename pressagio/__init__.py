@@ -1,5 +1,8 @@
-import pressagio.predictor
+import contextlib
+
 import pressagio.context_tracker
+import pressagio.dbconnector
+import pressagio.predictor
 
 
 class Pressagio:
@@ -18,11 +21,113 @@ class Pressagio:
             self.config, self.predictor_registry, self.context_tracker
         )
         self.predictor_activator.combination_policy = "meritocracy"
+        self.stats = None
+
+    def predict(self, prediction_filter=None):
+        """
+        Predicts the next words for the text of the callback.
+
+        Predictions may run in several threads at once on the same instance
+        if the database connector is safe to share between threads: a
+        `SqliteDatabaseConnector` in `thread_local` or `read_only` mode, or
+        a `PooledPostgresDatabaseConnector`. The text is read from the
+        callback, so every thread needs to see its own text there, for
+        example through a `pressagio.callback.ThreadLocalCallback`. Changing
+        the configuration or the context tracker while predictions run is
+        not safe.
+
+        Parameters
+        ----------
+        prediction_filter : str
+            Only predict words whose next character after the current prefix
+            is one of the characters in this string.
 
-    def predict(self):
+        Returns
+        -------
+        words : list of str
+            The predicted words, most probable first.
+
+        """
         multiplier = 1
-        predictions = self.predictor_activator.predict(multiplier)
+        with self._stats_scope():
+            predictions = self.predictor_activator.predict(
+                multiplier, prediction_filter
+            )
         return [p.word for p in predictions]
 
+    async def apredict(self, prediction_filter=None):
+        """
+        Async version of `predict()`. The database is queried without
+        blocking the event loop, so one event loop can serve many sessions.
+
+        Parameters
+        ----------
+        prediction_filter : str
+            Only predict words whose next character after the current prefix
+            is one of the characters in this string.
+
+        Returns
+        -------
+        words : list of str
+            The predicted words, most probable first.
+
+        """
+        multiplier = 1
+        with self._stats_scope():
+            predictions = await self.predictor_activator.apredict(
+                multiplier, prediction_filter
+            )
+        return [p.word for p in predictions]
+
+    def enable_stats(self, slow_query_threshold=None):
+        """
+        Records the database queries of all predictors, see
+        `pressagio.dbconnector.QueryStatistics`.
+
+        Parameters
+        ----------
+        slow_query_threshold : float
+            Queries that take at least this many seconds are logged with
+            their query plan.
+
+        Returns
+        -------
+        stats : pressagio.dbconnector.QueryStatistics
+            The query statistics.
+
+        """
+        self.stats = pressagio.dbconnector.QueryStatistics(slow_query_threshold)
+        self.predictor_registry.set_query_statistics(self.stats)
+        return self.stats
+
+    def disable_stats(self):
+        """
+        Stops recording the database queries.
+
+        """
+        self.stats = None
+        self.predictor_registry.set_query_statistics(None)
+
+    def prediction_stats(self):
+        """
+        Returns the number of queries, the time spent in queries and the
+        rows returned by queries of the last prediction of the current thread
+        or task. Query statistics must be enabled with `enable_stats()`.
+
+        Returns
+        -------
+        totals : pressagio.dbconnector.QueryTotals
+            The totals of the queries, or None if there was no prediction.
+
+        """
+        if self.stats is None:
+            return None
+        return self.stats.last_totals()
+
     def close_database(self):
         self.predictor_registry.close_database()
+
+    def _stats_scope(self):
+        if self.stats is None:
+            return contextlib.nullcontext()
+        return self.stats.scope()
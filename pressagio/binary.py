@@ -0,0 +1,450 @@
+"""
+Compact binary format for n-gram models. A model file is memory mapped and
+searched in place, nothing is deserialized when it is opened.
+
+The file starts with a header and a table of sections. All sections are
+arrays in the byte order of the machine that wrote the file:
+
+* the vocabulary as a pool of UTF-8 encoded words and the offsets of the
+  words in the pool. The words are sorted by their ASCII lower case bytes,
+  the id of a word is its position, so all words with a given prefix have
+  consecutive ids.
+* for every cardinality the distinct contexts as sorted tuples of word ids,
+  the offsets of the words that follow each context, the count of each
+  context and the ids and counts of the following words, sorted by id.
+* the total count of the n-grams of every cardinality.
+
+"""
+import array
+import mmap
+import shutil
+import struct
+import sys
+import tempfile
+
+MAGIC = b"PRSGNGRM"
+VERSION = 1
+
+# magic, version, byte order, cardinality, vocabulary size
+_header = struct.Struct("<8sIcxxxII")
+# offset and length of a section
+_section = struct.Struct("<QQ")
+
+# Number of array items that are buffered in memory while a model is written
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Sections of every cardinality with their array type codes
+_ORDER_SECTIONS = (
+    ("contexts", "I"),
+    ("context_offsets", "Q"),
+    ("context_counts", "Q"),
+    ("words", "I"),
+    ("counts", "Q"),
+)
+
+
+class BinaryModelException(Exception):
+    pass
+
+
+def vocabulary_key(word):
+    """
+    Returns the sort key of a word in the vocabulary of a binary model: the
+    UTF-8 encoded word with ASCII letters in lower case, then the encoded
+    word itself.
+
+    Parameters
+    ----------
+    word : str
+        The word.
+
+    Returns
+    -------
+    key : tuple of bytes
+        The sort key.
+
+    """
+    encoded = word.encode("utf-8")
+    return (encoded.lower(), encoded)
+
+
+class _ArrayFile(object):
+    """
+    Array that is written to a temporary file in chunks.
+
+    """
+
+    def __init__(self, typecode):
+        self.typecode = typecode
+        self.length = 0
+        self._buffer = array.array(typecode)
+        self._file = tempfile.TemporaryFile()
+
+    def append(self, value):
+        self._buffer.append(value)
+        if len(self._buffer) >= WRITE_BUFFER_SIZE:
+            self._flush()
+
+    def extend(self, values):
+        self._buffer.extend(values)
+        if len(self._buffer) >= WRITE_BUFFER_SIZE:
+            self._flush()
+
+    def copy_to(self, f):
+        self._flush()
+        self._file.seek(0)
+        shutil.copyfileobj(self._file, f)
+        self._file.close()
+
+    @property
+    def nbytes(self):
+        return (self.length + len(self._buffer)) * self._buffer.itemsize
+
+    def _flush(self):
+        self._buffer.tofile(self._file)
+        self.length += len(self._buffer)
+        self._buffer = array.array(self.typecode)
+
+
+def write_model(filename, vocabulary, orders):
+    """
+    Writes an n-gram model in the binary format.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the model file.
+    vocabulary : list of str
+        All words of the model, sorted by `vocabulary_key()`.
+    orders : list of iterable of (tuple of int, int)
+        For every cardinality, starting with 1, the n-grams as tuples of
+        word ids and their counts, sorted by the word ids.
+
+    """
+    pool = _ArrayFile("B")
+    word_offsets = _ArrayFile("Q")
+    offset = 0
+    word_offsets.append(0)
+    for word in vocabulary:
+        encoded = word.encode("utf-8")
+        pool.extend(encoded)
+        offset += len(encoded)
+        word_offsets.append(offset)
+
+    sections = [pool, word_offsets]
+    totals = array.array("Q")
+    for cardinality, ngrams in enumerate(orders, 1):
+        contexts, context_offsets, context_counts, words, counts = [
+            _ArrayFile(typecode) for _, typecode in _ORDER_SECTIONS
+        ]
+        context = None
+        context_count = 0
+        total = 0
+        rows = 0
+        for ids, count in ngrams:
+            if ids[:-1] != context:
+                if context is not None:
+                    context_counts.append(context_count)
+                context = ids[:-1]
+                context_count = 0
+                contexts.extend(context)
+                context_offsets.append(rows)
+            words.append(ids[-1])
+            counts.append(count)
+            context_count += count
+            total += count
+            rows += 1
+        if context is not None:
+            context_counts.append(context_count)
+        context_offsets.append(rows)
+        totals.append(total)
+        sections += [contexts, context_offsets, context_counts, words, counts]
+
+    header_size = _header.size + _section.size * (len(sections) + 1)
+    offset = _align(header_size)
+    table = []
+    for section in sections:
+        table.append((offset, section.nbytes))
+        offset = _align(offset + section.nbytes)
+    table.append((offset, len(totals) * totals.itemsize))
+
+    with open(filename, "wb") as f:
+        f.write(
+            _header.pack(
+                MAGIC,
+                VERSION,
+                sys.byteorder[0].encode("ascii"),
+                len(totals),
+                len(vocabulary),
+            )
+        )
+        for entry in table:
+            f.write(_section.pack(*entry))
+        for section, (offset, _) in zip(sections, table):
+            f.write(b"\0" * (offset - f.tell()))
+            section.copy_to(f)
+        f.write(b"\0" * (table[-1][0] - f.tell()))
+        totals.tofile(f)
+
+
+class BinaryModel(object):
+    """
+    An n-gram model in the binary format, opened with `mmap`. Every process
+    that opens the same file shares its pages in the page cache of the
+    operating system.
+
+    """
+
+    def __init__(self, filename):
+        """
+        Opens a model file.
+
+        Parameters
+        ----------
+        filename : str
+            Path of the model file.
+
+        """
+        self.filename = filename
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        magic, version, byteorder, cardinality, size = _header.unpack_from(buf)
+        if magic != MAGIC or version != VERSION:
+            raise BinaryModelException("Not a binary n-gram model.")
+        if byteorder != sys.byteorder[0].encode("ascii"):
+            raise BinaryModelException("The model was written on another platform.")
+        self.cardinality = cardinality
+        self.vocabulary_size = size
+
+        def section(index, typecode):
+            offset, length = _section.unpack_from(
+                buf, _header.size + index * _section.size
+            )
+            return buf[offset : offset + length].cast(typecode)
+
+        self._pool = section(0, "B")
+        self._word_offsets = section(1, "Q")
+        self._orders = [None]
+        for i in range(cardinality):
+            self._orders.append(
+                [
+                    section(2 + i * len(_ORDER_SECTIONS) + j, typecode)
+                    for j, (_, typecode) in enumerate(_ORDER_SECTIONS)
+                ]
+            )
+        self._totals = section(2 + cardinality * len(_ORDER_SECTIONS), "Q")
+
+    def close(self):
+        """
+        Closes the model file.
+
+        """
+        self._pool = self._word_offsets = self._totals = None
+        self._orders = [None]
+        self._mmap.close()
+
+    def word(self, word_id):
+        """
+        Returns the word with the given id.
+
+        """
+        return str(self._word_bytes(word_id), "utf-8")
+
+    def word_id(self, word):
+        """
+        Returns the id of a word or None if the word is not in the vocabulary.
+
+        """
+        key = vocabulary_key(word)
+        low, high = 0, self.vocabulary_size
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.vocabulary_size and self._word_bytes(low) == key[1]:
+            return low
+        return None
+
+    def word_ids(self, words):
+        """
+        Returns the ids of several words as a tuple or None if one of the
+        words is not in the vocabulary.
+
+        """
+        ids = []
+        for word in words:
+            word_id = self.word_id(word)
+            if word_id is None:
+                return None
+            ids.append(word_id)
+        return tuple(ids)
+
+    def prefix_range(self, prefix):
+        """
+        Returns the range of the ids of the words that start with the given
+        prefix, ignoring the case of ASCII letters.
+
+        Returns
+        -------
+        range : tuple of int
+            The first id and the id after the last one.
+
+        """
+        prefix = prefix.encode("utf-8").lower()
+        n = len(prefix)
+        low, high = 0, self.vocabulary_size
+        while low < high:
+            middle = (low + high) // 2
+            if self._word_bytes(middle).lower() < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        start = low
+        high = self.vocabulary_size
+        while low < high:
+            middle = (low + high) // 2
+            if self._word_bytes(middle)[:n].lower() <= prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return start, low
+
+    def total(self, cardinality):
+        """
+        Returns the sum of the counts of all n-grams of a cardinality.
+
+        """
+        if cardinality > self.cardinality:
+            return 0
+        return self._totals[cardinality - 1]
+
+    def context_range(self, context):
+        """
+        Returns the positions of the words that follow a context.
+
+        Parameters
+        ----------
+        context : tuple of int
+            The word ids of the context.
+
+        Returns
+        -------
+        index : int
+            The index of the context, or None if it is not in the model.
+        range : tuple of int
+            The first position and the position after the last one.
+
+        """
+        cardinality = len(context) + 1
+        if cardinality > self.cardinality:
+            return None, (0, 0)
+        contexts, offsets, _, _, _ = self._orders[cardinality]
+        if cardinality == 1:
+            if len(offsets) < 2:
+                return None, (0, 0)
+            return 0, (offsets[0], offsets[1])
+        width = cardinality - 1
+        low, high = 0, len(offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if tuple(contexts[middle * width : (middle + 1) * width]) < context:
+                low = middle + 1
+            else:
+                high = middle
+        if (
+            low < len(offsets) - 1
+            and tuple(contexts[low * width : (low + 1) * width]) == context
+        ):
+            return low, (offsets[low], offsets[low + 1])
+        return None, (0, 0)
+
+    def context_count(self, context):
+        """
+        Returns the sum of the counts of the n-grams that start with a
+        context given as word ids.
+
+        """
+        index, _ = self.context_range(context)
+        if index is None:
+            return 0
+        return self._orders[len(context) + 1][2][index]
+
+    def count(self, ids):
+        """
+        Returns the count of an n-gram given as word ids.
+
+        """
+        _, (start, end) = self.context_range(ids[:-1])
+        words, counts = self._orders[len(ids)][3:]
+        position = self._bisect(words, ids[-1], start, end)
+        if position < end and words[position] == ids[-1]:
+            return counts[position]
+        return 0
+
+    def followers(self, context, word_range=None):
+        """
+        Returns the ids and counts of the words that follow a context.
+
+        Parameters
+        ----------
+        context : tuple of int
+            The word ids of the context.
+        word_range : tuple of int
+            Only return words with ids in this range.
+
+        Returns
+        -------
+        followers : list of (int, int)
+            The word ids and counts, sorted by id.
+
+        """
+        _, (start, end) = self.context_range(context)
+        words, counts = self._orders[len(context) + 1][3:]
+        if word_range is not None:
+            start, end = (
+                self._bisect(words, word_range[0], start, end),
+                self._bisect(words, word_range[1], start, end),
+            )
+        return list(zip(words[start:end], counts[start:end]))
+
+    def ngrams(self, cardinality):
+        """
+        Iterates over the n-grams of a cardinality.
+
+        Returns
+        -------
+        ngrams : generator
+            Tuples of the word ids of an n-gram and its count.
+
+        """
+        contexts, offsets, _, words, counts = self._orders[cardinality]
+        width = cardinality - 1
+        for index in range(len(offsets) - 1):
+            context = tuple(contexts[index * width : (index + 1) * width])
+            for position in range(offsets[index], offsets[index + 1]):
+                yield context + (words[position],), counts[position]
+
+    def _word_bytes(self, word_id):
+        return bytes(
+            self._pool[self._word_offsets[word_id] : self._word_offsets[word_id + 1]]
+        )
+
+    def _key(self, word_id):
+        encoded = self._word_bytes(word_id)
+        return (encoded.lower(), encoded)
+
+    def _bisect(self, values, value, low, high):
+        while low < high:
+            middle = (low + high) // 2
+            if values[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def _align(offset):
+    return (offset + 7) & ~7
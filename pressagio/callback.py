@@ -5,6 +5,8 @@ Base class for callbacks.
 
 from __future__ import absolute_import, unicode_literals
 
+import threading
+
 
 class Callback(object):
     """
@@ -27,3 +29,32 @@ class Callback(object):
             self.stream[:-1]
         else:
             self.stream += character
+
+
+class ThreadLocalCallback(Callback):
+    """
+    Callback that keeps a separate stream for every thread. Use this to
+    share one `Pressagio` instance between the threads of a server, where
+    every thread sets the text of the request it is handling.
+
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self.empty = ""
+
+    def stream():
+        doc = "The stream of the calling thread."
+
+        def fget(self):
+            return getattr(self._local, "stream", "")
+
+        def fset(self, value):
+            self._local.stream = value
+
+        def fdel(self):
+            del self._local.stream
+
+        return locals()
+
+    stream = property(**stream())
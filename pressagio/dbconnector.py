@@ -6,18 +6,133 @@ Classes to connect to databases.
 from __future__ import absolute_import, unicode_literals
 
 import abc
-import sqlite3
+import asyncio
+import bisect
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import hashlib
+import heapq
+import io
+import itertools
+import math
+import os
+import pathlib
 import re
+import sqlite3
+import threading
+import time
+import weakref
+import zlib
+
+import pressagio.binary
 
 try:
     import psycopg2
+    import psycopg2.extras
 
     psycopg2.extensions.register_type(psycopg2.extensions.UNICODE)
     psycopg2.extensions.register_type(psycopg2.extensions.UNICODEARRAY)
 except ImportError:
     pass
 
-re_escape_singlequote = re.compile("'")
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+# Maximum number of n-grams that are resolved in a single bulk count query
+NGRAM_COUNTS_BATCH_SIZE = 256
+
+# Number of completions that a completion index stores for every prefix
+DEFAULT_COMPLETION_SIZE = 32
+
+# Number of compiled statements that sqlite keeps per connection
+SQLITE_CACHED_STATEMENTS = 256
+
+# Number of n-grams that are written with a single call in bulk builds
+DEFAULT_BATCH_SIZE = 50000
+
+# Pragmas that are set on sqlite databases while n-grams are written in bulk
+SQLITE_BUILD_PRAGMAS = {
+    "journal_mode": "OFF",
+    "synchronous": "OFF",
+    "cache_size": -262144,
+}
+
+# Number of rows that are fetched at once when a query result is streamed
+STREAM_BATCH_SIZE = 10000
+
+# Number of contexts that are looked up to measure the latency of lookups
+DEFAULT_LATENCY_PROBES = 1000
+
+# Number of threads that run the queries of the async methods of a sqlite
+# connector
+SQLITE_ASYNC_WORKERS = 4
+
+# Pragmas that are set on sqlite databases that are opened read-only for
+# serving, the memory map covers the whole file on top of these
+SQLITE_SERVING_PRAGMAS = {
+    "query_only": 1,
+    "cache_size": -65536,
+}
+
+# Names of the statements that were prepared on each postgres connection
+_prepared_statements = weakref.WeakKeyDictionary()
+
+# Postgres connection pools that are shared by all connectors of the process
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+
+# Async postgres connection pools, one per event loop and connection
+# parameters
+_async_connection_pools = weakref.WeakKeyDictionary()
+
+# Sequence numbers for the names of the server-side cursors of postgres
+_cursor_ids = itertools.count()
+
+# Minimum and maximum number of connections of async postgres connection pools
+ASYNC_POOL_MIN_SIZE = 1
+ASYNC_POOL_MAX_SIZE = 10
+
+# Context manager for connections that are not shared between threads
+_unlocked = contextlib.nullcontext()
+
+# Maps upper case ASCII letters to lower case, like sqlite's lower()
+_ascii_lowercase = str.maketrans(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"
+)
+
+# Escape sequences for values in the text format of postgres' COPY
+_copy_escapes = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+# Upper bounds in seconds of the buckets of the latency histograms of the
+# query statistics, the last bucket has no upper bound
+LATENCY_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+# Number of slow queries that the query statistics keep
+SLOW_QUERY_LOG_SIZE = 100
+
+# The query totals that queries are counted in, see `QueryStatistics.scope()`
+_query_scope = contextvars.ContextVar("pressagio_query_scope", default=None)
+
+# The query totals of the last scope that ended in a context
+_last_query_scope = contextvars.ContextVar("pressagio_last_query_scope", default=None)
 
 
 class DatabaseConnector(object):
@@ -44,8 +159,13 @@ class DatabaseConnector(object):
         self.dbname = dbname
         self.lowercase = False
         self.normalize = False
+        self.covering_index = False
+        self.integer_ids = False
+        self.stats = None
+        self._statements = {}
+        self._metadata = {}
 
-    def create_ngram_table(self, cardinality):
+    def create_ngram_table(self, cardinality, unique=True):
         """
         Creates a table for n-gram of a give cardinality. The table name is
         constructed from this parameter, for example for cardinality `2` there
@@ -55,20 +175,72 @@ class DatabaseConnector(object):
         ----------
         cardinality : int
             The cardinality to create a table for.
+        unique : bool
+            Whether to create the table with a unique constraint on the
+            n-gram columns.
 
         """
+        if self.integer_ids:
+            self.create_vocabulary_table()
+
+        word_type = self._word_type()
         query = "CREATE TABLE IF NOT EXISTS _{0}_gram (".format(cardinality)
-        unique = ""
+        unique_columns = ""
         for i in reversed(range(cardinality)):
             if i != 0:
-                unique += "word_{0}, ".format(i)
-                query += "word_{0} TEXT, ".format(i)
+                unique_columns += "word_{0}, ".format(i)
+                query += "word_{0} {1}, ".format(i, word_type)
             else:
-                unique += "word"
-                query += "word TEXT, count INTEGER, UNIQUE({0}) );".format(unique)
+                unique_columns += "word"
+                query += "word {0}, count INTEGER".format(word_type)
+                if unique:
+                    query += ", UNIQUE({0})".format(unique_columns)
+                query += " );"
 
         self.execute_sql(query)
 
+    def create_vocabulary_table(self):
+        """
+        Creates the table `_vocab` if it does not exist. If `integer_ids` is
+        set, the n-gram tables store the ids of the words in this table
+        instead of the words, the connector translates between words and ids
+        in all statements.
+
+        """
+        self.execute_sql(
+            "CREATE TABLE IF NOT EXISTS _vocab (id INTEGER PRIMARY KEY, word TEXT UNIQUE);"
+        )
+        self.execute_sql(
+            "CREATE INDEX IF NOT EXISTS idx_vocab_lower ON _vocab(lower(word));"
+        )
+
+    def add_words(self, words):
+        """
+        Adds words to the table `_vocab`, words that are in the table already
+        keep their ids.
+
+        Parameters
+        ----------
+        words : iterable of str
+            The words to add.
+
+        """
+        self.execute_many_statement(
+            self._statement("add_word", 0), ([word] for word in words)
+        )
+
+    def vocabulary(self):
+        """
+        Returns the ids of all words of the table `_vocab`.
+
+        Returns
+        -------
+        ids : dict
+            Maps the words to their ids.
+
+        """
+        return dict(self.execute_statement(self._statement("vocabulary", 0), []))
+
     def delete_ngram_table(self, cardinality):
         """
         Deletes the table for n-gram of a give cardinality. The table name is
@@ -84,17 +256,32 @@ class DatabaseConnector(object):
 
         query = "DROP TABLE IF EXISTS _{0}_gram;".format(cardinality)
         self.execute_sql(query)
+        self.delete_metadata(cardinality)
 
     def create_index(self, cardinality):
         """
         Create an index for the table with the given cardinality.
 
+        If `covering_index` is set, this creates composite indexes that contain
+        all columns of the n-gram lookups instead of one index per context
+        column. The index `idx_<cardinality>_gram_top` on the context columns
+        and the descending count answers lookups for the most frequent
+        n-grams of a context without a sort step.
+
         Parameters
         ----------
         cardinality : int
             The cardinality to create a index for.
 
         """
+        if self.covering_index:
+            columns = self._column_names(cardinality)[:-1] + ["count DESC", "word"]
+            query = "CREATE INDEX idx_{0}_gram_top ON _{0}_gram({1});".format(
+                cardinality, ", ".join(columns)
+            )
+            self.execute_sql(query)
+            return
+
         for i in reversed(range(cardinality)):
             if i != 0:
                 query = "CREATE INDEX idx_{0}_gram_{1} ON _{0}_gram(word_{1});".format(
@@ -116,6 +303,8 @@ class DatabaseConnector(object):
             if i != 0:
                 query = "DROP INDEX IF EXISTS idx_{0}_gram_{1};".format(cardinality, i)
                 self.execute_sql(query)
+        query = "DROP INDEX IF EXISTS idx_{0}_gram_top;".format(cardinality)
+        self.execute_sql(query)
 
     def create_unigram_table(self):
         """
@@ -138,13 +327,133 @@ class DatabaseConnector(object):
         """
         self.create_ngram_table(3)
 
+    def update_metadata(self, cardinality):
+        """
+        Computes the metadata for the n-gram table with the given cardinality
+        from the n-grams in the table. The metadata consists of the total
+        count of all n-grams, which is stored in the table `_totals`, and for
+        cardinalities greater than 1 the marginal count of every context,
+        which is stored in a table `_<cardinality>_gram_context`. Once the
+        metadata exists it is kept in sync by `insert_ngram()`,
+        `insert_ngrams()`, `upsert_ngrams()`, `update_ngram()` and
+        `remove_ngram()`.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        self.execute_sql(
+            "CREATE TABLE IF NOT EXISTS _totals (cardinality INTEGER PRIMARY KEY, total INTEGER);"
+        )
+        self.execute_sql(
+            "DELETE FROM _totals WHERE cardinality = {0};".format(cardinality)
+        )
+        self.execute_sql(
+            "INSERT INTO _totals (cardinality, total) SELECT {0}, {1} FROM _{0}_gram;".format(
+                cardinality, "COALESCE(SUM(count), 0)"
+            )
+        )
+
+        if cardinality > 1:
+            columns = ", ".join(self._column_names(cardinality)[:-1])
+            self.execute_sql("DROP TABLE IF EXISTS _{0}_gram_context;".format(cardinality))
+            self.execute_sql(
+                "CREATE TABLE _{0}_gram_context ({1}, count INTEGER, UNIQUE({2}));".format(
+                    cardinality,
+                    ", ".join(
+                        "{0} {1}".format(c, self._word_type())
+                        for c in self._column_names(cardinality)[:-1]
+                    ),
+                    columns,
+                )
+            )
+            query = "INSERT INTO _{0}_gram_context ({1}, count) SELECT {1}, SUM(count)".format(
+                cardinality, columns
+            )
+            self.execute_sql(
+                "{0} FROM _{1}_gram GROUP BY {2};".format(query, cardinality, columns)
+            )
+
+        self._metadata[cardinality] = True
+
+    def delete_metadata(self, cardinality):
+        """
+        Deletes the metadata of the n-gram table with the given cardinality.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        if self._table_exists("_totals"):
+            self.execute_sql(
+                "DELETE FROM _totals WHERE cardinality = {0};".format(cardinality)
+            )
+        self.execute_sql("DROP TABLE IF EXISTS _{0}_gram_context;".format(cardinality))
+        self._metadata[cardinality] = False
+
+    def has_metadata(self, cardinality):
+        """
+        Checks whether the metadata of the n-gram table with the given
+        cardinality exists.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        Returns
+        -------
+        has_metadata : bool
+            True if `update_metadata()` was called for the table.
+
+        """
+        if cardinality not in self._metadata:
+            self._metadata[cardinality] = (
+                self._table_exists("_totals")
+                and len(
+                    self.execute_statement(
+                        self._statement("ngram_total", cardinality), [cardinality]
+                    )
+                )
+                > 0
+            )
+        return self._metadata[cardinality]
+
+    async def ahas_metadata(self, cardinality):
+        """
+        Async version of `has_metadata()`.
+
+        """
+        if cardinality not in self._metadata:
+            self._metadata[cardinality] = (
+                len(
+                    await self.aexecute_statement(
+                        self._statement("table_exists", 0), ["_totals"]
+                    )
+                )
+                > 0
+                and len(
+                    await self.aexecute_statement(
+                        self._statement("ngram_total", cardinality), [cardinality]
+                    )
+                )
+                > 0
+            )
+        return self._metadata[cardinality]
+
     def ngrams(self, with_counts=False):
         """
-        Returns all ngrams that are in the table.
+        Returns all ngrams that are in the table. The rows are streamed from
+        the database with `iterate_statement()`.
 
         Parameters
         ----------
-        None
+        with_counts : bool
+            Append the count to every n-gram.
 
         Returns
         -------
@@ -152,25 +461,80 @@ class DatabaseConnector(object):
             A generator for ngram tuples.
 
         """
-        query = "SELECT "
-        for i in reversed(range(self.cardinality)):
-            if i != 0:
-                query += "word_{0}, ".format(i)
-            elif i == 0:
-                query += "word"
+        statement = self._statement("ngrams", self.cardinality, with_counts)
+        for row in self.iterate_statement(statement, []):
+            yield tuple(row)
 
-        if with_counts:
-            query += ", count"
+    def unigram_counts_sum(self):
+        return self.ngram_total(1)
 
-        query += " FROM _{0}_gram;".format(self.cardinality)
+    async def aunigram_counts_sum(self):
+        """
+        Async version of `unigram_counts_sum()`.
 
-        result = self.execute_sql(query)
-        for row in result:
-            yield tuple(row)
+        """
+        return await self.angram_total(1)
 
-    def unigram_counts_sum(self):
-        query = "SELECT SUM(count) from _1_gram;"
-        result = self.execute_sql(query)
+    def ngram_total(self, cardinality):
+        """
+        Gets the sum of the counts of all n-grams with the given cardinality.
+        This is read from the metadata if it exists, otherwise the counts are
+        summed up.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-grams.
+
+        Returns
+        -------
+        total : int
+            The sum of the counts.
+
+        """
+        statement, params = self._ngram_total_query(
+            cardinality, self.has_metadata(cardinality)
+        )
+        result = self.execute_statement(statement, params)
+        return self._extract_first_integer(result)
+
+    async def angram_total(self, cardinality):
+        """
+        Async version of `ngram_total()`.
+
+        """
+        statement, params = self._ngram_total_query(
+            cardinality, await self.ahas_metadata(cardinality)
+        )
+        result = await self.aexecute_statement(statement, params)
+        return self._extract_first_integer(result)
+
+    def context_count(self, context):
+        """
+        Gets the marginal count of a context, that is the sum of the counts
+        of all n-grams that start with the given context. This is read from
+        the metadata if it exists, otherwise the counts are summed up.
+
+        Parameters
+        ----------
+        context : iterable of str
+            A list, set or tuple of strings.
+
+        Returns
+        -------
+        count : int
+            The marginal count of the context.
+
+        """
+        cardinality = len(context) + 1
+        if cardinality == 1:
+            return self.ngram_total(1)
+
+        if self.has_metadata(cardinality):
+            statement = self._statement("context_count", cardinality)
+        else:
+            statement = self._statement("context_counts_sum", cardinality)
+        result = self.execute_statement(statement, list(context))
         return self._extract_first_integer(result)
 
     def ngram_count(self, ngram):
@@ -188,29 +552,167 @@ class DatabaseConnector(object):
             The count of the ngram.
 
         """
-        query = "SELECT count FROM _{0}_gram".format(len(ngram))
-        query += self._build_where_clause(ngram)
-        query += ";"
+        statement = self._statement("ngram_count", len(ngram))
+        result = self.execute_statement(statement, list(ngram))
 
-        result = self.execute_sql(query)
+        return self._extract_first_integer(result)
+
+    async def angram_count(self, ngram):
+        """
+        Async version of `ngram_count()`.
 
+        """
+        statement = self._statement("ngram_count", len(ngram))
+        result = await self.aexecute_statement(statement, list(ngram))
         return self._extract_first_integer(result)
 
-    def ngram_like_table(self, ngram, limit=-1):
-        query = "SELECT {0} FROM _{1}_gram {2} ORDER BY count DESC".format(
-            self._build_select_like_clause(len(ngram)),
-            len(ngram),
-            self._build_where_like_clause(ngram),
+    def ngram_counts(self, ngrams):
+        """
+        Gets the counts for several ngrams from the database. The ngrams are
+        grouped by cardinality and each group is resolved with a single query
+        instead of one query per ngram.
+
+        Parameters
+        ----------
+        ngrams : iterable of iterable of str
+            The ngrams to look up, each one a list, set or tuple of strings.
+
+        Returns
+        -------
+        counts : dict
+            Maps each ngram (as a tuple) to its count. Ngrams that are not in
+            the database have a count of 0.
+
+        """
+        counts, queries = self._ngram_counts_queries(ngrams)
+        for statement, params in queries:
+            self._merge_counts(counts, self.execute_statement(statement, params))
+        return counts
+
+    async def angram_counts(self, ngrams):
+        """
+        Async version of `ngram_counts()`, the queries run concurrently.
+
+        """
+        counts, queries = self._ngram_counts_queries(ngrams)
+        results = await asyncio.gather(
+            *[self.aexecute_statement(statement, params) for statement, params in queries]
         )
-        if limit < 0:
-            query += ";"
-        else:
-            query += " LIMIT {0};".format(limit)
+        for result in results:
+            self._merge_counts(counts, result)
+        return counts
+
+    def ngram_like_table(self, ngram, limit=-1):
+        """
+        Gets all n-grams that start with the given context and whose last
+        word starts with the given prefix, ordered by count.
+
+        Parameters
+        ----------
+        ngram : iterable of str
+            The context words followed by the prefix of the last word.
+        limit : int
+            The maximum number of n-grams to return, -1 for all.
+
+        Returns
+        -------
+        ngrams : list of tuple
+            The words of the n-grams followed by their count.
+
+        """
+        statement, params = self._ngram_like_query(ngram, limit)
+        return self.execute_statement(statement, params)
+
+    async def angram_like_table(self, ngram, limit=-1):
+        """
+        Async version of `ngram_like_table()`.
 
-        return self.execute_sql(query)
+        """
+        statement, params = self._ngram_like_query(ngram, limit)
+        return await self.aexecute_statement(statement, params)
 
     def ngram_like_table_filtered(self, ngram, filter, limit=-1):
-        pass
+        """
+        Gets the n-grams like `ngram_like_table()`, but only those whose last
+        word continues the prefix with one of the strings of the filter. The
+        filter is turned into one prefix range per string, all ranges are
+        looked up in a single query.
+
+        Parameters
+        ----------
+        ngram : iterable of str
+            The context words followed by the prefix of the last word.
+        filter : iterable of str
+            The allowed continuations of the prefix, for example a string of
+            the characters that may follow the prefix.
+        limit : int
+            The maximum number of n-grams to return, -1 for all.
+
+        Returns
+        -------
+        ngrams : list of tuple
+            The words of the n-grams followed by their count.
+
+        """
+        query = self._ngram_like_filtered_query(ngram, filter, limit)
+        if query is None:
+            return []
+        return self.execute_statement(*query)
+
+    async def angram_like_table_filtered(self, ngram, filter, limit=-1):
+        """
+        Async version of `ngram_like_table_filtered()`.
+
+        """
+        query = self._ngram_like_filtered_query(ngram, filter, limit)
+        if query is None:
+            return []
+        return await self.aexecute_statement(*query)
+
+    def backoff_candidates(self, ngrams, limit, filter=None):
+        """
+        Gets the candidates for the completion of the last word from the
+        n-grams of several cardinalities in a single query, see
+        `ngram_like_table()`. The n-grams are looked up in the given order
+        and at most `limit` n-grams are taken from every lookup. The words
+        of the n-grams are returned without duplicates, ordered by lookup
+        and count.
+
+        Parameters
+        ----------
+        ngrams : list of list of str
+            The context words followed by the prefix of the last word, for
+            every cardinality. All n-grams end with the same prefix.
+        limit : int
+            The maximum number of candidates to return.
+        filter : iterable of str
+            The allowed continuations of the prefix, see
+            `ngram_like_table_filtered()`.
+
+        Returns
+        -------
+        candidates : list of str
+            The candidate words.
+
+        """
+        if len(ngrams) == 0:
+            return []
+        query = self._backoff_candidates_query(ngrams, limit, filter)
+        if query is None:
+            return []
+        return [row[0] for row in self.execute_statement(*query)]
+
+    async def abackoff_candidates(self, ngrams, limit, filter=None):
+        """
+        Async version of `backoff_candidates()`.
+
+        """
+        if len(ngrams) == 0:
+            return []
+        query = self._backoff_candidates_query(ngrams, limit, filter)
+        if query is None:
+            return []
+        return [row[0] for row in await self.aexecute_statement(*query)]
 
     def increment_ngram_count(self, ngram):
         pass
@@ -227,10 +729,92 @@ class DatabaseConnector(object):
             The count for the given n-gram.
 
         """
-        query = "INSERT INTO _{0}_gram {1};".format(
-            len(ngram), self._build_values_clause(ngram, count)
-        )
-        self.execute_sql(query)
+        if self.integer_ids:
+            self.add_words(ngram)
+        statement = self._statement("insert_ngram", len(ngram))
+        self.execute_statement(statement, list(ngram) + [count])
+        self._add_to_metadata(len(ngram), [(ngram, count)])
+
+    def insert_ngrams(self, ngram_counts):
+        """
+        Inserts several n-grams with counts into the database. All n-grams of
+        the same cardinality are written with a single statement execution.
+
+        Parameters
+        ----------
+        ngram_counts : iterable of (iterable of str, int)
+            The n-grams and their counts.
+
+        """
+        params = collections.defaultdict(list)
+        for ngram, count in ngram_counts:
+            params[len(ngram)].append(list(ngram) + [count])
+
+        if self.integer_ids:
+            self.add_words(
+                set(word for rows in params.values() for row in rows for word in row[:-1])
+            )
+
+        for cardinality, rows in params.items():
+            statement = self._statement("insert_ngram", cardinality)
+            self.execute_many_statement(statement, rows)
+            self._add_to_metadata(
+                cardinality, [(row[:-1], row[-1]) for row in rows]
+            )
+
+    def upsert_ngrams(self, ngram_counts):
+        """
+        Adds counts to several n-grams in the database. N-grams that are not
+        in the database yet are inserted with the given count. All n-grams of
+        the same cardinality are written with a single statement execution.
+
+        Parameters
+        ----------
+        ngram_counts : iterable of (iterable of str, int)
+            The n-grams and the counts to add.
+
+        """
+        params = collections.defaultdict(list)
+        for ngram, count in ngram_counts:
+            params[len(ngram)].append(list(ngram) + [count])
+
+        if self.integer_ids:
+            self.add_words(
+                set(word for rows in params.values() for row in rows for word in row[:-1])
+            )
+
+        for cardinality, rows in params.items():
+            statement = self._statement("upsert_ngram", cardinality)
+            self.execute_many_statement(statement, rows)
+            self._add_to_metadata(
+                cardinality, [(row[:-1], row[-1]) for row in rows]
+            )
+
+    def insert_ngram_ids(self, ngram_counts, append=False):
+        """
+        Inserts several n-grams given as ids of the table `_vocab` into the
+        database, the words are not looked up. Existing metadata is updated
+        along with the n-grams.
+
+        Parameters
+        ----------
+        ngram_counts : iterable of (tuple of int, int)
+            The word ids of the n-grams and their counts.
+        append : bool
+            Add the counts to the existing n-grams, see `upsert_ngrams()`.
+
+        """
+        operation = "upsert_ngram" if append else "insert_ngram"
+        params = collections.defaultdict(list)
+        for ids, count in ngram_counts:
+            params[len(ids)].append(list(ids) + [count])
+
+        for cardinality, rows in params.items():
+            statement = self._statement(operation, cardinality, True)
+            self.execute_many_statement(statement, rows)
+            self._add_to_metadata(
+                cardinality, [(row[:-1], row[-1]) for row in rows], True
+            )
 
     def update_ngram(self, ngram, count):
         """
@@ -245,10 +829,12 @@ class DatabaseConnector(object):
             The count for the given n-gram.
 
         """
-        query = "UPDATE _{0}_gram SET count = {1}".format(len(ngram), count)
-        query += self._build_where_clause(ngram)
-        query += ";"
-        self.execute_sql(query)
+        if self.has_metadata(len(ngram)):
+            old_count = self.ngram_count(ngram)
+            self._add_to_metadata(len(ngram), [(ngram, count - old_count)])
+
+        statement = self._statement("update_ngram", len(ngram))
+        self.execute_statement(statement, [count] + list(ngram))
 
     def remove_ngram(self, ngram):
         """
@@ -261,418 +847,4046 @@ class DatabaseConnector(object):
             A list, set or tuple of strings.
 
         """
-        query = "DELETE FROM _{0}_gram".format(len(ngram))
-        query += self._build_where_clause(ngram)
-        query += ";"
-        self.execute_sql(query)
+        if self.has_metadata(len(ngram)):
+            old_count = self.ngram_count(ngram)
+            self._add_to_metadata(len(ngram), [(ngram, -old_count)])
 
-    def open_database(self):
-        raise NotImplementedError("Method must be implemented")
+        statement = self._statement("remove_ngram", len(ngram))
+        self.execute_statement(statement, list(ngram))
 
-    def close_database(self):
-        raise NotImplementedError("Method must be implemented")
+    def count_ngrams(self, cardinality):
+        """
+        Returns the number of n-grams in the table with the given cardinality.
 
-    def execute_sql(self):
-        raise NotImplementedError("Method must be implemented")
+        """
+        result = self.execute_statement(
+            self._statement("count_ngrams", cardinality), []
+        )
+        return self._extract_first_integer(result)
 
-    def _build_values_clause(self, ngram, count):
-        ngram_escaped = []
-        for n in ngram:
-            ngram_escaped.append(re_escape_singlequote.sub("''", n))
-
-        values_clause = "VALUES('"
-        values_clause += "', '".join(ngram_escaped)
-        values_clause += "', {0})".format(count)
-        return values_clause
-
-    def _build_where_clause(self, ngram):
-        where_clause = " WHERE"
-        for i in range(len(ngram)):
-            n = re_escape_singlequote.sub("''", ngram[i])
-            if i < (len(ngram) - 1):
-                where_clause += " word_{0} = '{1}' AND".format(len(ngram) - i - 1, n)
-            else:
-                where_clause += " word = '{0}'".format(n)
-        return where_clause
+    def delete_rare_ngrams(self, cardinality, min_count):
+        """
+        Deletes the n-grams of the table with the given cardinality whose
+        count is lower than `min_count`. Unlike `remove_ngram()` this does
+        not change the metadata, see `prune_ngrams()`.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+        min_count : int
+            The lowest count of the n-grams that are kept.
+
+        """
+        self.execute_statement(
+            self._statement("delete_rare_ngrams", cardinality), [min_count]
+        )
+
+    def keep_top_ngrams(self, cardinality, k):
+        """
+        Deletes all but the `k` most frequent n-grams of every context from
+        the table with the given cardinality. N-grams with the same count
+        are ranked by their last word. The metadata is not changed.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+        k : int
+            The number of n-grams that are kept for every context.
+
+        """
+        self.execute_statement(self._statement("keep_top_ngrams", cardinality), [k])
+
+    def relative_entropies(self, cardinality):
+        """
+        Computes the pruning criterion of Stolcke (1998) for every n-gram of
+        the table with the given cardinality, which must be greater than 1.
+        This is the weighted difference between the log probabilities of
+        the word with the full context and with the context shortened by
+        its first word:
+
+            p(h, w) * (log p(w | h) - log p(w | h'))
+
+        The model interpolates the orders instead of backing off, so the
+        backoff weight of the original criterion is left out. The
+        probabilities are relative frequencies from the metadata of both
+        tables, which must exist.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        Returns
+        -------
+        entropies : generator
+            Tuples of the values of the n-gram columns, the word ids with
+            `integer_ids`, and the criterion of the n-gram.
+
+        """
+        total = self.ngram_total(cardinality)
+        lower_total = self.ngram_total(1)
+        statement = self._statement("relative_entropies", cardinality)
+        for row in self.iterate_statement(statement, []):
+            key = tuple(row[:cardinality])
+            count, context_count, lower_count = row[cardinality : cardinality + 3]
+            if cardinality > 2:
+                lower_context_count = row[cardinality + 3]
+            else:
+                lower_context_count = lower_total
+            if not lower_count or not lower_context_count:
+                # the lower order has no estimate for the word
+                yield key, float("inf")
+                continue
+            probability = count / context_count
+            lower_probability = lower_count / lower_context_count
+            yield key, count / total * (
+                math.log(probability) - math.log(lower_probability)
+            )
+
+    def delete_ngram_keys(self, cardinality, keys):
+        """
+        Deletes n-grams given as the values of the n-gram columns, the word
+        ids with `integer_ids`. The metadata is not changed. The keys are
+        written to a temporary table first, so they may be streamed from a
+        query on the n-gram table itself.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+        keys : iterable of tuple
+            The values of the n-gram columns.
+
+        """
+        columns = ", ".join(self._column_names(cardinality))
+        self.execute_sql("DROP TABLE IF EXISTS _deleted_keys;")
+        query = "CREATE TEMPORARY TABLE _deleted_keys AS SELECT {0} FROM _{1}_gram".format(
+            columns, cardinality
+        )
+        # an empty table with the key columns of the n-gram table
+        self.execute_sql(query + " WHERE 0 = 1;")
+        self.execute_many_statement(
+            self._statement("insert_deleted_key", cardinality),
+            (list(key) for key in keys),
+        )
+        self.execute_sql(
+            "DELETE FROM _{0}_gram WHERE ({1}) IN (SELECT {1} FROM _deleted_keys);".format(
+                cardinality, columns
+            )
+        )
+        self.execute_sql("DROP TABLE _deleted_keys;")
+
+    def create_dictionary_table(self, dictionary):
+        """
+        Creates a temporary table `_dictionary` that holds the given words and
+        an index on the table. The table is deleted when the database is
+        closed.
+
+        Parameters
+        ----------
+        dictionary : iterable of str
+            The words of the dictionary.
+
+        """
+        self.execute_sql("DROP TABLE IF EXISTS _dictionary;")
+        self.execute_sql("CREATE TEMPORARY TABLE _dictionary (word TEXT);")
+        self._load_dictionary_table(dictionary)
+        self.execute_sql("CREATE INDEX idx_dictionary ON _dictionary(word);")
+
+    def delete_ngrams_not_in_dictionary(self, cardinality):
+        """
+        Deletes all n-grams of the given cardinality that contain a word that
+        is not in the table of `create_dictionary_table()`. This runs as a
+        single statement in the database.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        conditions = []
+        for column in self._column_names(cardinality):
+            conditions.append(
+                "NOT EXISTS (SELECT 1 FROM _dictionary d WHERE d.word = {0})".format(
+                    self._word_column("_{0}_gram.{1}".format(cardinality, column))
+                )
+            )
+        query = "DELETE FROM _{0}_gram WHERE {1};".format(
+            cardinality, " OR ".join(conditions)
+        )
+        self.execute_sql(query)
+
+    def open_database(self):
+        raise NotImplementedError("Method must be implemented")
+
+    def close_database(self):
+        raise NotImplementedError("Method must be implemented")
+
+    def execute_sql(self, query, params=None):
+        raise NotImplementedError("Method must be implemented")
+
+    def executemany_sql(self, query, params_seq):
+        raise NotImplementedError("Method must be implemented")
+
+    def iterate_sql(self, query, params=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        Executes a query and iterates over the rows of the result. Connectors
+        that support it fetch the rows in batches, so that a full pass over a
+        large table runs in constant memory.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query.
+        params : list
+            The values for the parameters of the query.
+        batch_size : int
+            The number of rows that are fetched at once.
+
+        Returns
+        -------
+        rows : generator
+            The rows of the result.
+
+        """
+        for row in self.execute_sql(query, params):
+            yield row
+
+    def execute_statement(self, statement, params):
+        """
+        Executes a statement template with the given parameters. The
+        statement templates are returned by `_statement()`.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement.
+        params : list
+            The values for the parameters of the statement.
+
+        Returns
+        -------
+        result : list
+            The rows returned by the statement.
+
+        """
+        return self.execute_sql(statement, params)
+
+    def execute_many_statement(self, statement, params_seq):
+        """
+        Executes a statement template once for every parameter list in a
+        sequence.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement.
+        params_seq : iterable of list
+            The values for the parameters of each execution.
+
+        """
+        self.executemany_sql(statement, params_seq)
+
+    def iterate_statement(self, statement, params, batch_size=STREAM_BATCH_SIZE):
+        """
+        Executes a statement template and iterates over the rows of the
+        result, see `iterate_sql()`.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement.
+        params : list
+            The values for the parameters of the statement.
+        batch_size : int
+            The number of rows that are fetched at once.
+
+        Returns
+        -------
+        rows : generator
+            The rows of the result.
+
+        """
+        return self.iterate_sql(statement, params, batch_size)
+
+    async def aexecute_statement(self, statement, params):
+        """
+        Async version of `execute_statement()`. Runs `execute_statement()` in
+        the executor of the connector, so that the event loop is not blocked.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement.
+        params : list
+            The values for the parameters of the statement.
+
+        Returns
+        -------
+        result : list
+            The rows returned by the statement.
+
+        """
+        loop = asyncio.get_running_loop()
+        if self.stats is not None:
+            # the queries are counted in the scope of the calling task
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(
+                self._executor(), context.run, self.execute_statement, statement, params
+            )
+        return await loop.run_in_executor(
+            self._executor(), self.execute_statement, statement, params
+        )
+
+    def explain(self, query, params=None):
+        """
+        Returns the query plan of a query.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query.
+        params : list
+            The values for the parameters of the query.
+
+        Returns
+        -------
+        plan : list of str
+            The lines of the query plan.
+
+        """
+        raise NotImplementedError("Method must be implemented")
+
+    def _measure(self, query, params, execute, *args):
+        start = time.perf_counter()
+        result = execute(*args)
+        self.stats.record(self, query, params, time.perf_counter() - start, result)
+        return result
+
+    def _measure_many(self, query, execute, params_seq):
+        # batches are recorded with their first parameters, so that the plan
+        # of a slow batch can be explained
+        params_seq = iter(params_seq)
+        first = next(params_seq, None)
+        if first is None:
+            return self._measure(query, None, execute, query, [])
+        return self._measure(
+            query, list(first), execute, query, itertools.chain([first], params_seq)
+        )
+
+    def _executor(self):
+        # the default executor of the event loop
+        return None
+
+    def _add_to_metadata(self, cardinality, ngram_counts, ids=False):
+        # with `ids` the n-grams are given as ids of the table `_vocab`
+        if not self.has_metadata(cardinality):
+            return
+
+        total = 0
+        context_counts = collections.defaultdict(int)
+        for ngram, count in ngram_counts:
+            total += count
+            if cardinality > 1:
+                context_counts[tuple(ngram[:-1])] += count
+
+        statement = self._statement("add_to_total", cardinality)
+        self.execute_statement(statement, [total, cardinality])
+        if len(context_counts) > 0:
+            statement = self._statement("add_to_context_count", cardinality, ids)
+            self.execute_many_statement(
+                statement,
+                [list(context) + [count] for context, count in context_counts.items()],
+            )
+
+    def _table_exists(self, table):
+        result = self.execute_statement(self._statement("table_exists", 0), [table])
+        return len(result) > 0
+
+    def _load_dictionary_table(self, dictionary):
+        self.executemany_sql(
+            "INSERT INTO _dictionary (word) VALUES ({0});".format(self._parameter(0)),
+            ([word] for word in dictionary),
+        )
+
+    def _statement(self, operation, cardinality, variant=None):
+        """
+        Returns the parameterized SQL statement for an operation on the
+        n-gram table of the given cardinality. The statement is built once by
+        the method `_build_<operation>_statement` and then reused, so that
+        the database can cache the parsed statement and the query plan.
+
+        Parameters
+        ----------
+        operation : str
+            The name of the operation, for example `ngram_count`.
+        cardinality : int
+            The cardinality of the n-gram table.
+        variant : hashable
+            Additional argument for the statement builder.
+
+        Returns
+        -------
+        statement : str
+            The SQL statement with parameter placeholders.
+
+        """
+        key = (
+            operation,
+            cardinality,
+            variant,
+            self.lowercase,
+            self.normalize,
+            self.integer_ids,
+        )
+        statement = self._statements.get(key)
+        if statement is None:
+            build = getattr(self, "_build_{0}_statement".format(operation))
+            if variant is None:
+                statement = build(cardinality)
+            else:
+                statement = build(cardinality, variant)
+            self._statements[key] = statement
+        return statement
+
+    def _parameter(self, index):
+        return "?"
+
+    def _column_names(self, cardinality):
+        return ["word_{0}".format(i) for i in reversed(range(1, cardinality))] + [
+            "word"
+        ]
+
+    def _build_table_exists_statement(self, cardinality):
+        raise NotImplementedError("Method must be implemented")
+
+    def _build_add_word_statement(self, cardinality):
+        return "INSERT INTO _vocab (word) VALUES ({0}) ON CONFLICT (word) DO NOTHING".format(
+            self._parameter(0)
+        )
+
+    def _build_vocabulary_statement(self, cardinality):
+        return "SELECT word, id FROM _vocab"
+
+    def _build_ngrams_statement(self, cardinality, with_counts):
+        columns = [
+            self._word_column("_{0}_gram.{1}".format(cardinality, c))
+            for c in self._column_names(cardinality)
+        ]
+        if with_counts:
+            columns.append("count")
+        return "SELECT {0} FROM _{1}_gram".format(", ".join(columns), cardinality)
+
+    def _build_ngram_counts_sum_statement(self, cardinality):
+        return "SELECT SUM(count) FROM _{0}_gram".format(cardinality)
+
+    def _build_ngram_total_statement(self, cardinality):
+        return "SELECT total FROM _totals WHERE cardinality = {0}".format(
+            self._parameter(0)
+        )
+
+    def _build_context_count_statement(self, cardinality):
+        return "SELECT count FROM _{0}_gram_context{1}".format(
+            cardinality, self._build_where_clause(cardinality, context=True)
+        )
+
+    def _build_context_counts_sum_statement(self, cardinality):
+        return "SELECT SUM(count) FROM _{0}_gram{1}".format(
+            cardinality, self._build_where_clause(cardinality, context=True)
+        )
+
+    def _build_add_to_total_statement(self, cardinality):
+        return "UPDATE _totals SET total = total + {0} WHERE cardinality = {1}".format(
+            self._parameter(0), self._parameter(1)
+        )
+
+    def _build_add_to_context_count_statement(self, cardinality, ids=False):
+        columns = ", ".join(self._column_names(cardinality)[:-1])
+        if ids:
+            values = [self._parameter(i) for i in range(cardinality)]
+        else:
+            values = [self._word_value(i) for i in range(cardinality - 1)]
+            values.append(self._parameter(cardinality - 1))
+        insert = "INSERT INTO _{0}_gram_context ({1}, count) VALUES ({2})".format(
+            cardinality, columns, ", ".join(values)
+        )
+        return "{0} ON CONFLICT ({1}) DO UPDATE SET count = {2}".format(
+            insert, columns, "_{0}_gram_context.count + excluded.count".format(cardinality)
+        )
+
+    def _build_ngram_count_statement(self, cardinality):
+        return "SELECT count FROM _{0}_gram{1}".format(
+            cardinality, self._build_where_clause(cardinality)
+        )
+
+    def _build_ngram_counts_statement(self, cardinality, size):
+        columns = self._column_names(cardinality)
+        rows = []
+        for i in range(size):
+            rows.append(
+                "({0})".format(
+                    ", ".join(
+                        self._parameter(i * cardinality + j)
+                        for j in range(cardinality)
+                    )
+                )
+            )
+        if self.integer_ids:
+            joins = "".join(
+                " JOIN _vocab v{0} ON v{0}.word = q.{1}".format(i, c)
+                for i, c in enumerate(columns)
+            )
+            conditions = " AND ".join(
+                "g.{1} = v{0}.id".format(i, c) for i, c in enumerate(columns)
+            )
+        else:
+            joins = ""
+            conditions = " AND ".join("g.{0} = q.{0}".format(c) for c in columns)
+        statement = "WITH q({0}) AS (VALUES {1})".format(
+            ", ".join(columns), ", ".join(rows)
+        )
+        return "{0} SELECT {1}, g.count FROM q{2} JOIN _{3}_gram g ON {4}".format(
+            statement,
+            ", ".join("q.{0}".format(c) for c in columns),
+            joins,
+            cardinality,
+            conditions,
+        )
+
+    def _build_ngram_like_statement(self, cardinality, variant):
+        prefixes, with_limit = variant
+        if self.integer_ids:
+            columns = ", ".join(self._column_names(cardinality) + ["count"])
+        else:
+            columns = self._build_select_like_clause(cardinality)
+        statement = "SELECT {0} FROM _{1}_gram{2} ORDER BY count DESC".format(
+            columns, cardinality, self._build_where_like_clause(cardinality, prefixes)
+        )
+        if with_limit:
+            index = cardinality - 1 + prefixes * self._prefix_parameter_count
+            statement += " LIMIT {0}".format(self._parameter(index))
+        if self.integer_ids:
+            # only the words of the selected rows are looked up
+            statement = "SELECT {0} FROM ({1}) AS _{2}_gram ORDER BY count DESC".format(
+                self._build_select_like_clause(cardinality), statement, cardinality
+            )
+        return statement
+
+    def _build_backoff_candidates_statement(self, cardinality, variant):
+        # one lookup per cardinality, the words are deduplicated in the
+        # database and the first occurrence of every word is kept
+        cardinalities, prefixes = variant
+        selects = []
+        offset = 0
+        for backoff, ngram_cardinality in enumerate(cardinalities):
+            limit = (
+                offset
+                + ngram_cardinality
+                - 1
+                + prefixes * self._prefix_parameter_count
+            )
+            select = "SELECT word, {0} AS backoff, count FROM _{1}_gram{2}".format(
+                backoff,
+                ngram_cardinality,
+                self._build_where_like_clause(ngram_cardinality, prefixes, offset),
+            )
+            selects.append(
+                "SELECT * FROM ({0} ORDER BY count DESC LIMIT {1}) AS _{2}_gram".format(
+                    select, self._parameter(limit), ngram_cardinality
+                )
+            )
+            offset = limit + 1
+        occurrence = "ROW_NUMBER() OVER (PARTITION BY word ORDER BY backoff, count DESC)"
+        ranked = "SELECT word, backoff, count, {0} AS occurrence FROM ({1}) AS candidates".format(
+            occurrence, " UNION ALL ".join(selects)
+        )
+        statement = "SELECT {0} FROM ({1}) AS ranked WHERE occurrence = 1".format(
+            self._word_column("ranked.word"), ranked
+        )
+        return "{0} ORDER BY backoff, count DESC LIMIT {1}".format(
+            statement, self._parameter(offset)
+        )
+
+    def _build_insert_ngram_statement(self, cardinality, ids=False):
+        if ids:
+            values = [self._parameter(i) for i in range(cardinality + 1)]
+        else:
+            values = [self._word_value(i) for i in range(cardinality)]
+            values.append(self._parameter(cardinality))
+        return "INSERT INTO _{0}_gram ({1}, count) VALUES ({2})".format(
+            cardinality, ", ".join(self._column_names(cardinality)), ", ".join(values)
+        )
+
+    def _build_upsert_ngram_statement(self, cardinality, ids=False):
+        return "{0} ON CONFLICT ({1}) DO UPDATE SET count = {2}".format(
+            self._build_insert_ngram_statement(cardinality, ids),
+            ", ".join(self._column_names(cardinality)),
+            "_{0}_gram.count + excluded.count".format(cardinality),
+        )
+
+    def _build_update_ngram_statement(self, cardinality):
+        return "UPDATE _{0}_gram SET count = {1}{2}".format(
+            cardinality,
+            self._parameter(0),
+            self._build_where_clause(cardinality, 1),
+        )
+
+    def _build_remove_ngram_statement(self, cardinality, ids=False):
+        return "DELETE FROM _{0}_gram{1}".format(
+            cardinality, self._build_where_clause(cardinality, ids=ids)
+        )
+
+    def _build_insert_deleted_key_statement(self, cardinality):
+        return "INSERT INTO _deleted_keys ({0}) VALUES ({1})".format(
+            ", ".join(self._column_names(cardinality)),
+            ", ".join(self._parameter(i) for i in range(cardinality)),
+        )
+
+    def _build_count_ngrams_statement(self, cardinality):
+        return "SELECT COUNT(*) FROM _{0}_gram".format(cardinality)
+
+    def _build_delete_rare_ngrams_statement(self, cardinality):
+        return "DELETE FROM _{0}_gram WHERE count < {1}".format(
+            cardinality, self._parameter(0)
+        )
+
+    def _build_keep_top_ngrams_statement(self, cardinality):
+        columns = self._column_names(cardinality)
+        partition = ""
+        if cardinality > 1:
+            partition = "PARTITION BY {0} ".format(", ".join(columns[:-1]))
+        ranked = "SELECT {0}, ROW_NUMBER() OVER ({1}ORDER BY count DESC, word) AS rank".format(
+            ", ".join(columns), partition
+        )
+        return "DELETE FROM _{0}_gram WHERE ({1}) IN ({2})".format(
+            cardinality,
+            ", ".join(columns),
+            "SELECT {0} FROM ({1} FROM _{2}_gram) ranked WHERE rank > {3}".format(
+                ", ".join(columns), ranked, cardinality, self._parameter(0)
+            ),
+        )
+
+    def _build_relative_entropies_statement(self, cardinality):
+        # the counts of every n-gram, its context and the n-gram of the next
+        # lower cardinality without the first word; the columns of the lower
+        # table have the same names as the last columns of the table
+        columns = self._column_names(cardinality)
+        lower_columns = columns[1:]
+        statement = "SELECT {0}, g.count, c.count, l.count".format(
+            ", ".join("g.{0}".format(column) for column in columns)
+        )
+        if cardinality > 2:
+            statement += ", lc.count"
+        statement += " FROM _{0}_gram g JOIN _{0}_gram_context c ON {1}".format(
+            cardinality,
+            " AND ".join("c.{0} = g.{0}".format(column) for column in columns[:-1]),
+        )
+        statement += " LEFT JOIN _{0}_gram l ON {1}".format(
+            cardinality - 1,
+            " AND ".join("l.{0} = g.{0}".format(column) for column in lower_columns),
+        )
+        if cardinality > 2:
+            statement += " LEFT JOIN _{0}_gram_context lc ON {1}".format(
+                cardinality - 1,
+                " AND ".join(
+                    "lc.{0} = g.{0}".format(column) for column in lower_columns[:-1]
+                ),
+            )
+        return statement
+
+    def _build_where_clause(self, cardinality, offset=0, context=False, ids=False):
+        columns = self._column_names(cardinality)
+        if context:
+            columns = columns[:-1]
+        conditions = []
+        for i, column in enumerate(columns):
+            if ids:
+                value = self._parameter(offset + i)
+            else:
+                value = self._word_value(offset + i)
+            conditions.append("{0} = {1}".format(column, value))
+        return " WHERE " + " AND ".join(conditions)
 
     def _build_select_like_clause(self, cardinality):
         result = ""
         for i in reversed(range(cardinality)):
             if i != 0:
-                result += "word_{0}, ".format(i)
+                result += "{0}, ".format(
+                    self._word_column("_{0}_gram.word_{1}".format(cardinality, i))
+                )
             else:
-                result += "word, count"
+                result += "{0}, count".format(
+                    self._word_column("_{0}_gram.word".format(cardinality))
+                )
         return result
 
-    def _build_where_like_clause(self, ngram):
-        where_clause = " WHERE"
-        for i in range(len(ngram)):
-            if i < (len(ngram) - 1):
-                where_clause += " word_{0} = '{1}' AND".format(
-                    len(ngram) - i - 1, ngram[i]
-                )
-            else:
-                where_clause += " word LIKE '{0}%'".format(ngram[-1])
-        return where_clause
+    def _build_where_like_clause(self, cardinality, prefixes, offset=0):
+        # the parameters of the clause start at `offset`
+        conditions = []
+        for i, column in enumerate(self._column_names(cardinality)[:-1]):
+            if self.integer_ids:
+                conditions.append(
+                    self._build_id_condition(
+                        column, self._build_context_condition("word", offset + i)
+                    )
+                )
+            else:
+                conditions.append(self._build_context_condition(column, offset + i))
+
+        index = offset + cardinality - 1
+        condition = None
+        if prefixes == 1:
+            condition = self._build_prefix_condition(index)
+        elif prefixes > 1:
+            ranges = []
+            for i in range(prefixes):
+                ranges.append(
+                    "({0})".format(
+                        self._build_prefix_condition(
+                            index + i * self._prefix_parameter_count
+                        )
+                    )
+                )
+            condition = "({0})".format(" OR ".join(ranges))
+        if condition is not None and self.integer_ids and cardinality > 1:
+            # the ids of a prefix are scattered over the vocabulary, it is
+            # faster to check the followers of the context against them than
+            # to look up every id in the index
+            conditions.append(self._build_id_condition("+word", condition))
+        elif condition is not None and self.integer_ids:
+            conditions.append(self._build_id_condition("word", condition))
+        elif condition is not None:
+            conditions.append(condition)
+
+        if len(conditions) == 0:
+            return ""
+        return " WHERE " + " AND ".join(conditions)
+
+    def _build_context_condition(self, column, index):
+        return "{0} = {1}".format(column, self._parameter(index))
+
+    def _build_id_condition(self, column, condition):
+        # the ids of the words in `_vocab` that satisfy the condition
+        return "{0} IN (SELECT id FROM _vocab WHERE {1})".format(column, condition)
+
+    def _word_type(self):
+        if self.integer_ids:
+            return "INTEGER"
+        return "TEXT"
+
+    def _word_value(self, index):
+        # the value in a word column for the word of a parameter
+        if self.integer_ids:
+            return "(SELECT id FROM _vocab WHERE word = {0})".format(
+                self._parameter(index)
+            )
+        return self._parameter(index)
+
+    def _word_column(self, column):
+        # the word of a word column, the column must be qualified with its
+        # table
+        if self.integer_ids:
+            return "(SELECT word FROM _vocab WHERE id = {0})".format(column)
+        return column
+
+    # Number of parameters of the condition from `_build_prefix_condition()`
+    _prefix_parameter_count = 2
+
+    def _build_prefix_condition(self, index):
+        # a half-open range instead of LIKE, so that the index on lower(word)
+        # is used; lower() and the range compare ASCII case-insensitively
+        # like sqlite's LIKE does
+        return "lower(word) >= {0} AND lower(word) < {1}".format(
+            self._parameter(index), self._parameter(index + 1)
+        )
+
+    def _prefix_params(self, prefix):
+        prefix = prefix.translate(_ascii_lowercase)
+        return [prefix, _prefix_successor(prefix)]
+
+    def _ngram_total_query(self, cardinality, has_metadata):
+        if has_metadata:
+            return self._statement("ngram_total", cardinality), [cardinality]
+        return self._statement("ngram_counts_sum", cardinality), []
+
+    def _ngram_counts_queries(self, ngrams):
+        counts = {}
+        ngrams_by_cardinality = collections.defaultdict(list)
+        for ngram in ngrams:
+            ngram = tuple(ngram)
+            if ngram not in counts:
+                counts[ngram] = 0
+                ngrams_by_cardinality[len(ngram)].append(ngram)
+
+        queries = []
+        for cardinality, group in ngrams_by_cardinality.items():
+            for start in range(0, len(group), NGRAM_COUNTS_BATCH_SIZE):
+                batch = group[start : start + NGRAM_COUNTS_BATCH_SIZE]
+                # pad the batch to a power of two to keep the number of
+                # distinct statements small
+                size = 1
+                while size < len(batch):
+                    size *= 2
+                batch += [batch[-1]] * (size - len(batch))
+                statement = self._statement("ngram_counts", cardinality, size)
+                params = [word for ngram in batch for word in ngram]
+                queries.append((statement, params))
+        return counts, queries
+
+    def _merge_counts(self, counts, result):
+        for row in result:
+            count = int(row[-1])
+            if count > 0:
+                counts[tuple(row[:-1])] = count
+
+    def _ngram_like_query(self, ngram, limit):
+        params = list(ngram[:-1])
+        prefixes = 0
+        if ngram[-1] != "":
+            params += self._prefix_params(ngram[-1])
+            prefixes = 1
+        with_limit = limit >= 0
+        if with_limit:
+            params.append(limit)
+
+        statement = self._statement("ngram_like", len(ngram), (prefixes, with_limit))
+        return statement, params
+
+    def _ngram_like_filtered_query(self, ngram, filter, limit):
+        ranges = []
+        for continuation in filter:
+            prefix_params = self._prefix_params(ngram[-1] + continuation)
+            if prefix_params not in ranges:
+                ranges.append(prefix_params)
+        if len(ranges) == 0:
+            return None
+
+        params = list(ngram[:-1])
+        for prefix_params in ranges:
+            params += prefix_params
+        with_limit = limit >= 0
+        if with_limit:
+            params.append(limit)
+
+        statement = self._statement(
+            "ngram_like", len(ngram), (len(ranges), with_limit)
+        )
+        return statement, params
+
+    def _backoff_candidates_query(self, ngrams, limit, filter):
+        ranges = []
+        if filter is None:
+            if ngrams[0][-1] != "":
+                ranges.append(self._prefix_params(ngrams[0][-1]))
+        else:
+            for continuation in filter:
+                prefix_params = self._prefix_params(ngrams[0][-1] + continuation)
+                if prefix_params not in ranges:
+                    ranges.append(prefix_params)
+            if len(ranges) == 0:
+                return None
+
+        params = []
+        for ngram in ngrams:
+            params += ngram[:-1]
+            for prefix_params in ranges:
+                params += prefix_params
+            params.append(limit)
+        params.append(limit)
+
+        cardinalities = tuple(len(ngram) for ngram in ngrams)
+        statement = self._statement(
+            "backoff_candidates", cardinalities[0], (cardinalities, len(ranges))
+        )
+        return statement, params
+
+    def _backoff_candidates_by_order(self, ngrams, limit, filter):
+        # for connectors without SQL: one lookup per cardinality, until there
+        # are enough candidates
+        candidates = []
+        seen = set()
+        for ngram in ngrams:
+            if len(candidates) >= limit:
+                break
+            if filter is None:
+                partial = self.ngram_like_table(ngram, limit)
+            else:
+                partial = self.ngram_like_table_filtered(ngram, filter, limit)
+            merge_candidates(candidates, seen, [row[-2] for row in partial], limit)
+        return candidates
+
+    async def _abackoff_candidates_by_order(self, ngrams, limit, filter):
+        candidates = []
+        seen = set()
+        for ngram in ngrams:
+            if len(candidates) >= limit:
+                break
+            if filter is None:
+                partial = await self.angram_like_table(ngram, limit)
+            else:
+                partial = await self.angram_like_table_filtered(ngram, filter, limit)
+            merge_candidates(candidates, seen, [row[-2] for row in partial], limit)
+        return candidates
+
+    def _extract_first_integer(self, table):
+        count = 0
+        if len(table) > 0:
+            if len(table[0]) > 0:
+                count = int(table[0][0])
+
+        if not count > 0:
+            count = 0
+        return count
+
+
+class _ThreadOwner(object):
+    """
+    Marks the lifetime of the thread-local values of a thread, see
+    `SqliteDatabaseConnector._connection()`.
+
+    """
+
+
+class SqliteDatabaseConnector(DatabaseConnector):
+    """
+    Database connector for sqlite databases.
+
+    """
+
+    def __init__(
+        self,
+        dbname,
+        cardinality=1,
+        read_only=False,
+        thread_local=False,
+        integer_ids=False,
+    ):
+        """
+        Constructor for the sqlite database connector.
+
+        Parameters
+        ----------
+        dbname : str
+            path to the database file
+        cardinality : int
+            default cardinality for n-grams
+        read_only : bool
+            open the database for serving an immutable model, see
+            `open_database()`
+        thread_local : bool
+            open a separate connection for every thread that uses the
+            connector, see `open_database()`
+        integer_ids : bool
+            store the ids of the words of the table `_vocab` in new n-gram
+            tables, see `DatabaseConnector.create_vocabulary_table()`.
+            Databases that have the table are always opened in this mode.
+
+        """
+        DatabaseConnector.__init__(self, dbname, cardinality)
+        self.integer_ids = integer_ids
+        self.con = None
+        self.read_only = read_only
+        self.thread_local = thread_local
+        self._local = threading.local()
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        self._async_executor = None
+        if read_only and not thread_local:
+            self._lock = threading.Lock()
+        else:
+            self._lock = _unlocked
+        self.open_database()
+
+    def create_ngram_table(self, cardinality, unique=True, without_rowid=False):
+        """
+        Creates a table for n-gram of a give cardinality, see
+        `DatabaseConnector.create_ngram_table()`.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality to create a table for.
+        unique : bool
+            Whether to create the table with a unique constraint on the
+            n-gram columns.
+        without_rowid : bool
+            Create a `WITHOUT ROWID` table with a primary key on the n-gram
+            columns. The rows are stored in the b-tree of the key, so the
+            n-gram columns are not stored a second time in a unique index and
+            lookups of n-grams do not need a second b-tree search. Implies
+            `unique`.
+
+        """
+        if not without_rowid:
+            DatabaseConnector.create_ngram_table(self, cardinality, unique)
+            return
+
+        if self.integer_ids:
+            self.create_vocabulary_table()
+
+        columns = self._column_names(cardinality)
+        query = "CREATE TABLE IF NOT EXISTS _{0}_gram ({1}, {2}) WITHOUT ROWID;".format(
+            cardinality,
+            ", ".join("{0} {1}".format(c, self._word_type()) for c in columns),
+            "count INTEGER, PRIMARY KEY ({0})".format(", ".join(columns)),
+        )
+        self.execute_sql(query)
+
+    def index_names(self, cardinality):
+        """
+        Returns the names of the indexes that were created for the n-gram
+        table with the given cardinality, without the automatic index of the
+        unique constraint.
+
+        """
+        query = "SELECT name FROM sqlite_master WHERE type = 'index' AND {0};".format(
+            "tbl_name = '_{0}_gram' AND sql IS NOT NULL".format(cardinality)
+        )
+        result = self.execute_sql(query)
+        return [row[0] for row in result]
+
+    def is_without_rowid(self, cardinality):
+        """
+        Checks whether the n-gram table with the given cardinality is a
+        `WITHOUT ROWID` table.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        Returns
+        -------
+        without_rowid : bool
+            True if the table exists and has no rowid.
+
+        """
+        result = self.execute_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = '_{0}_gram';".format(
+                cardinality
+            )
+        )
+        return len(result) > 0 and "WITHOUT ROWID" in result[0][0].upper()
+
+    def create_index(self, cardinality):
+        """
+        Create an index for the table with the given cardinality. Besides the
+        indexes on the context columns this creates an index on the context
+        columns and the lower case word for prefix lookups. If
+        `covering_index` is set, the word and the count are part of that
+        index, so prefix lookups never read the table. With `integer_ids`
+        the index is on the context columns and the word id.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality to create a index for.
+
+        """
+        DatabaseConnector.create_index(self, cardinality)
+        if self.integer_ids:
+            # prefixes are looked up in `_vocab`, the ids of the matching
+            # words follow the context in the index
+            columns = self._column_names(cardinality)
+            if self.covering_index:
+                columns += ["count"]
+        else:
+            columns = self._column_names(cardinality)[:-1] + ["lower(word)"]
+            if self.covering_index:
+                columns += ["word", "count"]
+        query = "CREATE INDEX idx_{0}_gram_prefix ON _{0}_gram({1});".format(
+            cardinality, ", ".join(columns)
+        )
+        self.execute_sql(query)
+
+    def delete_index(self, cardinality):
+        """
+        Delete index for the table with the given cardinality.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the index to delete.
+
+        """
+        DatabaseConnector.delete_index(self, cardinality)
+        query = "DROP INDEX IF EXISTS idx_{0}_gram_prefix;".format(cardinality)
+        self.execute_sql(query)
+
+    def backoff_candidates(self, ngrams, limit, filter=None):
+        """
+        Gets the candidates for the completion of the last word, see
+        `DatabaseConnector.backoff_candidates()`. Local sqlite lookups are
+        cheap, so one lookup per cardinality that stops as soon as there are
+        enough candidates is faster than the combined query. The async
+        version keeps the combined query, which needs only one round trip to
+        the worker threads.
+
+        """
+        return self._backoff_candidates_by_order(ngrams, limit, filter)
+
+    def commit(self):
+        """
+        Sends a commit to the database. With thread-local connections only
+        the connection of the calling thread is committed.
+
+        """
+        con = self._connection()
+        with self._locked(con):
+            con.commit()
+
+    def rollback(self):
+        """
+        Rolls back the open transaction. With thread-local connections only
+        the connection of the calling thread is rolled back.
+
+        """
+        con = self._connection()
+        with self._locked(con):
+            con.rollback()
+
+    def open_database(self):
+        """
+        Opens the sqlite database.
+
+        In read-only mode the file is opened as immutable, so sqlite neither
+        locks it nor checks it for changes, and it is memory mapped as a
+        whole. Processes that serve the same file share its pages in the
+        page cache of the operating system. The connection may be used from
+        several threads, the queries are serialized.
+
+        With thread-local connections every thread that uses the connector
+        gets its own connection to the file on first use, so queries of
+        different threads run in parallel. `con` is the connection of the
+        thread that opened the database. The async methods always run their
+        queries in a dedicated pool of threads with their own connections.
+
+        """
+        self.con = self._open_connection()
+        self._local.con = self.con
+        self.integer_ids = self.integer_ids or self._table_exists("_vocab")
+
+    def close_database(self):
+        """
+        Closes the sqlite database.
+
+        """
+        with self._connections_lock:
+            executor, self._async_executor = self._async_executor, None
+        if executor is not None:
+            executor.shutdown()
+        with self._connections_lock:
+            connections, self._connections = self._connections, set()
+        for con in connections:
+            con.close()
+        self._local = threading.local()
+
+    def _open_connection(self, shared=False):
+        if self.read_only:
+            uri = "{0}?mode=ro&immutable=1".format(
+                pathlib.Path(self.dbname).absolute().as_uri()
+            )
+            con = sqlite3.connect(
+                uri,
+                uri=True,
+                check_same_thread=False,
+                cached_statements=SQLITE_CACHED_STATEMENTS,
+            )
+            pragmas = dict(SQLITE_SERVING_PRAGMAS)
+            pragmas["mmap_size"] = os.path.getsize(self.dbname)
+            for name, value in pragmas.items():
+                con.execute("PRAGMA {0} = {1};".format(name, value))
+        else:
+            con = sqlite3.connect(
+                self.dbname,
+                check_same_thread=not (shared or self.thread_local),
+                cached_statements=SQLITE_CACHED_STATEMENTS,
+            )
+        with self._connections_lock:
+            self._connections.add(con)
+        return con
+
+    def _connection(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            if not self.thread_local:
+                return self.con
+            con = self._open_connection()
+            self._local.con = con
+            # the thread-local values are released when the thread exits,
+            # the connection of the thread is closed along with them
+            self._local.owner = owner = _ThreadOwner()
+            weakref.finalize(
+                owner,
+                self._close_thread_connection,
+                self._connections,
+                self._connections_lock,
+                con,
+            )
+        return con
+
+    @staticmethod
+    def _close_thread_connection(connections, lock, con):
+        with lock:
+            connections.discard(con)
+        con.close()
+
+    def _executor(self):
+        # the async methods run in dedicated threads that have their own
+        # connections, the connection of the event loop thread is not used
+        with self._connections_lock:
+            if self._async_executor is None:
+                self._async_executor = concurrent.futures.ThreadPoolExecutor(
+                    SQLITE_ASYNC_WORKERS,
+                    thread_name_prefix="pressagio-sqlite",
+                    initializer=self._init_async_worker,
+                )
+            return self._async_executor
+
+    def _init_async_worker(self):
+        self._local.con = self._open_connection(shared=True)
+
+    def _locked(self, con):
+        if con is self.con:
+            return self._lock
+        return _unlocked
+
+    def execute_sql(self, query, params=None):
+        """
+        Executes a given query string on an open sqlite database. If `stats`
+        is set, the query is recorded in the query statistics.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `?`.
+        params : list
+            The values for the parameters of the query.
+
+        """
+        if self.stats is not None:
+            return self._measure(query, params, self._execute_sql, query, params)
+        return self._execute_sql(query, params)
+
+    def _execute_sql(self, query, params=None):
+        con = self._connection()
+        with self._locked(con):
+            c = con.cursor()
+            if params is None:
+                c.execute(query)
+            else:
+                c.execute(query, params)
+            result = c.fetchall()
+        return result
+
+    def executemany_sql(self, query, params_seq):
+        """
+        Executes a given query string once for every parameter list in a
+        sequence on an open sqlite database.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `?`.
+        params_seq : iterable of list
+            The values for the parameters of each execution.
+
+        """
+        if self.stats is not None:
+            return self._measure_many(query, self._executemany_sql, params_seq)
+        return self._executemany_sql(query, params_seq)
+
+    def _executemany_sql(self, query, params_seq):
+        con = self._connection()
+        with self._locked(con):
+            c = con.cursor()
+            c.executemany(query, params_seq)
+
+    def explain(self, query, params=None):
+        """
+        Returns the query plan of a query from `EXPLAIN QUERY PLAN`.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `?`.
+        params : list
+            The values for the parameters of the query.
+
+        Returns
+        -------
+        plan : list of str
+            The lines of the query plan.
+
+        """
+        result = self._execute_sql("EXPLAIN QUERY PLAN " + query, params)
+        return [row[-1] for row in result]
+
+    def iterate_sql(self, query, params=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        Executes a given query string on an open sqlite database and
+        iterates over the rows of the result. The rows are fetched in
+        batches with `fetchmany()`, the lock of a shared connection is only
+        held while a batch is fetched.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `?`.
+        params : list
+            The values for the parameters of the query.
+        batch_size : int
+            The number of rows that are fetched at once.
+
+        Returns
+        -------
+        rows : generator
+            The rows of the result.
+
+        """
+        con = self._connection()
+        with self._locked(con):
+            c = con.cursor()
+            if params is None:
+                c.execute(query)
+            else:
+                c.execute(query, params)
+        try:
+            while True:
+                with self._locked(con):
+                    rows = c.fetchmany(batch_size)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            c.close()
+
+    def _build_table_exists_statement(self, cardinality):
+        return "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?"
+
+    def set_pragmas(self, pragmas):
+        """
+        Sets pragmas on the open sqlite database.
+
+        Parameters
+        ----------
+        pragmas : dict
+            Maps pragma names to their new values.
+
+        Returns
+        -------
+        previous : dict
+            The values of the pragmas before they were changed, this can be
+            passed to `set_pragmas()` again to restore them.
+
+        """
+        previous = {}
+        for name, value in pragmas.items():
+            previous[name] = self.execute_sql("PRAGMA {0};".format(name))[0][0]
+            self.execute_sql("PRAGMA {0} = {1};".format(name, value))
+        return previous
+
+
+class PostgresDatabaseConnector(DatabaseConnector):
+    """
+    Database connector for postgres databases.
+
+    """
+
+    def __init__(
+        self,
+        dbname,
+        cardinality=1,
+        host="localhost",
+        port=5432,
+        user="postgres",
+        password=None,
+        connection=None,
+    ):
+        """
+        Constructor for the postgres database connector.
+
+        Parameters
+        ----------
+        dbname : str
+            the database name
+        cardinality : int
+            default cardinality for n-grams
+        host : str
+            hostname of the postgres database
+        port : int
+            port number of the postgres database
+        user : str
+            user name for the postgres database
+        password: str
+            user password for the postgres database
+        connection : connection
+            an open database connection
+
+        """
+        DatabaseConnector.__init__(self, dbname, cardinality)
+        self.con = connection
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.server_side_prediction = False
+
+    def create_database(self):
+        """
+        Creates an empty database if not exists. With
+        `server_side_prediction` the prediction function for the cardinality
+        of the connector is installed, see `create_prediction_function()`.
+        """
+        if not self._database_exists():
+            con = psycopg2.connect(
+                host=self.host,
+                database="postgres",
+                user=self.user,
+                password=self.password,
+                port=self.port,
+            )
+            con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            query = "CREATE DATABASE {0};".format(self.dbname)
+            c = con.cursor()
+            c.execute(query)
+            con.close()
+
+            if self.normalize:
+                self.open_database()
+                query = 'CREATE EXTENSION IF NOT EXISTS "plperlu";'
+                self.execute_sql(query)
+                query = """CREATE OR REPLACE FUNCTION normalize(text)
+      RETURNS text
+    AS $$
+        use Text::Unidecode;
+        return unidecode(shift);
+    $$ LANGUAGE plperlu IMMUTABLE;"""
+                self.execute_sql(query)
+                self.commit()
+                self.close_database()
+
+        if self.server_side_prediction:
+            opened = not self.con
+            self.open_database()
+            self.create_prediction_function(self.cardinality)
+            self.commit()
+            if opened:
+                self.close_database()
+
+    def create_prediction_function(self, cardinality):
+        """
+        Installs the function `pressagio_predict_<cardinality>` that computes
+        a whole prediction of the smoothed n-gram predictor in the database,
+        see `smoothed_ngram_prediction()`. The n-gram tables do not need to
+        exist yet. The function depends on `lowercase`, `normalize` and
+        `integer_ids`, it has to be installed again when they change.
+
+        Parameters
+        ----------
+        cardinality : int
+            The highest cardinality of the n-grams of the prediction.
+
+        """
+        self.execute_sql(self._statement("prediction_function", cardinality))
+
+    def smoothed_ngram_prediction(self, tokens, deltas, limit):
+        """
+        Computes the prediction of the smoothed n-gram predictor with a
+        single call of the function that `create_prediction_function()`
+        installs. The candidates are the completions of the last token for
+        every cardinality like in `backoff_candidates()`, their probabilities
+        are the counts of the candidate n-grams relative to the counts of
+        their contexts, interpolated with the deltas.
+
+        Parameters
+        ----------
+        tokens : list of str
+            The context words followed by the prefix of the last word, one
+            token for every cardinality.
+        deltas : list of float
+            The weight of every cardinality, starting with unigrams.
+        limit : int
+            The maximum number of candidates.
+
+        Returns
+        -------
+        prediction : list of tuple
+            The candidates with a probability above zero and their
+            probabilities, most probable first.
+
+        """
+        return self.execute_statement(
+            *self._smoothed_ngram_prediction_query(tokens, deltas, limit)
+        )
+
+    async def asmoothed_ngram_prediction(self, tokens, deltas, limit):
+        """
+        Async version of `smoothed_ngram_prediction()`.
+
+        """
+        return await self.aexecute_statement(
+            *self._smoothed_ngram_prediction_query(tokens, deltas, limit)
+        )
+
+    def _smoothed_ngram_prediction_query(self, tokens, deltas, limit):
+        statement = self._statement("smoothed_ngram_prediction", len(tokens))
+        return statement, [list(tokens[:-1]), tokens[-1], list(deltas), limit]
+
+    def reset_database(self):
+        """
+        Re-create an empty database.
+
+        """
+        if self._database_exists():
+            con = psycopg2.connect(
+                host=self.host,
+                database="postgres",
+                user=self.user,
+                password=self.password,
+                port=self.port,
+            )
+            con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            query = "DROP DATABASE {0};".format(self.dbname)
+            c = con.cursor()
+            c.execute(query)
+            con.close()
+        self.create_database()
+
+    def create_vocabulary_table(self):
+        """
+        Creates the table `_vocab` if it does not exist, see
+        `DatabaseConnector.create_vocabulary_table()`.
+
+        """
+        self.execute_sql(
+            "CREATE TABLE IF NOT EXISTS _vocab (id SERIAL PRIMARY KEY, word TEXT UNIQUE);"
+        )
+        word, _ = self._prefix_expressions()
+        self.execute_sql(
+            "CREATE INDEX IF NOT EXISTS idx_vocab_varchar ON _vocab({0} text_pattern_ops);".format(
+                word
+            )
+        )
+
+    def create_index(self, cardinality):
+        """
+        Create an index for the table with the given cardinality. With
+        `integer_ids` the pattern indexes are on the table `_vocab`, the
+        n-gram table only gets the indexes on the id columns.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality to create a index for.
+
+        """
+        DatabaseConnector.create_index(self, cardinality)
+        if self.integer_ids:
+            if self.covering_index:
+                query = "CREATE INDEX idx_{0}_gram_prefix ON _{0}_gram({1}) {2};".format(
+                    cardinality,
+                    ", ".join(self._column_names(cardinality)),
+                    "INCLUDE (count)",
+                )
+                self.execute_sql(query)
+            return
+
+        query = "CREATE INDEX idx_{0}_gram_varchar ON _{0}_gram(word varchar_pattern_ops);".format(
+            cardinality
+        )
+        self.execute_sql(query)
+
+        if self.lowercase:
+            for i in reversed(range(cardinality)):
+                if i != 0:
+                    query = "CREATE INDEX idx_{0}_gram_{1}_lower ON _{0}_gram(LOWER(word_{1}));".format(
+                        cardinality, i
+                    )
+                    self.execute_sql(query)
+
+            if self.normalize:
+                query = "CREATE INDEX idx_{0}_gram_lower_normalized_varchar ON _{0}_gram(NORMALIZE(LOWER(word)) varchar_pattern_ops);".format(
+                    cardinality
+                )
+                self.execute_sql(query)
+
+            else:
+                query = "CREATE INDEX idx_{0}_gram_lower_varchar ON _{0}_gram(LOWER(word) varchar_pattern_ops);".format(
+                    cardinality
+                )
+                self.execute_sql(query)
+
+        elif self.normalize:
+            query = "CREATE INDEX idx_{0}_gram_normalized_varchar ON _{0}_gram(NORMALIZE(word) varchar_pattern_ops);".format(
+                cardinality
+            )
+            self.execute_sql(query)
+
+        if self.covering_index:
+            columns = self._column_names(cardinality)[:-1]
+            if self.lowercase:
+                columns = ["LOWER({0})".format(c) for c in columns]
+            word, _ = self._prefix_expressions()
+            columns.append("{0} varchar_pattern_ops".format(word))
+            query = "CREATE INDEX idx_{0}_gram_prefix ON _{0}_gram({1}) {2};".format(
+                cardinality, ", ".join(columns), "INCLUDE (word, count)"
+            )
+            self.execute_sql(query)
+
+    def delete_index(self, cardinality):
+        """
+        Delete index for the table with the given cardinality.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the index to delete.
+
+        """
+        DatabaseConnector.delete_index(self, cardinality)
+
+        query = "DROP INDEX IF EXISTS idx_{0}_gram_varchar;".format(cardinality)
+        self.execute_sql(query)
+        query = "DROP INDEX IF EXISTS idx_{0}_gram_normalized_varchar;".format(
+            cardinality
+        )
+        self.execute_sql(query)
+        query = "DROP INDEX IF EXISTS idx_{0}_gram_lower_varchar;".format(cardinality)
+        self.execute_sql(query)
+        query = "DROP INDEX IF EXISTS idx_{0}_gram_lower_normalized_varchar;".format(
+            cardinality
+        )
+        self.execute_sql(query)
+        for i in reversed(range(cardinality)):
+            if i != 0:
+                query = "DROP INDEX IF EXISTS idx_{0}_gram_{1}_lower;".format(
+                    cardinality, i
+                )
+                self.execute_sql(query)
+        query = "DROP INDEX IF EXISTS idx_{0}_gram_prefix;".format(cardinality)
+        self.execute_sql(query)
+
+    def create_unique_constraint(self, cardinality):
+        """
+        Adds the unique constraint on the n-gram columns to the table with
+        the given cardinality. Use this after a bulk load into a table that
+        was created without the constraint.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the table.
+
+        """
+        query = "ALTER TABLE _{0}_gram ADD UNIQUE ({1});".format(
+            cardinality, ", ".join(self._column_names(cardinality))
+        )
+        self.execute_sql(query)
+
+    def copy_ngrams(self, ngram_counts, staging=False, ids=None):
+        """
+        Streams n-grams with counts into the database with `COPY FROM STDIN`.
+        All n-grams must have the same cardinality.
+
+        Parameters
+        ----------
+        ngram_counts : iterable of (iterable of str, int)
+            The n-grams and their counts.
+        staging : bool
+            Copy into the staging table of `create_staging_table()` instead of
+            the n-gram table.
+        ids : dict
+            With `integer_ids`, maps all words of the n-grams to their ids in
+            the table `_vocab`, see `vocabulary()`. If not given, the words are
+            added to the vocabulary and the vocabulary is loaded for this call.
+
+        """
+        if self.integer_ids:
+            if ids is None:
+                ngram_counts = list(ngram_counts)
+                self.add_words(set(word for ngram, _ in ngram_counts for word in ngram))
+                ids = self.vocabulary()
+            ngram_counts = (
+                ([str(ids[word]) for word in ngram], count)
+                for ngram, count in ngram_counts
+            )
+
+        buf = io.StringIO()
+        cardinality = None
+        for ngram, count in ngram_counts:
+            cardinality = len(ngram)
+            buf.write("\t".join(word.translate(_copy_escapes) for word in ngram))
+            buf.write("\t{0}\n".format(count))
+
+        if cardinality is None:
+            return
+
+        table = "_{0}_gram".format(cardinality)
+        if staging:
+            table += "_staging"
+        query = "COPY {0} ({1}, count) FROM STDIN;".format(
+            table, ", ".join(self._column_names(cardinality))
+        )
+        buf.seek(0)
+        with self._connection() as con:
+            c = con.cursor()
+            c.copy_expert(query, buf)
+
+    def _load_dictionary_table(self, dictionary):
+        buf = io.StringIO()
+        for word in dictionary:
+            buf.write(word.translate(_copy_escapes))
+            buf.write("\n")
+        buf.seek(0)
+        with self._connection() as con:
+            c = con.cursor()
+            c.copy_expert("COPY _dictionary (word) FROM STDIN;", buf)
+
+    def create_staging_table(self, cardinality):
+        """
+        Creates an empty unlogged staging table with the columns of the n-gram
+        table of the given cardinality, but without constraints or indexes.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        query = "DROP TABLE IF EXISTS _{0}_gram_staging;".format(cardinality)
+        self.execute_sql(query)
+        query = "CREATE UNLOGGED TABLE _{0}_gram_staging (LIKE _{0}_gram);".format(
+            cardinality
+        )
+        self.execute_sql(query)
+
+    def merge_staging_table(self, cardinality):
+        """
+        Adds the counts of the staging table to the n-gram table with a single
+        statement, n-grams that are not in the n-gram table yet are inserted.
+        If the table has metadata, the counts of the staging table are added
+        to the total and the context counts as well. The staging table is
+        deleted afterwards.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        columns = ", ".join(self._column_names(cardinality))
+        query = """INSERT INTO _{0}_gram ({1}, count)
+    SELECT {1}, SUM(count) FROM _{0}_gram_staging GROUP BY {1}
+    ON CONFLICT ({1}) DO UPDATE SET count = _{0}_gram.count + excluded.count;""".format(
+            cardinality, columns
+        )
+        self.execute_sql(query)
+        if self.has_metadata(cardinality):
+            query = """UPDATE _totals SET total = total + (
+    SELECT COALESCE(SUM(count), 0) FROM _{0}_gram_staging)
+    WHERE cardinality = {0};""".format(
+                cardinality
+            )
+            self.execute_sql(query)
+        if cardinality > 1 and self.has_metadata(cardinality):
+            context_columns = ", ".join(self._column_names(cardinality)[:-1])
+            query = """INSERT INTO _{0}_gram_context ({1}, count)
+    SELECT {1}, SUM(count) FROM _{0}_gram_staging GROUP BY {1}
+    ON CONFLICT ({1}) DO UPDATE SET count = _{0}_gram_context.count + excluded.count;""".format(
+                cardinality, context_columns
+            )
+            self.execute_sql(query)
+        query = "DROP TABLE _{0}_gram_staging;".format(cardinality)
+        self.execute_sql(query)
+
+    def commit(self):
+        """
+        Sends a commit to the database.
+
+        """
+        self.con.commit()
+
+    def open_database(self):
+        """
+        Opens the sqlite database.
+
+        """
+        if not self.con:
+            try:
+                self.con = psycopg2.connect(
+                    host=self.host,
+                    database=self.dbname,
+                    user=self.user,
+                    password=self.password,
+                    port=self.port,
+                )
+            except psycopg2.Error as e:
+                print("Error while opening database:")
+                print(e.pgerror)
+
+    def close_database(self):
+        """
+        Closes the sqlite database.
+
+        """
+        if self.con:
+            self.con.close()
+            self.con = None
+
+    def execute_sql(self, query, params=None):
+        """
+        Executes a given query string on an open postgres database. If
+        `stats` is set, the query is recorded in the query statistics.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `%s`.
+        params : list
+            The values for the parameters of the query.
+
+        """
+        if self.stats is not None:
+            return self._measure(query, params, self._execute_query, query, params)
+        return self._execute_query(query, params)
+
+    def _execute_query(self, query, params=None):
+        with self._connection() as con:
+            return self._execute_sql(con, query, params)
+
+    def _execute_sql(self, con, query, params=None):
+        c = con.cursor()
+        c.execute(query, params)
+        result = []
+        if c.rowcount > 0:
+            try:
+                result = c.fetchall()
+            except psycopg2.ProgrammingError:
+                pass
+        return result
+
+    def iterate_sql(self, query, params=None, batch_size=STREAM_BATCH_SIZE):
+        """
+        Executes a given query string on an open postgres database and
+        iterates over the rows of the result. The query runs in a named
+        server-side cursor, which sends `batch_size` rows per round trip.
+        Cursors on connections in autocommit mode are declared `WITH HOLD`.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `%s`.
+        params : list
+            The values for the parameters of the query.
+        batch_size : int
+            The number of rows that are fetched at once.
+
+        Returns
+        -------
+        rows : generator
+            The rows of the result.
+
+        """
+        with self._connection() as con:
+            c = con.cursor(
+                name="pressagio_cursor_{0}".format(next(_cursor_ids)),
+                withhold=con.autocommit,
+            )
+            c.itersize = batch_size
+            try:
+                c.execute(query, params)
+                for row in c:
+                    yield row
+            finally:
+                c.close()
+
+    def iterate_statement(self, statement, params, batch_size=STREAM_BATCH_SIZE):
+        """
+        Executes a statement template in a named server-side cursor, see
+        `iterate_sql()`. A cursor cannot run a prepared statement, so the
+        parameters of the template are passed to psycopg2 by name.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement, parameters are marked with `$1`,
+            `$2`, ...
+        params : list
+            The values for the parameters of the statement.
+        batch_size : int
+            The number of rows that are fetched at once.
+
+        Returns
+        -------
+        rows : generator
+            The rows of the result.
+
+        """
+        if len(params) == 0:
+            return self.iterate_sql(statement, None, batch_size)
+        query = re.sub(r"\$(\d+)", r"%(p\1)s", statement.replace("%", "%%"))
+        named_params = {"p{0}".format(i + 1): value for i, value in enumerate(params)}
+        return self.iterate_sql(query, named_params, batch_size)
+
+    def _database_exists(self):
+        """
+        Check if the database exists.
+
+        """
+        con = psycopg2.connect(
+            host=self.host,
+            database="postgres",
+            user=self.user,
+            password=self.password,
+            port=self.port,
+        )
+        query_check = "select datname from pg_catalog.pg_database"
+        query_check += " where datname = %s;"
+        c = con.cursor()
+        c.execute(query_check, (self.dbname,))
+        result = c.fetchall()
+        if len(result) > 0:
+            return True
+        return False
+
+    def execute_statement(self, statement, params):
+        """
+        Executes a statement template as a server-side prepared statement.
+        The statement is prepared once per connection with `PREPARE` and then
+        run with `EXECUTE`, so that postgres parses and plans it only once.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement, parameters are marked with `$1`,
+            `$2`, ...
+        params : list
+            The values for the parameters of the statement.
+
+        Returns
+        -------
+        result : list
+            The rows returned by the statement.
+
+        """
+        if self.stats is not None:
+            return self._measure(
+                statement, params, self._execute_prepared, statement, params
+            )
+        return self._execute_prepared(statement, params)
+
+    def _execute_prepared(self, statement, params):
+        with self._connection() as con:
+            name = self._prepare(con, statement)
+            if len(params) == 0:
+                return self._execute_sql(con, "EXECUTE {0};".format(name))
+            return self._execute_sql(
+                con,
+                "EXECUTE {0} ({1});".format(name, ", ".join(["%s"] * len(params))),
+                params,
+            )
+
+    def execute_many_statement(self, statement, params_seq):
+        """
+        Executes a statement template as a server-side prepared statement once
+        for every parameter list in a sequence. The executions are sent to the
+        server in pages to save network round trips.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement, parameters are marked with `$1`,
+            `$2`, ...
+        params_seq : iterable of list
+            The values for the parameters of each execution.
+
+        """
+        if self.stats is not None:
+            return self._measure_many(
+                statement, self._execute_many_prepared, params_seq
+            )
+        return self._execute_many_prepared(statement, params_seq)
+
+    def _execute_many_prepared(self, statement, params_seq):
+        params_seq = iter(params_seq)
+        first = next(params_seq, None)
+        if first is None:
+            return
+        with self._connection() as con:
+            name = self._prepare(con, statement)
+            query = "EXECUTE {0} ({1});".format(name, ", ".join(["%s"] * len(first)))
+            c = con.cursor()
+            psycopg2.extras.execute_batch(
+                c, query, itertools.chain([first], params_seq), page_size=1000
+            )
+
+    async def aexecute_statement(self, statement, params):
+        """
+        Async version of `execute_statement()`. If asyncpg is installed the
+        statement runs on a connection of an asyncpg pool that is shared by
+        all connectors with the same connection parameters on the running
+        event loop. asyncpg prepares and caches the statements itself.
+        Without asyncpg the statement runs in the default executor.
+
+        Parameters
+        ----------
+        statement : str
+            The parameterized SQL statement, parameters are marked with `$1`,
+            `$2`, ...
+        params : list
+            The values for the parameters of the statement.
+
+        Returns
+        -------
+        result : list
+            The rows returned by the statement.
+
+        """
+        if asyncpg is None:
+            return await DatabaseConnector.aexecute_statement(self, statement, params)
+        start = time.perf_counter()
+        pool = await self._async_pool()
+        async with pool.acquire() as con:
+            rows = await con.fetch(statement, *params)
+        result = [tuple(row) for row in rows]
+        if self.stats is not None:
+            self.stats.record(
+                self, statement, params, time.perf_counter() - start, result
+            )
+        return result
+
+    async def _async_pool(self):
+        loop = asyncio.get_running_loop()
+        pools = _async_connection_pools.setdefault(loop, {})
+        key = (self.dbname, self.host, str(self.port), self.user, self.password)
+        pool = pools.get(key)
+        if pool is None:
+            pool = asyncio.ensure_future(
+                asyncpg.create_pool(
+                    host=self.host,
+                    port=int(self.port),
+                    user=self.user,
+                    password=self.password,
+                    database=self.dbname,
+                    min_size=self._async_pool_size[0],
+                    max_size=self._async_pool_size[1],
+                )
+            )
+            pools[key] = pool
+        try:
+            return await pool
+        except Exception:
+            if pools.get(key) is pool:
+                del pools[key]
+            raise
+
+    _async_pool_size = (ASYNC_POOL_MIN_SIZE, ASYNC_POOL_MAX_SIZE)
+
+    def executemany_sql(self, query, params_seq):
+        """
+        Executes a given query string once for every parameter list in a
+        sequence on an open postgres database.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `%s`.
+        params_seq : iterable of list
+            The values for the parameters of each execution.
+
+        """
+        if self.stats is not None:
+            return self._measure_many(query, self._executemany_query, params_seq)
+        return self._executemany_query(query, params_seq)
+
+    def _executemany_query(self, query, params_seq):
+        with self._connection() as con:
+            c = con.cursor()
+            psycopg2.extras.execute_batch(c, query, params_seq, page_size=1000)
+
+    def explain(self, query, params=None):
+        """
+        Returns the query plan of a query or a statement template from
+        `EXPLAIN`. Statement templates are explained as prepared statements
+        with the given parameters.
+
+        Parameters
+        ----------
+        query : str
+            The SQL query, parameters are marked with `%s`, or a statement
+            template with parameters marked with `$1`, `$2`, ...
+        params : list
+            The values for the parameters of the query.
+
+        Returns
+        -------
+        plan : list of str
+            The lines of the query plan.
+
+        """
+        with self._connection() as con:
+            if params and "$1" in query:
+                name = self._prepare(con, query)
+                result = self._execute_sql(
+                    con,
+                    "EXPLAIN EXECUTE {0} ({1});".format(
+                        name, ", ".join(["%s"] * len(params))
+                    ),
+                    params,
+                )
+            else:
+                result = self._execute_sql(con, "EXPLAIN " + query, params)
+        return [row[0] for row in result]
+
+    def _build_table_exists_statement(self, cardinality):
+        return "SELECT table_name FROM information_schema.tables WHERE table_name = $1"
+
+    @contextlib.contextmanager
+    def _connection(self):
+        yield self.con
+
+    def _prepare(self, con, statement):
+        name = "pressagio_{0}".format(
+            hashlib.md5(statement.encode("utf-8")).hexdigest()[:16]
+        )
+        prepared = _prepared_statements.setdefault(con, set())
+        if name not in prepared:
+            self._execute_sql(con, "PREPARE {0} AS {1};".format(name, statement))
+            prepared.add(name)
+        return name
+
+    def _parameter(self, index):
+        return "${0}".format(index + 1)
+
+    _prefix_parameter_count = 1
+
+    def _build_prefix_condition(self, index):
+        # the pattern operators compare byte-wise and are supported by the
+        # varchar_pattern_ops indexes; the upper bound is the prefix followed
+        # by the largest code point
+        word, prefix = self._prefix_expressions()
+        prefix = prefix.format(self._parameter(index))
+        return "{0} ~>=~ {1} AND {0} ~<~ ({1} || chr(1114111))".format(word, prefix)
+
+    def _prefix_expressions(self):
+        if self.lowercase:
+            if self.normalize:
+                return "NORMALIZE(LOWER(word))", "NORMALIZE(LOWER({0}))"
+            return "LOWER(word)", "LOWER({0})"
+        elif self.normalize:
+            return "NORMALIZE(word)", "NORMALIZE({0})"
+        return "word", "{0}"
+
+    def _prefix_params(self, prefix):
+        return [prefix]
+
+    def _build_smoothed_ngram_prediction_statement(self, cardinality):
+        return "SELECT word, probability FROM pressagio_predict_{0}($1, $2, $3, $4)".format(
+            cardinality
+        )
+
+    def _build_prediction_function_statement(self, cardinality):
+        # the candidates are selected by the statement of
+        # `backoff_candidates()`, its parameters are replaced with the
+        # arguments of the function
+        cardinalities = tuple(range(cardinality, 0, -1))
+        arguments = []
+        for ngram_cardinality in cardinalities:
+            arguments += [
+                "context[{0}]".format(cardinality - i)
+                for i in reversed(range(1, ngram_cardinality))
+            ]
+            arguments += ["prefix", "size"]
+        arguments.append("size")
+        candidates = re.sub(
+            r"\$(\d+)",
+            lambda match: arguments[int(match.group(1)) - 1],
+            self._build_backoff_candidates_statement(
+                cardinality, (cardinalities, 1)
+            ),
+        )
+
+        def value(expression):
+            if self.integer_ids:
+                return "(SELECT id FROM _vocab WHERE word = {0})".format(expression)
+            return expression
+
+        # the count of every candidate n-gram and of its context, the
+        # context of the candidate bigram is the unigram of the last context
+        # word and so on
+        joins = []
+        terms = [
+            "CASE WHEN unigram_total > 0 THEN {0} ELSE 0 END".format(
+                "deltas[1] * (COALESCE(g1.count, 0)::float8 / unigram_total)"
+            )
+        ]
+        for ngram_cardinality in range(1, cardinality + 1):
+            columns = self._column_names(ngram_cardinality)
+            conditions = [
+                "g{0}.{1} = {2}".format(
+                    ngram_cardinality,
+                    column,
+                    value("context[{0}]".format(cardinality - len(columns) + 1 + i)),
+                )
+                for i, column in enumerate(columns[:-1])
+            ]
+            conditions.append(
+                "g{0}.word = {1}".format(ngram_cardinality, value("c.word"))
+            )
+            joins.append(
+                "LEFT JOIN _{0}_gram g{0} ON {1}".format(
+                    ngram_cardinality, " AND ".join(conditions)
+                )
+            )
+            if ngram_cardinality == 1:
+                continue
+            context_columns = self._column_names(ngram_cardinality - 1)
+            context_count = "(SELECT count FROM _{0}_gram WHERE {1})".format(
+                ngram_cardinality - 1,
+                " AND ".join(
+                    "{0} = {1}".format(
+                        column,
+                        value(
+                            "context[{0}]".format(
+                                cardinality - len(context_columns) + i
+                            )
+                        ),
+                    )
+                    for i, column in enumerate(context_columns)
+                ),
+            )
+            terms.append(
+                "CASE WHEN g{0}.count > 0 AND {1} > 0 THEN {2} ELSE 0 END".format(
+                    ngram_cardinality,
+                    context_count,
+                    "deltas[{0}] * (g{0}.count::float8 / {1})".format(
+                        ngram_cardinality, context_count
+                    ),
+                )
+            )
+
+        return """CREATE OR REPLACE FUNCTION pressagio_predict_{0}(
+    context text[], prefix text, deltas double precision[], size integer)
+    RETURNS TABLE (word text, probability double precision)
+AS $$
+#variable_conflict use_column
+DECLARE
+    unigram_total bigint;
+BEGIN
+    IF to_regclass('_totals') IS NOT NULL THEN
+        SELECT t.total INTO unigram_total FROM _totals t WHERE t.cardinality = 1;
+    END IF;
+    IF unigram_total IS NULL THEN
+        SELECT SUM(g.count) INTO unigram_total FROM _1_gram g;
+    END IF;
+    RETURN QUERY
+    WITH candidates(word) AS ({1})
+    SELECT scored.word::text, scored.probability::float8 FROM (
+        SELECT c.word, 0 + {2} AS probability FROM candidates c {3}
+    ) AS scored WHERE scored.probability > 0 ORDER BY scored.probability DESC;
+END;
+$$ LANGUAGE plpgsql STABLE;""".format(
+            cardinality, candidates, " + ".join(terms), " ".join(joins)
+        )
+
+    def _build_context_condition(self, column, index):
+        if self.lowercase:
+            return "LOWER({0}) = LOWER({1})".format(column, self._parameter(index))
+        return "{0} = {1}".format(column, self._parameter(index))
+
+
+class PooledPostgresDatabaseConnector(PostgresDatabaseConnector):
+    """
+    Database connector for postgres databases that borrows a connection from
+    a shared `PostgresConnectionPool` for every query instead of opening its
+    own connection. All connectors with the same connection parameters in a
+    process share one pool, so that new predictors and sessions do not have
+    to connect and authenticate again.
+
+    The pooled connections run in autocommit mode, `commit()` has nothing
+    to do.
+
+    """
+
+    def __init__(
+        self,
+        dbname,
+        cardinality=1,
+        host="localhost",
+        port=5432,
+        user="postgres",
+        password=None,
+        pool=None,
+        min_size=1,
+        max_size=10,
+        timeout=30.0,
+        health_check_interval=60.0,
+    ):
+        """
+        Constructor for the pooled postgres database connector.
+
+        Parameters
+        ----------
+        dbname : str
+            the database name
+        cardinality : int
+            default cardinality for n-grams
+        host : str
+            hostname of the postgres database
+        port : int
+            port number of the postgres database
+        user : str
+            user name for the postgres database
+        password: str
+            user password for the postgres database
+        pool : PostgresConnectionPool
+            the pool to borrow connections from, the shared pool for the
+            connection parameters is used if not given
+        min_size : int
+            number of connections the shared pool opens in advance
+        max_size : int
+            maximum number of connections of the shared pool
+        timeout : float
+            seconds to wait for a free connection of the shared pool
+        health_check_interval : float
+            seconds a connection may be idle in the shared pool before it is
+            checked with a query on checkout
+
+        """
+        PostgresDatabaseConnector.__init__(
+            self, dbname, cardinality, host, port, user, password
+        )
+        self.pool = pool
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+    def commit(self):
+        """
+        Does nothing, the pooled connections run in autocommit mode.
+
+        """
+        pass
+
+    def open_database(self):
+        """
+        Attaches the connector to the shared connection pool.
+
+        """
+        if not self.pool:
+            self.pool = get_connection_pool(
+                self.dbname,
+                self.host,
+                self.port,
+                self.user,
+                self.password,
+                self.min_size,
+                self.max_size,
+                self.timeout,
+                self.health_check_interval,
+            )
+
+    def close_database(self):
+        """
+        Detaches the connector from the connection pool. The connections stay
+        open in the pool for other connectors.
+
+        """
+        self.pool = None
+
+    @property
+    def _async_pool_size(self):
+        return (self.min_size, self.max_size)
+
+    @contextlib.contextmanager
+    def _connection(self):
+        if not self.pool:
+            self.open_database()
+        with self.pool.connection() as con:
+            yield con
+
+
+class MemoryDatabaseConnector(DatabaseConnector):
+    """
+    Database connector that keeps the n-grams in memory, so that lookups run
+    without any SQL. Words are mapped to integer ids. The table of every
+    cardinality maps the ids of a context to the counts of the words that
+    follow the context. Prefix lookups use the vocabulary sorted by the lower
+    case words.
+
+    If `dbname` is the path of an existing sqlite database, the n-grams up
+    to the cardinality are loaded from it when the database is opened.
+    Changes are kept in memory only.
+
+    """
+
+    def __init__(self, dbname=None, cardinality=1):
+        """
+        Constructor for the memory database connector.
+
+        Parameters
+        ----------
+        dbname : str
+            path to a sqlite database to load the n-grams from, or None
+        cardinality : int
+            default cardinality for n-grams
+
+        """
+        DatabaseConnector.__init__(self, dbname, cardinality)
+        self._ids = {}
+        self._words = []
+        self._tables = {}
+        self._totals = {}
+        self._context_counts = {}
+        self._dictionary = None
+        self._sorted_keys = None
+        self._sorted_ids = None
+        self._positions = None
+        self.open_database()
+
+    def create_ngram_table(self, cardinality, unique=True):
+        """
+        Creates an empty table for n-grams of a given cardinality if it does
+        not exist.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality to create a table for.
+        unique : bool
+            Ignored, the n-grams of the table are always unique.
+
+        """
+        if cardinality not in self._tables:
+            self._tables[cardinality] = {}
+            self._context_counts[cardinality] = collections.defaultdict(int)
+            self._totals[cardinality] = 0
+
+    def delete_ngram_table(self, cardinality):
+        """
+        Deletes the table for n-grams of a given cardinality.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the table to delete.
+
+        """
+        self._tables.pop(cardinality, None)
+        self._context_counts.pop(cardinality, None)
+        self._totals.pop(cardinality, None)
+
+    def create_index(self, cardinality):
+        pass
+
+    def delete_index(self, cardinality):
+        pass
+
+    def update_metadata(self, cardinality):
+        """
+        Recomputes the total count and the context counts of the table with
+        the given cardinality. They are kept up to date by all writes, so
+        this is only needed if the table was changed directly.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        context_counts = collections.defaultdict(int)
+        for context, words in self._tables[cardinality].items():
+            context_counts[context] = sum(words.values())
+        self._context_counts[cardinality] = context_counts
+        self._totals[cardinality] = sum(context_counts.values())
+
+    def delete_metadata(self, cardinality):
+        pass
+
+    def has_metadata(self, cardinality):
+        return cardinality in self._tables
+
+    def ngrams(self, with_counts=False):
+        """
+        Returns all ngrams that are in the table.
+
+        Parameters
+        ----------
+        with_counts : bool
+            Append the count to every n-gram.
+
+        Returns
+        -------
+        ngrams : generator
+            A generator for ngram tuples.
+
+        """
+        for context, words in self._tables.get(self.cardinality, {}).items():
+            context = tuple(self._words[i] for i in context)
+            for word, count in words.items():
+                if with_counts:
+                    yield context + (self._words[word], count)
+                else:
+                    yield context + (self._words[word],)
+
+    def ngram_total(self, cardinality):
+        return self._totals.get(cardinality, 0)
+
+    def context_count(self, context):
+        cardinality = len(context) + 1
+        if cardinality == 1:
+            return self.ngram_total(1)
+        context = self._word_ids(context)
+        if context is None or cardinality not in self._context_counts:
+            return 0
+        return self._context_counts[cardinality].get(context, 0)
+
+    def ngram_count(self, ngram):
+        table = self._tables.get(len(ngram))
+        ids = self._word_ids(ngram)
+        if table is None or ids is None:
+            return 0
+        return table.get(ids[:-1], {}).get(ids[-1], 0)
+
+    def ngram_counts(self, ngrams):
+        return {tuple(ngram): self.ngram_count(ngram) for ngram in ngrams}
+
+    def ngram_like_table(self, ngram, limit=-1):
+        prefixes = []
+        if ngram[-1] != "":
+            prefixes.append(ngram[-1])
+        return self._like(ngram, prefixes, limit)
+
+    def ngram_like_table_filtered(self, ngram, filter, limit=-1):
+        prefixes = [ngram[-1] + continuation for continuation in filter]
+        if len(prefixes) == 0:
+            return []
+        return self._like(ngram, prefixes, limit)
+
+    async def ahas_metadata(self, cardinality):
+        return self.has_metadata(cardinality)
+
+    async def angram_total(self, cardinality):
+        return self.ngram_total(cardinality)
+
+    async def angram_count(self, ngram):
+        return self.ngram_count(ngram)
+
+    async def angram_counts(self, ngrams):
+        return self.ngram_counts(ngrams)
+
+    async def angram_like_table(self, ngram, limit=-1):
+        return self.ngram_like_table(ngram, limit)
+
+    async def angram_like_table_filtered(self, ngram, filter, limit=-1):
+        return self.ngram_like_table_filtered(ngram, filter, limit)
+
+    def backoff_candidates(self, ngrams, limit, filter=None):
+        return self._backoff_candidates_by_order(ngrams, limit, filter)
+
+    async def abackoff_candidates(self, ngrams, limit, filter=None):
+        return self.backoff_candidates(ngrams, limit, filter)
+
+    def insert_ngram(self, ngram, count):
+        self._set_count(ngram, count)
+
+    def insert_ngrams(self, ngram_counts):
+        for ngram, count in ngram_counts:
+            self._set_count(ngram, count)
+
+    def upsert_ngrams(self, ngram_counts):
+        for ngram, count in ngram_counts:
+            self._set_count(ngram, self.ngram_count(ngram) + count)
+
+    def update_ngram(self, ngram, count):
+        self._set_count(ngram, count)
+
+    def remove_ngram(self, ngram):
+        self._set_count(ngram, 0)
+
+    def create_dictionary_table(self, dictionary):
+        self._dictionary = set(dictionary)
+
+    def delete_ngrams_not_in_dictionary(self, cardinality):
+        removed = [
+            ngram
+            for ngram in self._ngrams_of(cardinality)
+            if any(word not in self._dictionary for word in ngram)
+        ]
+        for ngram in removed:
+            self._set_count(ngram, 0)
+
+    def commit(self):
+        pass
+
+    def open_database(self):
+        """
+        Loads the n-grams from the sqlite database `dbname` if the file
+        exists and nothing was loaded yet.
+
+        """
+        if self.dbname and len(self._tables) == 0 and os.path.isfile(self.dbname):
+            self.load_sqlite(self.dbname)
+
+    def close_database(self):
+        pass
+
+    def load_sqlite(self, filename):
+        """
+        Loads all n-gram tables up to the cardinality of the connector from
+        a sqlite database. Tables that are already in memory are replaced.
+
+        Parameters
+        ----------
+        filename : str
+            Path to the sqlite database.
+
+        """
+        sql = SqliteDatabaseConnector(filename, read_only=True)
+        try:
+            for cardinality in range(1, self.cardinality + 1):
+                if not sql._table_exists("_{0}_gram".format(cardinality)):
+                    continue
+                self.delete_ngram_table(cardinality)
+                self.create_ngram_table(cardinality)
+                table = self._tables[cardinality]
+                sql.cardinality = cardinality
+                for row in sql.ngrams(with_counts=True):
+                    ids = self._add_words(row[:-1])
+                    words = table.get(ids[:-1])
+                    if words is None:
+                        words = table[ids[:-1]] = {}
+                    words[ids[-1]] = words.get(ids[-1], 0) + int(row[-1])
+                self.update_metadata(cardinality)
+        finally:
+            sql.close_database()
+
+    def _word_ids(self, words):
+        ids = []
+        for word in words:
+            i = self._ids.get(word)
+            if i is None:
+                return None
+            ids.append(i)
+        return tuple(ids)
+
+    def _add_words(self, words):
+        ids = []
+        for word in words:
+            i = self._ids.get(word)
+            if i is None:
+                i = self._ids[word] = len(self._words)
+                self._words.append(word)
+                self._sorted_keys = None
+            ids.append(i)
+        return tuple(ids)
+
+    def _ngrams_of(self, cardinality):
+        for context, words in self._tables.get(cardinality, {}).items():
+            context = tuple(self._words[i] for i in context)
+            for word in words:
+                yield context + (self._words[word],)
+
+    def _set_count(self, ngram, count):
+        cardinality = len(ngram)
+        self.create_ngram_table(cardinality)
+        table = self._tables[cardinality]
+        ids = self._add_words(ngram)
+        context, word = ids[:-1], ids[-1]
+        words = table.get(context)
+        if words is None:
+            words = table[context] = {}
+        delta = count - words.get(word, 0)
+        if count > 0:
+            words[word] = count
+        else:
+            words.pop(word, None)
+            if len(words) == 0:
+                del table[context]
+        self._totals[cardinality] += delta
+        context_counts = self._context_counts[cardinality]
+        context_counts[context] += delta
+        if context_counts[context] == 0:
+            del context_counts[context]
+
+    def _sorted_vocabulary(self):
+        # the words sorted like the prefix index of sqlite, by the ASCII
+        # lower case word
+        if self._sorted_keys is None:
+            keys = [word.translate(_ascii_lowercase) for word in self._words]
+            self._sorted_ids = sorted(
+                range(len(self._words)), key=lambda i: (keys[i], self._words[i])
+            )
+            self._sorted_keys = [keys[i] for i in self._sorted_ids]
+            self._positions = [0] * len(self._words)
+            for position, i in enumerate(self._sorted_ids):
+                self._positions[i] = position
+        return self._sorted_keys, self._sorted_ids, self._positions
+
+    def _like(self, ngram, prefixes, limit):
+        table = self._tables.get(len(ngram))
+        context = self._word_ids(ngram[:-1])
+        if table is None or context is None or context not in table:
+            return []
+        words = table[context]
+
+        if len(prefixes) == 0:
+            candidates = list(words.items())
+        else:
+            keys, ids, positions = self._sorted_vocabulary()
+            ranges = set()
+            for prefix in prefixes:
+                low, high = self._prefix_params(prefix)
+                ranges.add(
+                    (bisect.bisect_left(keys, low), bisect.bisect_left(keys, high))
+                )
+            if sum(high - low for low, high in ranges) < len(words):
+                # fewer words with the prefixes than words after the context
+                candidates = {}
+                for low, high in ranges:
+                    for i in ids[low:high]:
+                        if i in words:
+                            candidates[i] = words[i]
+                candidates = list(candidates.items())
+            elif len(ranges) == 1:
+                low, high = ranges.pop()
+                candidates = [
+                    (i, count)
+                    for i, count in words.items()
+                    if low <= positions[i] < high
+                ]
+            else:
+                candidates = [
+                    (i, count)
+                    for i, count in words.items()
+                    if any(low <= positions[i] < high for low, high in ranges)
+                ]
+
+        if limit >= 0 and limit < len(candidates):
+            candidates = heapq.nsmallest(
+                limit, candidates, key=lambda c: (-c[1], c[0])
+            )
+        else:
+            candidates.sort(key=lambda c: (-c[1], c[0]))
+        context = tuple(ngram[:-1])
+        return [context + (self._words[i], count) for i, count in candidates]
+
+
+class BinaryDatabaseConnector(DatabaseConnector):
+    """
+    Read-only database connector for n-gram models in the binary format of
+    `pressagio.binary`. The model file is memory mapped, so opening it is
+    instant and processes that serve the same file share its pages. Use
+    `convert_sqlite_to_binary()` to create a model file from a sqlite
+    database.
+
+    """
+
+    def __init__(self, dbname, cardinality=1):
+        """
+        Constructor for the binary database connector.
+
+        Parameters
+        ----------
+        dbname : str
+            path to the model file
+        cardinality : int
+            default cardinality for n-grams
+
+        """
+        DatabaseConnector.__init__(self, dbname, cardinality)
+        self.model = None
+        self.open_database()
+
+    def open_database(self):
+        """
+        Opens the model file.
+
+        """
+        if not self.model:
+            self.model = pressagio.binary.BinaryModel(self.dbname)
+
+    def close_database(self):
+        """
+        Closes the model file.
+
+        """
+        if self.model:
+            self.model.close()
+            self.model = None
+
+    def commit(self):
+        pass
+
+    def has_metadata(self, cardinality):
+        return cardinality <= self.model.cardinality
+
+    def ngrams(self, with_counts=False):
+        """
+        Returns all ngrams that are in the table.
+
+        Parameters
+        ----------
+        with_counts : bool
+            Append the count to every n-gram.
+
+        Returns
+        -------
+        ngrams : generator
+            A generator for ngram tuples.
+
+        """
+        for ids, count in self.model.ngrams(self.cardinality):
+            ngram = tuple(self.model.word(i) for i in ids)
+            if with_counts:
+                yield ngram + (count,)
+            else:
+                yield ngram
+
+    def ngram_total(self, cardinality):
+        return self.model.total(cardinality)
+
+    def context_count(self, context):
+        if len(context) == 0:
+            return self.ngram_total(1)
+        ids = self.model.word_ids(context)
+        if ids is None:
+            return 0
+        return self.model.context_count(ids)
+
+    def ngram_count(self, ngram):
+        ids = self.model.word_ids(ngram)
+        if ids is None or len(ids) > self.model.cardinality:
+            return 0
+        return self.model.count(ids)
+
+    def ngram_counts(self, ngrams):
+        return {tuple(ngram): self.ngram_count(ngram) for ngram in ngrams}
+
+    def ngram_like_table(self, ngram, limit=-1):
+        prefixes = []
+        if ngram[-1] != "":
+            prefixes.append(ngram[-1])
+        return self._like(ngram, prefixes, limit)
+
+    def ngram_like_table_filtered(self, ngram, filter, limit=-1):
+        prefixes = [ngram[-1] + continuation for continuation in filter]
+        if len(prefixes) == 0:
+            return []
+        return self._like(ngram, prefixes, limit)
+
+    async def ahas_metadata(self, cardinality):
+        return self.has_metadata(cardinality)
+
+    async def angram_total(self, cardinality):
+        return self.ngram_total(cardinality)
 
-    def _extract_first_integer(self, table):
-        count = 0
-        if len(table) > 0:
-            if len(table[0]) > 0:
-                count = int(table[0][0])
+    async def angram_count(self, ngram):
+        return self.ngram_count(ngram)
 
-        if not count > 0:
-            count = 0
-        return count
+    async def angram_counts(self, ngrams):
+        return self.ngram_counts(ngrams)
 
+    async def angram_like_table(self, ngram, limit=-1):
+        return self.ngram_like_table(ngram, limit)
 
-class SqliteDatabaseConnector(DatabaseConnector):
+    async def angram_like_table_filtered(self, ngram, filter, limit=-1):
+        return self.ngram_like_table_filtered(ngram, filter, limit)
+
+    def backoff_candidates(self, ngrams, limit, filter=None):
+        return self._backoff_candidates_by_order(ngrams, limit, filter)
+
+    async def abackoff_candidates(self, ngrams, limit, filter=None):
+        return self.backoff_candidates(ngrams, limit, filter)
+
+    def _like(self, ngram, prefixes, limit):
+        context = self.model.word_ids(ngram[:-1])
+        if context is None or len(ngram) > self.model.cardinality:
+            return []
+        if len(prefixes) == 0:
+            candidates = self.model.followers(context)
+        else:
+            ranges = set(self.model.prefix_range(prefix) for prefix in prefixes)
+            candidates = []
+            for word_range in sorted(ranges):
+                candidates += self.model.followers(context, word_range)
+            if len(ranges) > 1:
+                candidates = list(dict(candidates).items())
+
+        if limit >= 0 and limit < len(candidates):
+            candidates = heapq.nsmallest(
+                limit, candidates, key=lambda c: (-c[1], c[0])
+            )
+        else:
+            candidates.sort(key=lambda c: (-c[1], c[0]))
+        context = tuple(ngram[:-1])
+        return [context + (self.model.word(i), count) for i, count in candidates]
+
+
+class ShardedDatabaseConnector(DatabaseConnector):
     """
-    Database connector for sqlite databases.
+    Database connector for n-gram models that are partitioned over several
+    sqlite files. The meta file `dbname` holds the unigrams, the totals of
+    all cardinalities and the number of shards. The n-grams of higher
+    cardinalities are distributed over the shard files by the CRC-32 of
+    their first word, see `shard_filename()` and `shard_index()`. All
+    n-grams that start with the same context are in the same shard, so
+    every lookup is answered by a single file.
 
     """
 
-    def __init__(self, dbname, cardinality=1):
+    def __init__(
+        self, dbname, cardinality=1, shards=None, read_only=False, thread_local=False
+    ):
         """
-        Constructor for the sqlite database connector.
+        Constructor for the sharded database connector.
 
         Parameters
         ----------
         dbname : str
-            path to the database file
+            path to the meta file
         cardinality : int
             default cardinality for n-grams
+        shards : int
+            the number of shards of a new model, the number of an existing
+            model is read from its meta file
+        read_only : bool
+            open the files for serving an immutable model, see
+            `SqliteDatabaseConnector.open_database()`
+        thread_local : bool
+            open a separate connection for every thread, see
+            `SqliteDatabaseConnector.open_database()`
 
         """
         DatabaseConnector.__init__(self, dbname, cardinality)
-        self.con = None
+        self.shards = shards
+        self.read_only = read_only
+        self.thread_local = thread_local
+        self.meta = None
+        self.connectors = []
         self.open_database()
 
+    @property
+    def stats(self):
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats):
+        # the queries are run by the connectors of the meta file and shards
+        self._stats = stats
+        for connector in [getattr(self, "meta", None)] + getattr(
+            self, "connectors", []
+        ):
+            if connector is not None:
+                connector.stats = stats
+
+    def create_ngram_table(self, cardinality, unique=True):
+        """
+        Creates the table for n-grams of a given cardinality, in the meta
+        file for unigrams and in every shard otherwise.
+
+        """
+        for connector in self._connectors_of(cardinality):
+            connector.create_ngram_table(cardinality, unique)
+
+    def delete_ngram_table(self, cardinality):
+        for connector in self._connectors_of(cardinality):
+            connector.delete_ngram_table(cardinality)
+        self.delete_metadata(cardinality)
+
+    def create_index(self, cardinality):
+        for connector in self._connectors_of(cardinality):
+            connector.covering_index = self.covering_index
+            connector.create_index(cardinality)
+
+    def delete_index(self, cardinality):
+        for connector in self._connectors_of(cardinality):
+            connector.delete_index(cardinality)
+
+    def update_metadata(self, cardinality):
+        """
+        Computes the metadata of the table with the given cardinality in
+        every shard and stores the total count of all shards in the meta
+        file.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        if cardinality == 1:
+            self.meta.update_metadata(1)
+        else:
+            for connector in self.connectors:
+                connector.update_metadata(cardinality)
+            self.update_total(cardinality)
+        self._metadata[cardinality] = True
+
+    def update_total(self, cardinality):
+        """
+        Stores the sum of the totals of the shards for the given cardinality
+        in the meta file.
+
+        Parameters
+        ----------
+        cardinality : int
+            The cardinality of the n-gram table.
+
+        """
+        total = sum(
+            connector.ngram_total(cardinality) for connector in self.connectors
+        )
+        self.meta.execute_sql(
+            "CREATE TABLE IF NOT EXISTS _totals (cardinality INTEGER PRIMARY KEY, total INTEGER);"
+        )
+        self.meta.execute_sql(
+            "DELETE FROM _totals WHERE cardinality = {0};".format(cardinality)
+        )
+        self.meta.execute_sql(
+            "INSERT INTO _totals (cardinality, total) VALUES (?, ?);",
+            [cardinality, total],
+        )
+        self.meta._metadata[cardinality] = True
+
+    def delete_metadata(self, cardinality):
+        for connector in self._connectors_of(cardinality):
+            connector.delete_metadata(cardinality)
+        self.meta.delete_metadata(cardinality)
+        self._metadata[cardinality] = False
+
+    def has_metadata(self, cardinality):
+        return self.meta.has_metadata(cardinality)
+
+    async def ahas_metadata(self, cardinality):
+        return await self.meta.ahas_metadata(cardinality)
+
+    def ngrams(self, with_counts=False):
+        """
+        Returns all ngrams that are in the table, shard by shard.
+
+        Parameters
+        ----------
+        with_counts : bool
+            Append the count to every n-gram.
+
+        Returns
+        -------
+        ngrams : generator
+            A generator for ngram tuples.
+
+        """
+        for connector in self._connectors_of(self.cardinality):
+            connector.cardinality = self.cardinality
+            for ngram in connector.ngrams(with_counts):
+                yield ngram
+
+    def ngram_total(self, cardinality):
+        if cardinality == 1 or self.has_metadata(cardinality):
+            return self.meta.ngram_total(cardinality)
+        return sum(
+            connector.ngram_total(cardinality) for connector in self.connectors
+        )
+
+    async def angram_total(self, cardinality):
+        if cardinality == 1 or await self.ahas_metadata(cardinality):
+            return await self.meta.angram_total(cardinality)
+        totals = await asyncio.gather(
+            *[connector.angram_total(cardinality) for connector in self.connectors]
+        )
+        return sum(totals)
+
+    def context_count(self, context):
+        if len(context) == 0:
+            return self.ngram_total(1)
+        return self._shard(context[0]).context_count(context)
+
+    def ngram_count(self, ngram):
+        return self._connector(ngram).ngram_count(ngram)
+
+    async def angram_count(self, ngram):
+        return await self._connector(ngram).angram_count(ngram)
+
+    def ngram_counts(self, ngrams):
+        counts = {}
+        for connector, group in self._group(ngrams).items():
+            counts.update(connector.ngram_counts(group))
+        return counts
+
+    async def angram_counts(self, ngrams):
+        groups = self._group(ngrams)
+        results = await asyncio.gather(
+            *[connector.angram_counts(group) for connector, group in groups.items()]
+        )
+        counts = {}
+        for result in results:
+            counts.update(result)
+        return counts
+
+    def ngram_like_table(self, ngram, limit=-1):
+        return self._connector(ngram).ngram_like_table(ngram, limit)
+
+    async def angram_like_table(self, ngram, limit=-1):
+        return await self._connector(ngram).angram_like_table(ngram, limit)
+
+    def ngram_like_table_filtered(self, ngram, filter, limit=-1):
+        return self._connector(ngram).ngram_like_table_filtered(ngram, filter, limit)
+
+    async def angram_like_table_filtered(self, ngram, filter, limit=-1):
+        return await self._connector(ngram).angram_like_table_filtered(
+            ngram, filter, limit
+        )
+
+    def backoff_candidates(self, ngrams, limit, filter=None):
+        # the cardinalities are usually in different shards
+        return self._backoff_candidates_by_order(ngrams, limit, filter)
+
+    async def abackoff_candidates(self, ngrams, limit, filter=None):
+        return await self._abackoff_candidates_by_order(ngrams, limit, filter)
+
+    def insert_ngram(self, ngram, count):
+        self._connector(ngram).insert_ngram(ngram, count)
+        self._add_to_total(len(ngram), count)
+
+    def insert_ngrams(self, ngram_counts):
+        groups = self._group_counts(ngram_counts)
+        for (connector, cardinality), group in groups.items():
+            connector.insert_ngrams(group)
+            self._add_to_total(cardinality, sum(count for _, count in group))
+
+    def upsert_ngrams(self, ngram_counts):
+        groups = self._group_counts(ngram_counts)
+        for (connector, cardinality), group in groups.items():
+            connector.upsert_ngrams(group)
+            self._add_to_total(cardinality, sum(count for _, count in group))
+
+    def update_ngram(self, ngram, count):
+        connector = self._connector(ngram)
+        old_count = connector.ngram_count(ngram)
+        connector.update_ngram(ngram, count)
+        self._add_to_total(len(ngram), count - old_count)
+
+    def remove_ngram(self, ngram):
+        connector = self._connector(ngram)
+        old_count = connector.ngram_count(ngram)
+        connector.remove_ngram(ngram)
+        self._add_to_total(len(ngram), -old_count)
+
+    def create_dictionary_table(self, dictionary):
+        dictionary = list(dictionary)
+        for connector in [self.meta] + self.connectors:
+            connector.create_dictionary_table(dictionary)
+
+    def delete_ngrams_not_in_dictionary(self, cardinality):
+        for connector in self._connectors_of(cardinality):
+            connector.delete_ngrams_not_in_dictionary(cardinality)
+        if cardinality > 1 and self.has_metadata(cardinality):
+            self.update_total(cardinality)
+
     def commit(self):
         """
-        Sends a commit to the database.
+        Sends a commit to the meta file and all shards.
 
         """
-        self.con.commit()
+        for connector in [self.meta] + self.connectors:
+            connector.commit()
 
     def open_database(self):
         """
-        Opens the sqlite database.
+        Opens the meta file and the shards. The number of shards of a new
+        model is stored in the table `_shards` of the meta file, a new model
+        cannot be opened read-only.
 
         """
-        self.con = sqlite3.connect(self.dbname)
+        if self.meta:
+            return
+
+        if self.read_only and not os.path.exists(self.dbname):
+            raise ValueError(
+                "The sharded model {0} does not exist.".format(self.dbname)
+            )
+        self.meta = SqliteDatabaseConnector(
+            self.dbname, self.cardinality, self.read_only, self.thread_local
+        )
+        if self.meta._table_exists("_shards"):
+            self.shards = self.meta._extract_first_integer(
+                self.meta.execute_sql("SELECT count FROM _shards;")
+            )
+        elif self.read_only:
+            self.meta.close_database()
+            self.meta = None
+            raise ValueError(
+                "{0} is not the meta file of a sharded model.".format(self.dbname)
+            )
+        elif self.shards is None:
+            self.meta.close_database()
+            self.meta = None
+            raise ValueError("The number of shards of a new model is not set.")
+        else:
+            self.meta.execute_sql("CREATE TABLE _shards (count INTEGER);")
+            self.meta.execute_sql(
+                "INSERT INTO _shards (count) VALUES (?);", [self.shards]
+            )
+            self.meta.commit()
+
+        self.connectors = [
+            SqliteDatabaseConnector(
+                shard_filename(self.dbname, index),
+                self.cardinality,
+                self.read_only,
+                self.thread_local,
+            )
+            for index in range(self.shards)
+        ]
+        self.stats = self._stats
 
     def close_database(self):
         """
-        Closes the sqlite database.
+        Closes the meta file and the shards.
 
         """
-        if self.con:
-            self.con.close()
+        for connector in self.connectors:
+            connector.close_database()
+        if self.meta:
+            self.meta.close_database()
+        self.meta = None
+        self.connectors = []
+
+    def _connector(self, ngram):
+        if len(ngram) == 1:
+            return self.meta
+        return self._shard(ngram[0])
+
+    def _shard(self, word):
+        return self.connectors[shard_index(word, self.shards)]
+
+    def _connectors_of(self, cardinality):
+        if cardinality == 1:
+            return [self.meta]
+        return self.connectors
+
+    def _group(self, ngrams):
+        groups = collections.defaultdict(list)
+        for ngram in ngrams:
+            groups[self._connector(ngram)].append(ngram)
+        return groups
+
+    def _group_counts(self, ngram_counts):
+        # the n-grams are grouped by shard and cardinality, every group is
+        # written with a single call
+        groups = collections.defaultdict(list)
+        for ngram, count in ngram_counts:
+            groups[(self._connector(ngram), len(ngram))].append((ngram, count))
+        return groups
+
+    def _add_to_total(self, cardinality, count):
+        if cardinality > 1 and self.has_metadata(cardinality):
+            self.meta.execute_statement(
+                self.meta._statement("add_to_total", cardinality), [count, cardinality]
+            )
+
+
+class CompletionIndex(object):
+    """
+    In-memory index for completing a prefix with the most frequent words.
+
+    The words are kept in an array sorted by their ASCII lower case form,
+    like the prefix lookups of the connectors. For every prefix that more
+    than `size` words start with, the `size` most frequent of these words
+    are stored, so a completion is found with one dictionary lookup. The
+    words of any other prefix are a short range of the sorted array.
+
+    """
 
-    def execute_sql(self, query):
+    def __init__(self, unigram_counts, size=DEFAULT_COMPLETION_SIZE):
         """
-        Executes a given query string on an open sqlite database.
+        Constructor for the completion index.
+
+        Parameters
+        ----------
+        unigram_counts : iterable of (str, int)
+            The words and their counts, for example the rows of
+            `ngram_like_table([""])`.
+        size : int
+            The number of completions that are stored for every prefix.
 
         """
-        c = self.con.cursor()
-        c.execute(query)
-        result = c.fetchall()
-        return result
+        self.size = size
+        entries = sorted(
+            (word.translate(_ascii_lowercase), word, int(count))
+            for word, count in unigram_counts
+        )
+        self._keys = [entry[0] for entry in entries]
+        self._words = [entry[1] for entry in entries]
+        self._counts = [entry[2] for entry in entries]
+        self._top = {}
+        if len(entries) > size:
+            self._build("", 0, len(entries))
 
+    def __len__(self):
+        return len(self._words)
 
-class PostgresDatabaseConnector(DatabaseConnector):
+    def complete(self, prefix, limit=-1):
+        """
+        Returns the most frequent words that start with a prefix, ignoring
+        the case of ASCII letters.
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix of the words.
+        limit : int
+            The maximum number of words to return, -1 for all.
+
+        Returns
+        -------
+        completions : list of tuple
+            The words and their counts, most frequent first.
+
+        """
+        return [
+            (self._words[i], self._counts[i])
+            for i in self._complete(prefix.translate(_ascii_lowercase), limit)
+        ]
+
+    def complete_filtered(self, prefix, filter, limit=-1):
+        """
+        Returns the most frequent words that continue a prefix with one of
+        the strings of a filter, like
+        `DatabaseConnector.ngram_like_table_filtered()`.
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix of the words.
+        filter : iterable of str
+            The allowed continuations of the prefix.
+        limit : int
+            The maximum number of words to return, -1 for all.
+
+        Returns
+        -------
+        completions : list of tuple
+            The words and their counts, most frequent first.
+
+        """
+        keys = set(
+            (prefix + continuation).translate(_ascii_lowercase)
+            for continuation in filter
+        )
+        candidates = set()
+        for key in keys:
+            candidates.update(self._complete(key, limit))
+        candidates = self._most_frequent(candidates, limit)
+        return [(self._words[i], self._counts[i]) for i in candidates]
+
+    def _complete(self, key, limit):
+        if 0 <= limit <= self.size:
+            top = self._top.get(key)
+            if top is not None:
+                return top[:limit]
+        low = bisect.bisect_left(self._keys, key)
+        high = bisect.bisect_left(self._keys, _prefix_successor(key), low)
+        return self._most_frequent(range(low, high), limit)
+
+    def _most_frequent(self, indexes, limit):
+        counts = self._counts
+        if 0 <= limit < len(indexes):
+            return heapq.nsmallest(limit, indexes, key=lambda i: (-counts[i], i))
+        return sorted(indexes, key=lambda i: (-counts[i], i))
+
+    def _build(self, prefix, low, high):
+        # stores the most frequent words of all prefixes in the range of the
+        # given prefix that have more than `size` words, and returns them for
+        # the given prefix
+        depth = len(prefix)
+        candidates = []
+        i = low
+        while i < high and len(self._keys[i]) == depth:
+            candidates.append(i)
+            i += 1
+        while i < high:
+            child = prefix + self._keys[i][depth]
+            end = bisect.bisect_left(self._keys, _prefix_successor(child), i, high)
+            if end - i > self.size:
+                candidates += self._build(child, i, end)
+            else:
+                candidates += range(i, end)
+            i = end
+        top = self._most_frequent(candidates, self.size)
+        self._top[prefix] = top
+        return top
+
+
+class QueryTotals(object):
     """
-    Database connector for postgres databases.
+    Number of queries, time spent in queries and rows returned by queries in
+    a scope of the query statistics, for example a single prediction.
 
     """
 
-    def __init__(
-        self,
-        dbname,
-        cardinality=1,
-        host="localhost",
-        port=5432,
-        user="postgres",
-        password=None,
-        connection=None,
-    ):
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.statements = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, statement, seconds, rows):
         """
-        Constructor for the postgres database connector.
+        Adds a query to the totals. The queries of a scope may run in several
+        threads, for example in the executor of the async methods.
 
         Parameters
         ----------
-        dbname : str
-            the database name
-        cardinality : int
-            default cardinality for n-grams
-        host : str
-            hostname of the postgres database
-        port : int
-            port number of the postgres database
-        user : str
-            user name for the postgres database
-        password: str
-            user password for the postgres database
-        connection : connection
-            an open database connection
+        statement : str
+            The SQL query or statement template.
+        seconds : float
+            The time the query took.
+        rows : int
+            The number of rows returned by the query.
 
         """
-        DatabaseConnector.__init__(self, dbname, cardinality)
-        self.con = connection
-        self.host = host
-        self.port = port
-        self.user = user
-        self.password = password
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+            self.rows += rows
+            self.statements[statement] += 1
+
+    def __repr__(self):
+        return "QueryTotals(queries={0}, seconds={1:.6f}, rows={2})".format(
+            self.queries, self.seconds, self.rows
+        )
 
-    def create_database(self):
+
+class StatementStatistics(object):
+    """
+    Statistics of the executions of a single statement template.
+
+    """
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(buckets) + 1)
+
+    @property
+    def mean_seconds(self):
+        if self.count == 0:
+            return 0.0
+        return self.seconds / self.count
+
+
+SlowQuery = collections.namedtuple(
+    "SlowQuery", ["statement", "params", "seconds", "plan"]
+)
+
+
+class QueryStatistics(object):
+    """
+    Statistics of the queries of database connectors. The statistics are
+    kept per statement template: the number of executions, the time spent,
+    the number of rows returned and a latency histogram. Queries slower than
+    a threshold are kept in a log together with their query plan.
+
+    A connector records its queries if its `stats` attribute is set to an
+    instance of this class. Several connectors may share one instance.
+
+    """
+
+    def __init__(self, slow_query_threshold=None, buckets=LATENCY_BUCKETS):
         """
-        Creates an empty database if not exists.
+        Constructor of the query statistics.
+
+        Parameters
+        ----------
+        slow_query_threshold : float
+            Queries that take at least this many seconds are logged with
+            their query plan. No queries are logged if it is None.
+        buckets : tuple of float
+            The sorted upper bounds of the buckets of the latency histograms
+            in seconds.
+
         """
-        if not self._database_exists():
-            con = psycopg2.connect(
-                host=self.host,
-                database="postgres",
-                user=self.user,
-                password=self.password,
-                port=self.port,
-            )
-            con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-            query = "CREATE DATABASE {0};".format(self.dbname)
-            c = con.cursor()
-            c.execute(query)
-            con.close()
+        self.slow_query_threshold = slow_query_threshold
+        self.buckets = buckets
+        self.statements = {}
+        self.slow_queries = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._lock = threading.Lock()
 
-            if self.normalize:
-                self.open_database()
-                query = 'CREATE EXTENSION IF NOT EXISTS "plperlu";'
-                self.execute_sql(query)
-                query = """CREATE OR REPLACE FUNCTION normalize(text)
-      RETURNS text
-    AS $$
-        use Text::Unidecode;
-        return unidecode(shift);
-    $$ LANGUAGE plperlu IMMUTABLE;"""
-                self.execute_sql(query)
-                self.commit()
-                self.close_database()
+    def record(self, connector, statement, params, seconds, result):
+        """
+        Records the execution of a query.
+
+        Parameters
+        ----------
+        connector : DatabaseConnector
+            The connector that executed the query.
+        statement : str
+            The SQL query or statement template.
+        params : list
+            The values for the parameters of the query, the first parameters
+            for a statement that was executed for a sequence of parameters.
+        seconds : float
+            The time the query took.
+        result : list
+            The rows returned by the query.
 
-    def reset_database(self):
         """
-        Re-create an empty database.
+        rows = len(result) if isinstance(result, list) else 0
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                stats = self.statements[statement] = StatementStatistics(
+                    self.buckets
+                )
+            stats.count += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.rows += rows
+            stats.histogram[bucket] += 1
+
+        totals = _query_scope.get()
+        if totals is not None:
+            totals.add(statement, seconds, rows)
+
+        if (
+            self.slow_query_threshold is not None
+            and seconds >= self.slow_query_threshold
+        ):
+            try:
+                plan = connector.explain(statement, params)
+            except Exception:
+                plan = None
+            self.slow_queries.append(SlowQuery(statement, params, seconds, plan))
 
+    @contextlib.contextmanager
+    def scope(self):
         """
-        if self._database_exists():
-            con = psycopg2.connect(
-                host=self.host,
-                database="postgres",
-                user=self.user,
-                password=self.password,
-                port=self.port,
-            )
-            con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-            query = "DROP DATABASE {0};".format(self.dbname)
-            c = con.cursor()
-            c.execute(query)
-            con.close()
-        self.create_database()
+        Counts the queries that are run in the current thread or task in
+        separate totals while the context is active. Scopes may be nested,
+        the queries are counted in the innermost scope only.
+
+        Returns
+        -------
+        totals : QueryTotals
+            The totals of the queries of the scope.
 
-    def create_index(self, cardinality):
         """
-        Create an index for the table with the given cardinality.
+        totals = QueryTotals()
+        token = _query_scope.set(totals)
+        try:
+            yield totals
+        finally:
+            _query_scope.reset(token)
+            _last_query_scope.set(totals)
+
+    def last_totals(self):
+        """
+        Returns the totals of the last scope that ended in the current thread
+        or task, or None if there was none.
 
-        Parameters
-        ----------
-        cardinality : int
-            The cardinality to create a index for.
+        """
+        return _last_query_scope.get()
 
+    def totals(self):
         """
-        DatabaseConnector.create_index(self, cardinality)
-        query = "CREATE INDEX idx_{0}_gram_varchar ON _{0}_gram(word varchar_pattern_ops);".format(
-            cardinality
-        )
-        self.execute_sql(query)
+        Returns the totals of all recorded queries.
 
-        if self.lowercase:
-            for i in reversed(range(cardinality)):
-                if i != 0:
-                    query = "CREATE INDEX idx_{0}_gram_{1}_lower ON _{0}_gram(LOWER(word_{1}));".format(
-                        cardinality, i
-                    )
-                    self.execute_sql(query)
+        Returns
+        -------
+        totals : QueryTotals
+            The totals of all queries.
 
-            if self.normalize:
-                query = "CREATE INDEX idx_{0}_gram_lower_normalized_varchar ON _{0}_gram(NORMALIZE(LOWER(word)) varchar_pattern_ops);".format(
-                    cardinality
-                )
-                self.execute_sql(query)
+        """
+        totals = QueryTotals()
+        with self._lock:
+            for statement, stats in self.statements.items():
+                totals.queries += stats.count
+                totals.seconds += stats.seconds
+                totals.rows += stats.rows
+                totals.statements[statement] = stats.count
+        return totals
+
+    def reset(self):
+        """
+        Deletes all statistics and the log of slow queries.
 
-            else:
-                query = "CREATE INDEX idx_{0}_gram_lower_varchar ON _{0}_gram(LOWER(word) varchar_pattern_ops);".format(
-                    cardinality
-                )
-                self.execute_sql(query)
+        """
+        with self._lock:
+            self.statements = {}
+            self.slow_queries.clear()
 
-        elif self.normalize:
-            query = "CREATE INDEX idx_{0}_gram_normalized_varchar ON _{0}_gram(NORMALIZE(word) varchar_pattern_ops);".format(
-                cardinality
-            )
-            self.execute_sql(query)
 
-    def delete_index(self, cardinality):
+class PoolException(Exception):
+    pass
+
+
+class PoolTimeoutException(PoolException):
+    pass
+
+
+class PostgresConnectionPool(object):
+    """
+    Thread-safe pool of open postgres connections.
+
+    Connections are opened on demand up to a maximum size and handed out
+    most recently used first. A connection that was idle for longer than the
+    health check interval is tested with a query before it is handed out and
+    replaced if it is broken.
+
+    """
+
+    def __init__(
+        self, connect, min_size=1, max_size=10, timeout=30.0, health_check_interval=60.0
+    ):
         """
-        Delete index for the table with the given cardinality.
+        Constructor for the connection pool.
 
         Parameters
         ----------
-        cardinality : int
-            The cardinality of the index to delete.
+        connect : callable
+            function without arguments that opens a new connection
+        min_size : int
+            number of connections that are opened in advance
+        max_size : int
+            maximum number of open connections
+        timeout : float
+            seconds to wait for a free connection before a
+            `PoolTimeoutException` is raised
+        health_check_interval : float
+            seconds a connection may be idle before it is checked on checkout
 
         """
-        DatabaseConnector.delete_index(self, cardinality)
-
-        query = "DROP INDEX IF EXISTS idx_{0}_gram_varchar;".format(cardinality)
-        self.execute_sql(query)
-        query = "DROP INDEX IF EXISTS idx_{0}_gram_normalized_varchar;".format(
-            cardinality
-        )
-        self.execute_sql(query)
-        query = "DROP INDEX IF EXISTS idx_{0}_gram_lower_varchar;".format(cardinality)
-        self.execute_sql(query)
-        query = "DROP INDEX IF EXISTS idx_{0}_gram_lower_normalized_varchar;".format(
-            cardinality
-        )
-        self.execute_sql(query)
-        for i in reversed(range(cardinality)):
-            if i != 0:
-                query = "DROP INDEX IF EXISTS idx_{0}_gram_{1}_lower;".format(
-                    cardinality, i
-                )
-                self.execute_sql(query)
-
-    def commit(self):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        for i in range(min_size):
+            self._idle.append((self._open_connection(), time.monotonic()))
+            self._size += 1
+
+    @property
+    def closed(self):
         """
-        Sends a commit to the database.
+        Whether the pool was closed with `close()`.
 
         """
-        self.con.commit()
+        return self._closed
 
-    def open_database(self):
+    @property
+    def size(self):
         """
-        Opens the sqlite database.
+        The number of open connections, both idle and checked out.
 
         """
-        if not self.con:
-            try:
-                self.con = psycopg2.connect(
-                    host=self.host,
-                    database=self.dbname,
-                    user=self.user,
-                    password=self.password,
-                    port=self.port,
-                )
-            except psycopg2.Error as e:
-                print("Error while opening database:")
-                print(e.pgerror)
+        with self._condition:
+            return self._size
 
-    def close_database(self):
+    def getconn(self):
         """
-        Closes the sqlite database.
+        Checks out a connection. Waits for a connection to be returned if the
+        pool has reached its maximum size.
+
+        Returns
+        -------
+        con : connection
+            An open database connection.
 
         """
-        if self.con:
-            self.con.close()
-            self.con = None
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolException("The connection pool is closed.")
+                if self._idle:
+                    con, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    con = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutException(
+                        "No connection available after {0} seconds.".format(
+                            self.timeout
+                        )
+                    )
+                self._condition.wait(remaining)
+
+        if con is not None and self._is_healthy(con, last_used):
+            return con
+        if con is not None:
+            self._close_connection(con)
+        try:
+            return self._open_connection()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def putconn(self, con, discard=False):
+        """
+        Returns a checked out connection to the pool.
+
+        Parameters
+        ----------
+        con : connection
+            The connection from `getconn()`.
+        discard : bool
+            Close the connection instead of keeping it for later checkouts.
 
-    def execute_sql(self, query):
         """
-        Executes a given query string on an open postgres database.
+        if discard or con.closed or self._closed:
+            self._close_connection(con)
+            self._release_slot()
+            return
+        with self._condition:
+            self._idle.append((con, time.monotonic()))
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Context manager that checks out a connection and returns it to the
+        pool afterwards.
 
         """
-        c = self.con.cursor()
-        c.execute(query)
-        result = []
-        if c.rowcount > 0:
-            try:
-                result = c.fetchall()
-            except psycopg2.ProgrammingError:
-                pass
-        return result
+        con = self.getconn()
+        try:
+            yield con
+        finally:
+            self.putconn(con)
 
-    def _database_exists(self):
+    def close(self):
         """
-        Check if the database exists.
+        Closes all idle connections. Connections that are checked out are
+        closed when they are returned.
 
         """
-        con = psycopg2.connect(
-            host=self.host,
-            database="postgres",
-            user=self.user,
-            password=self.password,
-            port=self.port,
-        )
-        query_check = "select datname from pg_catalog.pg_database"
-        query_check += " where datname = '{0}';".format(self.dbname)
-        c = con.cursor()
-        c.execute(query_check)
-        result = c.fetchall()
-        if len(result) > 0:
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._closed = True
+            self._condition.notify_all()
+        for con, _ in idle:
+            self._close_connection(con)
+
+    def _open_connection(self):
+        con = self._connect()
+        con.autocommit = True
+        return con
+
+    def _close_connection(self, con):
+        try:
+            con.close()
+        except Exception:
+            pass
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _is_healthy(self, con, last_used):
+        if con.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
             return True
-        return False
+        try:
+            c = con.cursor()
+            c.execute("SELECT 1;")
+            c.fetchall()
+        except Exception:
+            return False
+        return True
+
+
+def get_connection_pool(
+    dbname,
+    host="localhost",
+    port=5432,
+    user="postgres",
+    password=None,
+    min_size=1,
+    max_size=10,
+    timeout=30.0,
+    health_check_interval=60.0,
+):
+    """
+    Returns the process-wide connection pool for the given connection
+    parameters. The pool is created on the first call or when the previous
+    pool was closed, the sizes, timeout and health check interval of later
+    calls are ignored.
+
+    Parameters
+    ----------
+    dbname : str
+        the database name
+    host : str
+        hostname of the postgres database
+    port : int
+        port number of the postgres database
+    user : str
+        user name for the postgres database
+    password: str
+        user password for the postgres database
+    min_size : int
+        number of connections that are opened in advance
+    max_size : int
+        maximum number of open connections
+    timeout : float
+        seconds to wait for a free connection
+    health_check_interval : float
+        seconds a connection may be idle before it is checked on checkout
+
+    Returns
+    -------
+    pool : PostgresConnectionPool
+        The shared connection pool.
+
+    """
+    key = (dbname, host, str(port), user, password)
+    with _connection_pools_lock:
+        pool = _connection_pools.get(key)
+        if pool is None or pool.closed:
+
+            def connect():
+                return psycopg2.connect(
+                    host=host, database=dbname, user=user, password=password, port=port
+                )
+
+            pool = PostgresConnectionPool(
+                connect, min_size, max_size, timeout, health_check_interval
+            )
+            _connection_pools[key] = pool
+        return pool
+
+
+async def close_async_connection_pools():
+    """
+    Closes the async postgres connection pools of the running event loop.
+
+    """
+    pools = _async_connection_pools.pop(asyncio.get_running_loop(), {})
+    for pool in pools.values():
+        try:
+            pool = await pool
+        except Exception:
+            continue
+        await pool.close()
 
-    def _build_where_like_clause(self, ngram):
-        where_clause = " WHERE"
-        for i in range(len(ngram)):
-            if i < (len(ngram) - 1):
-                if self.lowercase:
-                    where_clause += " LOWER(word_{0}) = LOWER('{1}') AND".format(
-                        len(ngram) - i - 1, ngram[i]
-                    )
-                else:
-                    where_clause += " word_{0} = '{1}' AND".format(
-                        len(ngram) - i - 1, ngram[i]
-                    )
-            else:
-                if ngram[-1] != "":
-                    if self.lowercase:
-                        if self.normalize:
-                            where_clause += " NORMALIZE(LOWER(word)) LIKE NORMALIZE(LOWER('{0}%'))".format(
-                                ngram[-1]
-                            )
-                        else:
-                            where_clause += " LOWER(word) LIKE LOWER('{0}%')".format(
-                                ngram[-1]
-                            )
-                    elif self.normalize:
-                        where_clause += " NORMALIZE(word) LIKE NORMALIZE('{0}%')".format(
-                            ngram[-1]
-                        )
-                    else:
-                        where_clause += " word LIKE '{0}%'".format(ngram[-1])
-                else:
-                    # remove the " AND"
-                    where_clause = where_clause[:-4]
 
-        return where_clause
+def shard_filename(dbname, index):
+    """
+    Returns the path of a shard of a sharded model, see
+    `ShardedDatabaseConnector`. The index of the shard is inserted before the
+    extension of the meta file, for example `model.0.db` for `model.db`.
+
+    Parameters
+    ----------
+    dbname : str
+        Path of the meta file.
+    index : int
+        The index of the shard.
+
+    Returns
+    -------
+    filename : str
+        The path of the shard.
+
+    """
+    root, ext = os.path.splitext(dbname)
+    return "{0}.{1}{2}".format(root, index, ext)
+
+
+def shard_index(word, shards):
+    """
+    Returns the index of the shard that stores the n-grams that start with
+    the given word, the CRC-32 of the UTF-8 encoded word modulo the number of
+    shards.
+
+    Parameters
+    ----------
+    word : str
+        The first word of an n-gram.
+    shards : int
+        The number of shards.
+
+    Returns
+    -------
+    index : int
+        The index of the shard.
+
+    """
+    return zlib.crc32(word.encode("utf-8")) % shards
+
+
+def merge_candidates(candidates, seen, words, limit):
+    """
+    Appends the words that are not yet candidates to a list of candidates,
+    until the list has `limit` candidates.
+
+    Parameters
+    ----------
+    candidates : list of str
+        The candidates.
+    seen : set of str
+        The words of the candidates.
+    words : iterable of str
+        The new words.
+    limit : int
+        The maximum number of candidates.
+
+    """
+    for word in words:
+        if len(candidates) >= limit:
+            break
+        if word not in seen:
+            seen.add(word)
+            candidates.append(word)
+
+
+def _prefix_successor(prefix):
+    """
+    Returns the smallest string that is greater than all strings that start
+    with the given prefix.
+
+    """
+    chars = list(prefix)
+    while len(chars) > 0 and chars[-1] == "\U0010ffff":
+        chars.pop()
+    if len(chars) == 0:
+        return prefix + "\U0010ffff"
+    code_point = ord(chars[-1]) + 1
+    if 0xD800 <= code_point <= 0xDFFF:
+        # surrogates cannot be encoded
+        code_point = 0xE000
+    chars[-1] = chr(code_point)
+    return "".join(chars)
 
 
 def insert_ngram_map_sqlite(
-    ngram_map, ngram_size, outfile, append=False, create_index=False
+    ngram_map,
+    ngram_size,
+    outfile,
+    append=False,
+    create_index=False,
+    batch_size=DEFAULT_BATCH_SIZE,
+    progress=None,
+    metadata=True,
+    covering_index=False,
+    integer_ids=False,
+    without_rowid=False,
 ):
-    sql = SqliteDatabaseConnector(outfile, ngram_size)
-    sql.create_ngram_table(ngram_size)
+    """
+    Writes the n-grams of an n-gram map to a table in a sqlite database.
+
+    The n-grams are written in sorted order and in batches, while the
+    database runs with the relaxed `SQLITE_BUILD_PRAGMAS`. The previous
+    pragmas are restored when all n-grams are written.
+
+    Parameters
+    ----------
+    ngram_map : NgramMap
+        The n-grams and their counts.
+    ngram_size : int
+        The cardinality of the n-grams.
+    outfile : str
+        Path to the sqlite database.
+    append : bool
+        Add the counts to the existing n-grams in the table, n-grams that are
+        not in the table yet are inserted.
+    create_index : bool
+        Create the indexes for the table after all n-grams are written.
+    batch_size : int
+        The number of n-grams that are written with a single call.
+    progress : callable
+        Called after every batch with the number of n-grams written so far
+        and the number of n-grams written per second.
+    metadata : bool
+        Create the metadata with the total and context counts for the table,
+        see `DatabaseConnector.update_metadata()`.
+    covering_index : bool
+        Create covering composite indexes, see
+        `DatabaseConnector.create_index()`.
+    integer_ids : bool
+        Store the words in the table `_vocab` and their ids in the n-gram
+        table, see `DatabaseConnector.create_vocabulary_table()`. The tokens
+        of the n-gram map are added to the vocabulary once and the n-grams
+        are written as ids without looking up their words.
+    without_rowid : bool
+        Create a new table as `WITHOUT ROWID` table, see
+        `SqliteDatabaseConnector.create_ngram_table()`.
 
-    for ngram, count in ngram_map.items():
-        if append:
-            old_count = sql.ngram_count(ngram)
-            if old_count > 0:
-                sql.update_ngram(ngram, old_count + count)
-            else:
-                sql.insert_ngram(ngram, count)
+    """
+    sql = SqliteDatabaseConnector(outfile, ngram_size, integer_ids=integer_ids)
+    sql.covering_index = covering_index
+    sql.create_ngram_table(ngram_size, without_rowid=without_rowid)
+
+    pragmas = dict(SQLITE_BUILD_PRAGMAS)
+    if append:
+        # keep a journal so that a failed update does not corrupt the model
+        pragmas["journal_mode"] = "WAL"
+    previous_pragmas = sql.set_pragmas(pragmas)
+
+    try:
+        if sql.integer_ids:
+            tokens = ngram_map.tokens()
+            sql.add_words(tokens)
+            vocabulary = sql.vocabulary()
+            ids = {index: vocabulary[token] for token, index in tokens.items()}
+            del tokens, vocabulary
+
+            # sorted rows append to the b-tree of the unique index instead of
+            # splitting random pages
+            ngram_counts = sorted(
+                (tuple(ids[index] for index in indices), count)
+                for indices, count in ngram_map.index_items()
+            )
+            _write_batches(
+                lambda batch: sql.insert_ngram_ids(batch, append),
+                ngram_counts,
+                batch_size,
+                progress,
+            )
         else:
-            sql.insert_ngram(ngram, count)
-
-    sql.commit()
+            ngram_counts = sorted(
+                (tuple(ngram), count) for ngram, count in ngram_map.items()
+            )
+            if append:
+                _write_batches(sql.upsert_ngrams, ngram_counts, batch_size, progress)
+            else:
+                _write_batches(sql.insert_ngrams, ngram_counts, batch_size, progress)
+
+        # existing metadata is updated along with the n-grams
+        if metadata and not sql.has_metadata(ngram_size):
+            sql.update_metadata(ngram_size)
+
+        # all batches are written in a single transaction
+        sql.commit()
+    except BaseException:
+        # the pragmas cannot be changed inside of the failed transaction
+        sql.rollback()
+        sql.set_pragmas(previous_pragmas)
+        sql.close_database()
+        raise
+    sql.set_pragmas(previous_pragmas)
 
     if create_index and not append:
         sql.create_index(ngram_size)
@@ -680,6 +4894,126 @@ def insert_ngram_map_sqlite(
     sql.close_database()
 
 
+def insert_ngram_map_sharded(
+    ngram_map,
+    ngram_size,
+    outfile,
+    shards=None,
+    append=False,
+    create_index=False,
+    batch_size=DEFAULT_BATCH_SIZE,
+    progress=None,
+    metadata=True,
+    covering_index=False,
+    integer_ids=False,
+    without_rowid=False,
+    processes=None,
+):
+    """
+    Writes the n-grams of an n-gram map to a sharded model, see
+    `ShardedDatabaseConnector`. Unigrams are written to the meta file. The
+    n-grams of higher cardinalities are split by shard and the shards are
+    written in parallel processes with `insert_ngram_map_sqlite()`, a shard
+    is only built from the n-gram map when a process is free. The total
+    count of all shards is stored in the meta file afterwards.
+
+    Parameters
+    ----------
+    ngram_map : NgramMap
+        The n-grams and their counts.
+    ngram_size : int
+        The cardinality of the n-grams.
+    outfile : str
+        Path to the meta file of the model.
+    shards : int
+        The number of shards of a new model.
+    append : bool
+        Add the counts to the existing n-grams in the table, n-grams that are
+        not in the table yet are inserted.
+    create_index : bool
+        Create the indexes for the table after all n-grams are written.
+    batch_size : int
+        The number of n-grams that are written with a single call.
+    progress : callable
+        Called after every shard with the number of n-grams written so far
+        and the number of n-grams written per second.
+    metadata : bool
+        Create the metadata with the total and context counts for the table,
+        see `DatabaseConnector.update_metadata()`.
+    covering_index : bool
+        Create covering composite indexes, see
+        `DatabaseConnector.create_index()`.
+    integer_ids : bool
+        Store the ids of the words in the n-gram tables, see
+        `insert_ngram_map_sqlite()`.
+    without_rowid : bool
+        Create new tables as `WITHOUT ROWID` tables, see
+        `SqliteDatabaseConnector.create_ngram_table()`.
+    processes : int
+        The maximum number of processes that write shards, by default the
+        number of processors.
+
+    """
+    sql = ShardedDatabaseConnector(outfile, ngram_size, shards)
+    shards = sql.shards
+    sql.close_database()
+
+    options = dict(
+        append=append,
+        create_index=create_index,
+        batch_size=batch_size,
+        metadata=metadata,
+        covering_index=covering_index,
+        integer_ids=integer_ids,
+        without_rowid=without_rowid,
+    )
+    if ngram_size == 1:
+        insert_ngram_map_sqlite(ngram_map, 1, outfile, progress=progress, **options)
+        return
+
+    start = time.time()
+    written = 0
+
+    def report(futures):
+        nonlocal written
+        for future in futures:
+            future.result()
+            written += pending.pop(future)
+            if progress:
+                progress(written, written / max(time.time() - start, 1e-6))
+
+    # the shards are built one at a time and only while a process is free,
+    # so that at most one shard per process is held besides the n-gram map
+    workers = processes or os.cpu_count() or 1
+    pending = {}
+    with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+        for index in range(shards):
+            if len(pending) >= workers:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                report(done)
+            shard_map = ngram_map.part(index, lambda word: shard_index(word, shards))
+            future = executor.submit(
+                insert_ngram_map_sqlite,
+                shard_map,
+                ngram_size,
+                shard_filename(outfile, index),
+                **options
+            )
+            pending[future] = len(shard_map)
+            del shard_map
+        report(concurrent.futures.as_completed(list(pending)))
+
+    sql = ShardedDatabaseConnector(outfile, ngram_size)
+    try:
+        if metadata or sql.has_metadata(ngram_size):
+            sql.update_total(ngram_size)
+            sql.commit()
+    finally:
+        sql.close_database()
+
+
 def insert_ngram_map_postgres(
     ngram_map,
     ngram_size,
@@ -692,26 +5026,109 @@ def insert_ngram_map_postgres(
     password=None,
     lowercase=False,
     normalize=False,
+    batch_size=DEFAULT_BATCH_SIZE,
+    progress=None,
+    metadata=True,
+    covering_index=False,
+    integer_ids=False,
+    server_side_prediction=False,
 ):
+    """
+    Writes the n-grams of an n-gram map to a table in a postgres database.
+
+    The n-grams are streamed to the server with `COPY FROM STDIN`. A new
+    table gets its unique constraint and indexes only after all n-grams are
+    loaded. In append mode the n-grams are copied to an unlogged staging
+    table and then merged into the n-gram table with a single statement.
+
+    Parameters
+    ----------
+    ngram_map : NgramMap
+        The n-grams and their counts.
+    ngram_size : int
+        The cardinality of the n-grams.
+    dbname : str
+        The database name.
+    append : bool
+        Add the counts to the existing n-grams in the table, n-grams that are
+        not in the table yet are inserted.
+    create_index : bool
+        Create the indexes for the table after all n-grams are written.
+    host : str
+        hostname of the postgres database
+    port : int
+        port number of the postgres database
+    user : str
+        user name for the postgres database
+    password: str
+        user password for the postgres database
+    lowercase : bool
+        Create the indexes for lowercase mode.
+    normalize : bool
+        Create the indexes for normalize mode.
+    batch_size : int
+        The number of n-grams that are copied with a single call.
+    progress : callable
+        Called after every batch with the number of n-grams written so far
+        and the number of n-grams written per second.
+    metadata : bool
+        Create the metadata with the total and context counts for the table,
+        see `DatabaseConnector.update_metadata()`.
+    covering_index : bool
+        Create covering composite indexes, see
+        `DatabaseConnector.create_index()`.
+    integer_ids : bool
+        Store the words in the table `_vocab` and their ids in the n-gram
+        table, see `DatabaseConnector.create_vocabulary_table()`.
+    server_side_prediction : bool
+        Install the prediction function for the cardinality, see
+        `PostgresDatabaseConnector.create_prediction_function()`.
+
+    """
     sql = PostgresDatabaseConnector(dbname, ngram_size, host, port, user, password)
     sql.lowercase = lowercase
     sql.normalize = normalize
+    sql.covering_index = covering_index
+    sql.integer_ids = integer_ids
+    sql.server_side_prediction = server_side_prediction
     sql.create_database()
     sql.open_database()
-    if not append:
+
+    ngram_counts = ngram_map.items()
+    if append:
+        sql.create_ngram_table(ngram_size)
+    else:
         sql.delete_index(ngram_size)
         sql.delete_ngram_table(ngram_size)
-    sql.create_ngram_table(ngram_size)
+        sql.create_ngram_table(ngram_size, unique=False)
+
+    ids = None
+    if sql.integer_ids:
+        # the vocabulary is loaded once instead of for every batch
+        sql.add_words(ngram_map.tokens())
+        ids = sql.vocabulary()
+
+    if append:
+        sql.create_staging_table(ngram_size)
+        _write_batches(
+            lambda batch: sql.copy_ngrams(batch, staging=True, ids=ids),
+            ngram_counts,
+            batch_size,
+            progress,
+        )
+        sql.merge_staging_table(ngram_size)
+    else:
+        _write_batches(
+            lambda batch: sql.copy_ngrams(batch, ids=ids),
+            ngram_counts,
+            batch_size,
+            progress,
+        )
+        sql.create_unique_constraint(ngram_size)
 
-    for ngram, count in ngram_map.items():
-        if append:
-            old_count = sql.ngram_count(ngram)
-            if old_count > 0:
-                sql.update_ngram(ngram, old_count + count)
-            else:
-                sql.insert_ngram(ngram, count)
-        else:
-            sql.insert_ngram(ngram, count)
+    # the merge updates existing metadata along with the n-grams
+    if metadata and not sql.has_metadata(ngram_size):
+        sql.update_metadata(ngram_size)
 
     sql.commit()
 
@@ -723,14 +5140,26 @@ def insert_ngram_map_postgres(
     sql.close_database()
 
 
+def _write_batches(write, ngram_counts, batch_size, progress=None):
+    start = time.time()
+    written = 0
+    ngram_counts = iter(ngram_counts)
+    while True:
+        batch = list(itertools.islice(ngram_counts, batch_size))
+        if len(batch) == 0:
+            break
+        write(batch)
+        written += len(batch)
+        if progress:
+            progress(written, written / max(time.time() - start, 1e-6))
+
+
 def _filter_ngrams(sql, dictionary):
-    for ngram in sql.ngrams():
-        delete_ngram = False
-        for word in ngram:
-            if word not in dictionary:
-                delete_ngram = True
-        if delete_ngram:
-            sql.remove_ngram(ngram)
+    sql.create_dictionary_table(dictionary)
+    sql.delete_ngrams_not_in_dictionary(sql.cardinality)
+    sql.execute_sql("DROP TABLE _dictionary;")
+    if sql.has_metadata(sql.cardinality):
+        sql.update_metadata(sql.cardinality)
 
 
 def filter_ngrams_sqlite(dictionary, ngram_size, outfile):
@@ -756,3 +5185,288 @@ def filter_ngrams_postgres(
 
     sql.commit()
     sql.close_database()
+
+
+def prune_ngrams(sql, ngram_size, min_counts=None, top_k=None, threshold=None):
+    """
+    Prunes the n-gram tables of a database. The tables are pruned from the
+    highest cardinality down, so the relative entropies are computed against
+    the unpruned lower orders. The metadata is computed first if it is
+    missing and then kept, so the context counts and totals still describe
+    the full model and the probabilities of the remaining n-grams do not
+    change.
+
+    Parameters
+    ----------
+    sql : DatabaseConnector
+        The open database.
+    ngram_size : int
+        The highest cardinality of the n-grams, the tables `_1_gram` up to
+        `_<ngram_size>_gram` are pruned.
+    min_counts : dict
+        Maps cardinalities to the lowest count of the n-grams that are kept.
+    top_k : int
+        The number of n-grams that are kept for every context in the tables
+        with a cardinality greater than 1.
+    threshold : float
+        Delete the n-grams with a cardinality greater than 1 whose relative
+        entropy is lower than the threshold, see
+        `DatabaseConnector.relative_entropies()`.
+
+    Returns
+    -------
+    pruned : dict
+        Maps the cardinalities to the number of deleted n-grams.
+
+    """
+    cardinalities = [
+        cardinality
+        for cardinality in range(1, ngram_size + 1)
+        if sql._table_exists("_{0}_gram".format(cardinality))
+    ]
+    for cardinality in cardinalities:
+        if not sql.has_metadata(cardinality):
+            sql.update_metadata(cardinality)
+
+    pruned = {}
+    for cardinality in reversed(cardinalities):
+        rows = sql.count_ngrams(cardinality)
+        if threshold is not None and cardinality > 1:
+            sql.delete_ngram_keys(
+                cardinality,
+                (
+                    key
+                    for key, entropy in sql.relative_entropies(cardinality)
+                    if entropy < threshold
+                ),
+            )
+        if min_counts and cardinality in min_counts:
+            sql.delete_rare_ngrams(cardinality, min_counts[cardinality])
+        if top_k is not None and cardinality > 1:
+            sql.keep_top_ngrams(cardinality, top_k)
+        pruned[cardinality] = rows - sql.count_ngrams(cardinality)
+
+    sql.commit()
+    return pruned
+
+
+def prune_ngrams_sqlite(
+    outfile,
+    ngram_size,
+    min_counts=None,
+    top_k=None,
+    threshold=None,
+    probes=DEFAULT_LATENCY_PROBES,
+):
+    """
+    Prunes the n-gram tables of a sqlite database with `prune_ngrams()` and
+    compacts the file. The indexes of the pruned tables are rebuilt, then
+    the database is vacuumed and analyzed. The latency of lookups is
+    measured before and after with `ngram_like_table()` for the most
+    frequent contexts of the highest cardinality.
+
+    Parameters
+    ----------
+    outfile : str
+        Path to the sqlite database.
+    ngram_size : int
+        The highest cardinality of the n-grams.
+    min_counts : dict
+        Maps cardinalities to the lowest count of the n-grams that are kept.
+    top_k : int
+        The number of n-grams that are kept for every context.
+    threshold : float
+        The lowest relative entropy of the n-grams that are kept.
+    probes : int
+        The number of contexts that are looked up to measure the latency.
+
+    Returns
+    -------
+    report : dict
+        The number of deleted n-grams per cardinality as `pruned`, the
+        sizes of the file in bytes before and after as `size` and the mean
+        seconds per lookup before and after as `latency`.
+
+    """
+    size = os.path.getsize(outfile)
+    sql = SqliteDatabaseConnector(outfile, ngram_size)
+    try:
+        contexts = _latency_contexts(sql, ngram_size, probes)
+        latency = _lookup_latency(sql, contexts)
+
+        indexes = {
+            cardinality: sql.index_names(cardinality)
+            for cardinality in range(1, ngram_size + 1)
+        }
+        for cardinality, names in indexes.items():
+            if len(names) > 0:
+                sql.delete_index(cardinality)
+
+        pruned = prune_ngrams(sql, ngram_size, min_counts, top_k, threshold)
+
+        for cardinality, names in indexes.items():
+            if len(names) > 0:
+                sql.covering_index = "idx_{0}_gram_top".format(cardinality) in names
+                sql.create_index(cardinality)
+        sql.commit()
+        sql.execute_sql("VACUUM;")
+        sql.execute_sql("ANALYZE;")
+
+        report = {
+            "pruned": pruned,
+            "size": (size, os.path.getsize(outfile)),
+            "latency": (latency, _lookup_latency(sql, contexts)),
+        }
+    finally:
+        sql.close_database()
+    return report
+
+
+def _latency_contexts(sql, ngram_size, probes):
+    while ngram_size > 1 and not sql._table_exists("_{0}_gram".format(ngram_size)):
+        ngram_size -= 1
+    columns = sql._column_names(ngram_size)[:-1]
+    if len(columns) == 0:
+        return [()] * min(probes, 1)
+    query = "SELECT {0} FROM _{1}_gram GROUP BY {2} ORDER BY SUM(count) DESC LIMIT {3};".format(
+        ", ".join(
+            sql._word_column("_{0}_gram.{1}".format(ngram_size, column))
+            for column in columns
+        ),
+        ngram_size,
+        ", ".join(columns),
+        int(probes),
+    )
+    return [tuple(row) for row in sql.execute_sql(query)]
+
+
+def _lookup_latency(sql, contexts):
+    if len(contexts) == 0:
+        return 0.0
+    # the first pass warms up the page cache
+    for context in contexts:
+        sql.ngram_like_table(context + ("",), DEFAULT_COMPLETION_SIZE)
+    start = time.perf_counter()
+    for context in contexts:
+        sql.ngram_like_table(context + ("",), DEFAULT_COMPLETION_SIZE)
+    return (time.perf_counter() - start) / len(contexts)
+
+
+def convert_sqlite_to_without_rowid(outfile, ngram_size, vacuum=True):
+    """
+    Converts the n-gram tables of an existing sqlite database to `WITHOUT
+    ROWID` tables, see `SqliteDatabaseConnector.create_ngram_table()`. Every
+    table is copied to a new table in the order of its key and replaced.
+    Duplicate n-grams of tables without unique constraint are merged. Tables
+    that had indexes get them again, the metadata stays valid.
+
+    Parameters
+    ----------
+    outfile : str
+        Path to the sqlite database.
+    ngram_size : int
+        The highest cardinality of the n-grams, the tables `_1_gram` up to
+        `_<ngram_size>_gram` are converted.
+    vacuum : bool
+        Run `VACUUM` after the conversion, so that the pages of the old
+        tables are returned to the file system.
+
+    """
+    sql = SqliteDatabaseConnector(outfile, ngram_size)
+    try:
+        for cardinality in range(1, ngram_size + 1):
+            table = "_{0}_gram".format(cardinality)
+            if not sql._table_exists(table) or sql.is_without_rowid(cardinality):
+                continue
+
+            indexes = sql.index_names(cardinality)
+            sql.covering_index = "idx_{0}_gram_top".format(cardinality) in indexes
+            sql.delete_index(cardinality)
+
+            sql.execute_sql("ALTER TABLE {0} RENAME TO {0}_rowid;".format(table))
+            sql.create_ngram_table(cardinality, without_rowid=True)
+            columns = ", ".join(sql._column_names(cardinality))
+            sql.execute_sql(
+                "INSERT INTO {0} ({1}, count) SELECT {1}, SUM(count) FROM {0}_rowid {2};".format(
+                    table, columns, "GROUP BY {0} ORDER BY {0}".format(columns)
+                )
+            )
+            sql.execute_sql("DROP TABLE {0}_rowid;".format(table))
+            if len(indexes) > 0:
+                sql.create_index(cardinality)
+            sql.commit()
+
+        if vacuum:
+            sql.execute_sql("VACUUM;")
+    finally:
+        sql.close_database()
+
+
+def convert_sqlite_to_binary(infile, outfile, ngram_size):
+    """
+    Converts the n-gram tables of a sqlite database to a model file in the
+    binary format of `pressagio.binary`, which can be served with
+    `BinaryDatabaseConnector`. The n-grams are sorted by sqlite and streamed
+    into the model file, so the model does not need to fit into memory.
+
+    Parameters
+    ----------
+    infile : str
+        Path to the sqlite database.
+    outfile : str
+        Path of the model file.
+    ngram_size : int
+        The highest cardinality of the n-grams, the tables `_1_gram` up to
+        `_<ngram_size>_gram` are converted.
+
+    """
+    sql = SqliteDatabaseConnector(infile, ngram_size)
+    try:
+        tables = [
+            cardinality
+            for cardinality in range(1, ngram_size + 1)
+            if sql._table_exists("_{0}_gram".format(cardinality))
+        ]
+        words = set()
+        for cardinality in tables:
+            for column in sql._column_names(cardinality):
+                query = "SELECT DISTINCT {0} FROM _{1}_gram;".format(
+                    sql._word_column("_{0}_gram.{1}".format(cardinality, column)),
+                    cardinality,
+                )
+                words.update(row[0] for row in sql.iterate_sql(query))
+        vocabulary = sorted(words, key=pressagio.binary.vocabulary_key)
+        del words
+
+        sql.execute_sql(
+            "CREATE TEMPORARY TABLE _vocabulary (word TEXT PRIMARY KEY, id INTEGER);"
+        )
+        sql.executemany_sql(
+            "INSERT INTO _vocabulary (word, id) VALUES (?, ?);",
+            ((word, i) for i, word in enumerate(vocabulary)),
+        )
+
+        def ngrams(cardinality):
+            if cardinality not in tables:
+                return
+            columns = sql._column_names(cardinality)
+            ids = ", ".join("v{0}.id".format(i) for i in range(cardinality))
+            joins = " ".join(
+                "JOIN _vocabulary v{0} ON v{0}.word = {1}".format(
+                    i, sql._word_column("g.{0}".format(column))
+                )
+                for i, column in enumerate(columns)
+            )
+            query = "SELECT {0}, SUM(g.count) FROM _{1}_gram g {2} {3};".format(
+                ids, cardinality, joins, "GROUP BY {0} ORDER BY {0}".format(ids)
+            )
+            for row in sql.iterate_sql(query):
+                yield row[:-1], row[-1]
+
+        pressagio.binary.write_model(
+            outfile,
+            vocabulary,
+            [ngrams(cardinality) for cardinality in range(1, ngram_size + 1)],
+        )
+    finally:
+        sql.close_database()
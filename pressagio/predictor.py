@@ -7,6 +7,7 @@ try:
 except ImportError:
     import ConfigParser as configparser
 
+import asyncio
 
 import pressagio.dbconnector
 import pressagio.combiner
@@ -16,6 +17,15 @@ import pressagio.combiner
 MIN_PROBABILITY = 0.0
 MAX_PROBABILITY = 1.0
 
+# Connector classes whose prefix lookups ignore the case of ASCII letters
+# only, like the completion index
+COMPLETION_INDEX_CLASSES = (
+    "SqliteDatabaseConnector",
+    "MemoryDatabaseConnector",
+    "BinaryDatabaseConnector",
+    "ShardedDatabaseConnector",
+)
+
 
 class SuggestionException(Exception):
     pass
@@ -126,7 +136,6 @@ class PredictorActivator(object):
         self.registry = registry
         self.context_tracker = context_tracker
         # self.dispatcher = pressagio.observer.Dispatcher(self)
-        self.predictions = []
 
         self.combiner = None
         self.max_partial_prediction_size = int(config.get("Selector", "suggestions"))
@@ -154,14 +163,30 @@ class PredictorActivator(object):
     combination_policy = property(**combination_policy())
 
     def predict(self, multiplier=1, prediction_filter=None):
-        self.predictions[:] = []
+        predictions = []
         for predictor in self.registry:
-            self.predictions.append(
+            predictions.append(
                 predictor.predict(
                     self.max_partial_prediction_size * multiplier, prediction_filter
                 )
             )
-        result = self.combiner.combine(self.predictions)
+        result = self.combiner.combine(predictions)
+        return result
+
+    async def apredict(self, multiplier=1, prediction_filter=None):
+        """
+        Async version of `predict()`, the predictors run concurrently.
+
+        """
+        predictions = await asyncio.gather(
+            *[
+                predictor.apredict(
+                    self.max_partial_prediction_size * multiplier, prediction_filter
+                )
+                for predictor in self.registry
+            ]
+        )
+        result = self.combiner.combine(predictions)
         return result
 
 
@@ -233,6 +258,21 @@ class PredictorRegistry(list):  # pressagio.observer.Observer,
         for predictor in self:
             predictor.close_database()
 
+    def set_query_statistics(self, stats):
+        """
+        Records the queries of the database connectors of all predictors in
+        the given query statistics, or stops recording if `stats` is None.
+
+        Parameters
+        ----------
+        stats : pressagio.dbconnector.QueryStatistics
+            The query statistics.
+
+        """
+        for predictor in self:
+            if getattr(predictor, "db", None) is not None:
+                predictor.db.stats = stats
+
 
 class Predictor(object):
     """
@@ -278,6 +318,8 @@ class SmoothedNgramPredictor(Predictor):  # , pressagio.observer.Observer
             self, config, context_tracker, predictor_name, short_desc, long_desc
         )
         self.db = None
+        self.completion_index = None
+        self._completion_index_key = None
         self.dbconnection = dbconnection
         self.cardinality = None
         self.learn_mode_set = False
@@ -287,6 +329,14 @@ class SmoothedNgramPredictor(Predictor):  # , pressagio.observer.Observer
         self.dbpass = None
         self.dbhost = None
         self.dbport = None
+        self.dbread_only = False
+        self.dbcompletion_index = True
+        self.dbthread_local = False
+        self.dbpool_min_size = None
+        self.dbpool_max_size = None
+        self.dbpool_timeout = None
+        self.dbpool_health_check_interval = None
+        self.dbserver_side_prediction = False
 
         self._database = None
         self._deltas = None
@@ -345,13 +395,47 @@ class SmoothedNgramPredictor(Predictor):  # , pressagio.observer.Observer
             self._database = value
 
             self.dbclass = self.config.get("Database", "class")
-            if self.dbclass == "PostgresDatabaseConnector":
+            # postgres compares prefixes case-sensitively or normalized,
+            # the completion index would return other candidates
+            self.dbcompletion_index = (
+                self.dbclass in COMPLETION_INDEX_CLASSES
+                and self.config.getboolean(
+                    "Database", "completion_index", fallback=True
+                )
+            )
+            if self.dbclass in ("SqliteDatabaseConnector", "ShardedDatabaseConnector"):
+                self.dbread_only = self.config.getboolean(
+                    "Database", "read_only", fallback=False
+                )
+                self.dbthread_local = self.config.getboolean(
+                    "Database", "thread_local", fallback=False
+                )
+            if self.dbclass in (
+                "PostgresDatabaseConnector",
+                "PooledPostgresDatabaseConnector",
+            ):
                 self.dbuser = self.config.get("Database", "user")
                 self.dbpass = self.config.get("Database", "password")
                 self.dbhost = self.config.get("Database", "host")
                 self.dbport = self.config.get("Database", "port")
                 self.dblowercase = self.config.getboolean("Database", "lowercase_mode")
                 self.dbnormalize = self.config.getboolean("Database", "normalize_mode")
+                self.dbserver_side_prediction = self.config.getboolean(
+                    "Database", "server_side_prediction", fallback=False
+                )
+            if self.dbclass == "PooledPostgresDatabaseConnector":
+                self.dbpool_min_size = self.config.getint(
+                    "Database", "pool_min_size", fallback=1
+                )
+                self.dbpool_max_size = self.config.getint(
+                    "Database", "pool_max_size", fallback=10
+                )
+                self.dbpool_timeout = self.config.getfloat(
+                    "Database", "pool_timeout", fallback=30.0
+                )
+                self.dbpool_health_check_interval = self.config.getfloat(
+                    "Database", "pool_health_check_interval", fallback=60.0
+                )
 
             self.init_database_connector_if_ready()
 
@@ -372,8 +456,26 @@ class SmoothedNgramPredictor(Predictor):  # , pressagio.observer.Observer
         ):
             if self.dbclass == "SqliteDatabaseConnector":
                 self.db = pressagio.dbconnector.SqliteDatabaseConnector(
-                    self.database, self.cardinality
+                    self.database,
+                    self.cardinality,
+                    self.dbread_only,
+                    self.dbthread_local,
                 )  # , self.learn_mode
+            elif self.dbclass == "ShardedDatabaseConnector":
+                self.db = pressagio.dbconnector.ShardedDatabaseConnector(
+                    self.database,
+                    self.cardinality,
+                    read_only=self.dbread_only,
+                    thread_local=self.dbthread_local,
+                )
+            elif self.dbclass == "BinaryDatabaseConnector":
+                self.db = pressagio.dbconnector.BinaryDatabaseConnector(
+                    self.database, self.cardinality
+                )
+            elif self.dbclass == "MemoryDatabaseConnector":
+                self.db = pressagio.dbconnector.MemoryDatabaseConnector(
+                    self.database, self.cardinality
+                )
             elif self.dbclass == "PostgresDatabaseConnector":
                 self.db = pressagio.dbconnector.PostgresDatabaseConnector(
                     self.database,
@@ -386,56 +488,160 @@ class SmoothedNgramPredictor(Predictor):  # , pressagio.observer.Observer
                 )
                 self.db.lowercase = self.dblowercase
                 self.db.normalize = self.dbnormalize
+                self.db.server_side_prediction = self.dbserver_side_prediction
                 self.db.open_database()
+            elif self.dbclass == "PooledPostgresDatabaseConnector":
+                self.db = pressagio.dbconnector.PooledPostgresDatabaseConnector(
+                    self.database,
+                    self.cardinality,
+                    self.dbhost,
+                    self.dbport,
+                    self.dbuser,
+                    self.dbpass,
+                    min_size=self.dbpool_min_size,
+                    max_size=self.dbpool_max_size,
+                    timeout=self.dbpool_timeout,
+                    health_check_interval=self.dbpool_health_check_interval,
+                )
+                self.db.lowercase = self.dblowercase
+                self.db.normalize = self.dbnormalize
+                self.db.server_side_prediction = self.dbserver_side_prediction
+                self.db.open_database()
+
+            if self.db and self.dbcompletion_index:
+                size = max(
+                    pressagio.dbconnector.DEFAULT_COMPLETION_SIZE,
+                    int(self.config.get("Selector", "suggestions")),
+                )
+                # the index is only built again for another database
+                key = (self.dbclass, self.database, size)
+                if key != self._completion_index_key:
+                    self.completion_index = pressagio.dbconnector.CompletionIndex(
+                        self.db.ngram_like_table([""]), size
+                    )
+                    self._completion_index_key = key
+            else:
+                self.completion_index = None
+                self._completion_index_key = None
 
     def ngram_to_string(self, ngram):
         "|".join(ngram)
 
     def predict(self, max_partial_prediction_size, filter):
-        tokens = [""] * self.cardinality
-        prediction = Prediction()
+        tokens = self._tokens()
+        if self.dbserver_side_prediction and not filter:
+            # the whole prediction is computed by the database
+            return self._server_side_prediction(
+                self.db.smoothed_ngram_prediction(
+                    tokens, self.deltas, max_partial_prediction_size
+                )
+            )
 
-        for i in range(self.cardinality):
-            tokens[self.cardinality - 1 - i] = self.context_tracker.token(i)
+        # the candidates of all cardinalities are fetched with one query
+        prefix_ngrams = self._backoff_ngrams(tokens)
+        prefix_completion_candidates = self.db.backoff_candidates(
+            prefix_ngrams, max_partial_prediction_size, filter or None
+        )
+        self._add_indexed_candidates(
+            prefix_completion_candidates, tokens, filter, max_partial_prediction_size
+        )
 
-        prefix_completion_candidates = []
-        for k in reversed(range(self.cardinality)):
-            if len(prefix_completion_candidates) >= max_partial_prediction_size:
-                break
-            prefix_ngram = tokens[(len(tokens) - k - 1) :]
-            partial = None
-            if not filter:
-                partial = self.db.ngram_like_table(
-                    prefix_ngram,
-                    max_partial_prediction_size - len(prefix_completion_candidates),
-                )
-            else:
-                partial = self.db.ngram_like_table_filtered(
-                    prefix_ngram,
-                    filter,
-                    max_partial_prediction_size - len(prefix_completion_candidates),
+        # smoothing
+        counts = self.db.ngram_counts(
+            self._smoothing_ngrams(tokens, prefix_completion_candidates)
+        )
+        unigram_counts_sum = self.db.unigram_counts_sum()
+        return self._prediction(
+            tokens, prefix_completion_candidates, counts, unigram_counts_sum
+        )
+
+    async def apredict(self, max_partial_prediction_size, filter):
+        """
+        Async version of `predict()`, the database is queried with the async
+        methods of the database connector.
+
+        """
+        tokens = self._tokens()
+        if self.dbserver_side_prediction and not filter:
+            return self._server_side_prediction(
+                await self.db.asmoothed_ngram_prediction(
+                    tokens, self.deltas, max_partial_prediction_size
                 )
+            )
 
-            for p in partial:
-                if len(prefix_completion_candidates) > max_partial_prediction_size:
-                    break
-                candidate = p[-2]  # ???
-                if candidate not in prefix_completion_candidates:
-                    prefix_completion_candidates.append(candidate)
+        prefix_ngrams = self._backoff_ngrams(tokens)
+        prefix_completion_candidates = await self.db.abackoff_candidates(
+            prefix_ngrams, max_partial_prediction_size, filter or None
+        )
+        self._add_indexed_candidates(
+            prefix_completion_candidates, tokens, filter, max_partial_prediction_size
+        )
 
         # smoothing
-        unigram_counts_sum = self.db.unigram_counts_sum()
-        for j, candidate in enumerate(prefix_completion_candidates):
+        counts, unigram_counts_sum = await asyncio.gather(
+            self.db.angram_counts(
+                self._smoothing_ngrams(tokens, prefix_completion_candidates)
+            ),
+            self.db.aunigram_counts_sum(),
+        )
+        return self._prediction(
+            tokens, prefix_completion_candidates, counts, unigram_counts_sum
+        )
+
+    def _backoff_ngrams(self, tokens):
+        # the lookups that need a query, from the highest cardinality down:
+        # n-grams with an empty context do not exist and words without
+        # context are completed with the completion index
+        prefix_ngrams = []
+        for k in reversed(range(self.cardinality)):
+            prefix_ngram = tokens[(len(tokens) - k - 1) :]
+            if len(prefix_ngram) > 1 and not any(prefix_ngram[:-1]):
+                continue
+            if len(prefix_ngram) == 1 and self.completion_index is not None:
+                continue
+            prefix_ngrams.append(prefix_ngram)
+        return prefix_ngrams
+
+    def _add_indexed_candidates(self, candidates, tokens, filter, limit):
+        if self.completion_index is None or len(candidates) >= limit:
+            return
+        if not filter:
+            words = self.completion_index.complete(tokens[-1], limit)
+        else:
+            words = self.completion_index.complete_filtered(tokens[-1], filter, limit)
+        pressagio.dbconnector.merge_candidates(
+            candidates, set(candidates), [row[-2] for row in words], limit
+        )
+
+    def _tokens(self):
+        tokens = [""] * self.cardinality
+        for i in range(self.cardinality):
+            tokens[self.cardinality - 1 - i] = self.context_tracker.token(i)
+        return tokens
+
+    def _smoothing_ngrams(self, tokens, candidates):
+        ngrams = []
+        for candidate in candidates:
+            tokens[self.cardinality - 1] = candidate
+            for k in range(self.cardinality):
+                ngrams.append(self._ngram(tokens, 0, k + 1))
+                if k > 0:
+                    ngrams.append(self._ngram(tokens, -1, k))
+        return ngrams
+
+    def _prediction(self, tokens, candidates, counts, unigram_counts_sum):
+        prediction = Prediction()
+        for j, candidate in enumerate(candidates):
             # if j >= max_partial_prediction_size:
             #    break
             tokens[self.cardinality - 1] = candidate
 
             probability = 0
             for k in range(self.cardinality):
-                numerator = self._count(tokens, 0, k + 1)
+                numerator = counts[self._ngram(tokens, 0, k + 1)]
                 denominator = unigram_counts_sum
-                if numerator > 0:
-                    denominator = self._count(tokens, -1, k)
+                if numerator > 0 and k > 0:
+                    denominator = counts[self._ngram(tokens, -1, k)]
                 frequency = 0
                 if denominator > 0:
                     frequency = float(numerator) / denominator
@@ -447,6 +653,12 @@ class SmoothedNgramPredictor(Predictor):  # , pressagio.observer.Observer
                 )
         return prediction
 
+    def _server_side_prediction(self, rows):
+        prediction = Prediction()
+        for word, probability in rows:
+            prediction.add_suggestion(Suggestion(word, probability))
+        return prediction
+
     def close_database(self):
         self.db.close_database()
 
@@ -455,11 +667,5 @@ class SmoothedNgramPredictor(Predictor):  # , pressagio.observer.Observer
         self.deltas = self.config.get(self.name, "deltas").split()
         self.learn_mode = self.config.get(self.name, "learn")
 
-    def _count(self, tokens, offset, ngram_size):
-        result = 0
-        if ngram_size > 0:
-            ngram = tokens[len(tokens) - ngram_size + offset : len(tokens) + offset]
-            result = self.db.ngram_count(ngram)
-        else:
-            result = self.db.unigram_counts_sum()
-        return result
+    def _ngram(self, tokens, offset, ngram_size):
+        return tuple(tokens[len(tokens) - ngram_size + offset : len(tokens) + offset])
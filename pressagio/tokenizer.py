@@ -391,6 +391,70 @@ class NgramMap:
             tokens = [strings[int(idx)] for idx in token_indices.split("\t")]
             yield tokens, count
 
+    def part(self, index, key):
+        """
+        Get the part of the store with the given index.
+
+        The part contains the ngrams for whose first token `key` returns
+        `index`. The new store only contains the tokens of its ngrams, the
+        tokens keep their indices. Every call reads all ngrams of the store,
+        so the parts can be built one after the other instead of holding a
+        copy of the whole store at once.
+
+        Parameters
+        ----------
+        index : int
+            The index of the part.
+        key : callable
+            Returns the index of the part for a token.
+
+        Returns
+        -------
+        NgramMap
+            The new store.
+        """
+        strings = {v: k for k, v in self._strings.items()}
+        store = NgramMap()
+        indices = set()
+        positions = {}
+        for token_indices, ngram_count in self.ngrams.items():
+            first = token_indices.split("\t", 1)[0]
+            position = positions.get(first)
+            if position is None:
+                position = positions[first] = key(strings[int(first)])
+            if position == index:
+                store.ngrams[token_indices] = ngram_count
+                indices.update(int(idx) for idx in token_indices.split("\t"))
+        store._strings = {strings[idx]: idx for idx in indices}
+        store.next_index = self.next_index
+        return store
+
+    def tokens(self):
+        """
+        Get the tokens of the string store.
+
+        Returns
+        -------
+        dict
+            Maps the tokens to their indices.
+        """
+        return dict(self._strings)
+
+    def index_items(self):
+        """
+        Get the ngrams from the store as indices of the tokens, without
+        looking up the tokens.
+
+        Returns
+        -------
+        iterable of indices, count
+            The indices are a tuple of ints, the indices that `add_token()`
+            returned for the tokens. The count is the count value for that
+            ngram.
+        """
+        for token_indices, count in self.ngrams.items():
+            yield tuple(int(idx) for idx in token_indices.split("\t")), count
+
 
 def forward_tokenize_files(
     infiles: typing.List[str], ngram_size: int, lowercase: bool = False, cutoff: int = 0
@@ -21,7 +21,7 @@ DESCRIPTION = "A Python Library for statistical text prediction."
 URL = "https://github.com/Poio-NLP/pressagio"
 EMAIL = "pbouda@outlook.com"
 AUTHOR = "Peter Bouda"
-REQUIRES_PYTHON = ">=3.6.0"
+REQUIRES_PYTHON = ">=3.7.0"
 VERSION = "0.1.6"
 
 # What packages are required for this module to be executed?
@@ -196,7 +196,7 @@ def setup_package():
             "License :: OSI Approved :: Apache Software License",
             "Programming Language :: Python",
             "Programming Language :: Python :: 3",
-            "Programming Language :: Python :: 3.6",
+            "Programming Language :: Python :: 3.7",
             "Topic :: Scientific/Engineering",
             "Topic :: Scientific/Engineering :: Human Machine Interfaces",
             "Topic :: Scientific/Engineering :: Information Analysis",
@@ -1,7 +1,13 @@
+import asyncio
+import gc
 import os
+import re
+import sqlite3
+import threading
 import unittest
 
 import pressagio.dbconnector
+import pressagio.tokenizer
 
 psycopg2_installed = False
 try:
@@ -120,12 +126,1014 @@ class TestSqliteDatabaseConnector(unittest.TestCase):
         assert result == [("der", "linksabbieger", 32), ("der", "linksdenker", 22)]
         self.connector.execute_sql("DROP TABLE _2_gram;")
 
-    def teardown(self):
+    def test_ngram_like_table_filtered(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.insert_ngram(("der", "linksabbieger"), 32)
+        self.connector.insert_ngram(("der", "Linkskurve"), 12)
+        self.connector.insert_ngram(("der", "linkt"), 2)
+        self.connector.insert_ngram(("die", "linkskurve"), 5)
+        result = self.connector.ngram_like_table_filtered(("der", "links"), "dk")
+        assert result == [("der", "linksdenker", 22), ("der", "Linkskurve", 12)]
+        result = self.connector.ngram_like_table_filtered(
+            ("der", "links"), "dKk", limit=1
+        )
+        assert result == [("der", "linksdenker", 22)]
+        result = self.connector.ngram_like_table_filtered(("der", "lin"), ["ks", "kt"])
+        assert result == [
+            ("der", "linksabbieger", 32),
+            ("der", "linksdenker", 22),
+            ("der", "Linkskurve", 12),
+            ("der", "linkt", 2),
+        ]
+        assert self.connector.ngram_like_table_filtered(("der", "links"), "") == []
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_backoff_candidates(self):
+        self.connector.create_bigram_table()
+        self.connector.create_unigram_table()
+        self.connector.insert_ngrams(
+            [
+                (("der", "linksdenker"), 22),
+                (("der", "linksabbieger"), 32),
+                (("die", "linkskurve"), 5),
+            ]
+        )
+        self.connector.insert_ngrams(
+            [
+                (("linkskurve",), 50),
+                (("linksdenker",), 40),
+                (("linkt",), 30),
+                (("rechts",), 20),
+            ]
+        )
+        ngrams = [("der", "links"), ("links",)]
+        result = self.connector.backoff_candidates(ngrams, 10)
+        assert result == ["linksabbieger", "linksdenker", "linkskurve"]
+        result = self.connector.backoff_candidates(ngrams, 3)
+        assert result == ["linksabbieger", "linksdenker", "linkskurve"]
+        result = self.connector.backoff_candidates(ngrams, 1)
+        assert result == ["linksabbieger"]
+        result = self.connector.backoff_candidates([("der", "lin"), ("lin",)], 4)
+        assert result == ["linksabbieger", "linksdenker", "linkskurve", "linkt"]
+        result = self.connector.backoff_candidates(ngrams, 10, "dk")
+        assert result == ["linksdenker", "linkskurve"]
+        assert self.connector.backoff_candidates(ngrams, 10, "") == []
+        assert self.connector.backoff_candidates([], 10) == []
+        self.connector.commit()
+        result = asyncio.run(self.connector.abackoff_candidates(ngrams, 3))
+        assert result == ["linksabbieger", "linksdenker", "linkskurve"]
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+        self.connector.execute_sql("DROP TABLE _1_gram;")
+
+    def test_ngram_like_table_case(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "Linksdenker"), 22)
+        self.connector.insert_ngram(("der", "linksabbieger"), 32)
+        self.connector.insert_ngram(("der", "links_"), 2)
+        self.connector.insert_ngram(("der", "linkt"), 1)
+        result = self.connector.ngram_like_table(("der", "LINKS"))
+        assert result == [
+            ("der", "linksabbieger", 32),
+            ("der", "Linksdenker", 22),
+            ("der", "links_", 2),
+        ]
+        result = self.connector.ngram_like_table(("der", "links_"))
+        assert result == [("der", "links_", 2)]
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_ngram_like_table_query_plan(self):
+        for cardinality in (1, 2, 3):
+            self.connector.create_ngram_table(cardinality)
+            self.connector.create_index(cardinality)
+            ngram = ["der"] * (cardinality - 1) + ["links"]
+            statement = self.connector._statement(
+                "ngram_like", cardinality, (1, True)
+            )
+            params = ngram[:-1] + self.connector._prefix_params(ngram[-1]) + [6]
+            plan = self.connector.execute_sql(
+                "EXPLAIN QUERY PLAN " + statement, params
+            )
+            details = [row[-1] for row in plan]
+            assert not any(d.startswith("SCAN") for d in details), details
+            assert any(
+                "idx_{0}_gram_prefix".format(cardinality) in d for d in details
+            ), details
+            self.connector.delete_ngram_table(cardinality)
+
+    def test_covering_index_query_plan(self):
+        self.connector.covering_index = True
+        for cardinality in (1, 2, 3):
+            self.connector.create_ngram_table(cardinality)
+            self.connector.create_index(cardinality)
+            context = ["der"] * (cardinality - 1)
+
+            statement = self.connector._statement(
+                "ngram_like", cardinality, (1, True)
+            )
+            params = context + self.connector._prefix_params("links") + [6]
+            plan = self.connector.execute_sql(
+                "EXPLAIN QUERY PLAN " + statement, params
+            )
+            details = [row[-1] for row in plan]
+            assert any("COVERING INDEX" in d for d in details), details
+
+            statement = self.connector._statement(
+                "ngram_like", cardinality, (0, True)
+            )
+            plan = self.connector.execute_sql(
+                "EXPLAIN QUERY PLAN " + statement, context + [6]
+            )
+            details = [row[-1] for row in plan]
+            assert any(
+                "COVERING INDEX idx_{0}_gram_top".format(cardinality) in d
+                for d in details
+            ), details
+            assert not any("TEMP B-TREE" in d for d in details), details
+            self.connector.delete_ngram_table(cardinality)
+        self.connector.covering_index = False
+
+    def test_quoted_ngrams(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("l'homme", "d'abord"), 3)
+        assert self.connector.ngram_count(("l'homme", "d'abord")) == 3
+        result = self.connector.ngram_like_table(("l'homme", "d'a"))
+        assert result == [("l'homme", "d'abord", 3)]
+        self.connector.update_ngram(("l'homme", "d'abord"), 4)
+        assert self.connector.ngram_count(("l'homme", "d'abord")) == 4
+        self.connector.remove_ngram(("l'homme", "d'abord"))
+        assert self.connector.ngram_count(("l'homme", "d'abord")) == 0
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_ngram_counts(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.insert_ngram(("der", "linksabbieger"), 32)
+        self.connector.insert_ngram(("l'homme", "de"), 3)
+        result = self.connector.ngram_counts(
+            [("der", "linksdenker"), ("der", "linksabbieger"), ("der", "rest")]
+        )
+        assert result == {
+            ("der", "linksdenker"): 22,
+            ("der", "linksabbieger"): 32,
+            ("der", "rest"): 0,
+        }
+        result = self.connector.ngram_counts([("l'homme", "de")])
+        assert result == {("l'homme", "de"): 3}
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_insert_ngrams(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngrams(
+            [(("der", "linksdenker"), 22), (("der", "linksabbieger"), 32)]
+        )
+        result = self.connector.execute_sql("SELECT * FROM _2_gram ORDER BY count")
+        assert result == [("der", "linksdenker", 22), ("der", "linksabbieger", 32)]
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_insert_ngram_map_sqlite(self):
+        self.connector.close_database()
+        infile = os.path.join(
+            os.path.dirname(__file__), "test_data", "der_linksdenker.txt"
+        )
+        ngram_map = pressagio.tokenizer.forward_tokenize_file(infile, 2)
+        reports = []
+        pressagio.dbconnector.insert_ngram_map_sqlite(
+            ngram_map,
+            2,
+            self.filename,
+            batch_size=100,
+            progress=lambda rows, rate: reports.append(rows),
+        )
+        assert reports[-1] == len(ngram_map)
+        assert reports == sorted(reports)
+
+        self.connector.open_database()
+        result = self.connector.execute_sql("SELECT COUNT(*) FROM _2_gram;")
+        assert result == [(len(ngram_map),)]
+        assert self.connector.has_metadata(2)
+        total = sum(c for _, c in ngram_map.items())
+        assert self.connector.ngram_total(2) == total
+        assert self.connector.ngram_count(("Der", "Linksdenker")) > 0
+        result = self.connector.execute_sql("PRAGMA journal_mode;")
+        assert result == [("delete",)]
+        count = self.connector.ngram_count(("Der", "Linksdenker"))
+        self.connector.close_database()
+
+        ngram_map = pressagio.tokenizer.NgramMap()
+        ngram_map.add([ngram_map.add_token("Der"), ngram_map.add_token("Linksdenker")])
+        ngram_map.add([ngram_map.add_token("Der"), ngram_map.add_token("Neuling")])
+        pressagio.dbconnector.insert_ngram_map_sqlite(
+            ngram_map, 2, self.filename, append=True
+        )
+
+        self.connector.open_database()
+        assert self.connector.ngram_count(("Der", "Linksdenker")) == count + 1
+        assert self.connector.ngram_count(("Der", "Neuling")) == 1
+        assert self.connector.ngram_total(2) == total + 2
+        result = self.connector.execute_sql("PRAGMA journal_mode;")
+        assert result == [("delete",)]
+        self.connector.close_database()
+
+        # a failed update is rolled back and its error is raised
+        def fail(written, rate):
+            raise RuntimeError("write failed")
+
+        with self.assertRaises(RuntimeError):
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, 2, self.filename, append=True, progress=fail
+            )
+        filename = os.path.join(os.path.dirname(__file__), "test_data", "new.db")
+        with self.assertRaises(RuntimeError):
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, 2, filename, progress=fail
+            )
+        os.remove(filename)
+        self.connector.open_database()
+        assert self.connector.ngram_count(("Der", "Neuling")) == 1
+        result = self.connector.execute_sql("PRAGMA journal_mode;")
+        assert result == [("delete",)]
+        self.connector.delete_ngram_table(2)
+
+    def test_filter_ngrams_sqlite(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.insert_ngram(("der", "linksabbieger"), 32)
+        self.connector.insert_ngram(("die", "linksdenker"), 12)
+        self.connector.commit()
+        self.connector.close_database()
+
+        pressagio.dbconnector.filter_ngrams_sqlite(
+            set(["der", "linksdenker", "linksabbieger"]), 2, self.filename
+        )
+
+        self.connector.open_database()
+        result = self.connector.execute_sql("SELECT * FROM _2_gram ORDER BY count")
+        assert result == [("der", "linksdenker", 22), ("der", "linksabbieger", 32)]
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_metadata(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.insert_ngram(("der", "linksabbieger"), 32)
+        assert not self.connector.has_metadata(2)
+        assert self.connector.ngram_total(2) == 54
+        assert self.connector.context_count(("der",)) == 54
+
+        self.connector.update_metadata(2)
+        assert self.connector.has_metadata(2)
+        assert self.connector.ngram_total(2) == 54
+        assert self.connector.context_count(("der",)) == 54
+        assert self.connector.context_count(("die",)) == 0
+
+        self.connector.insert_ngram(("die", "linksdenker"), 12)
+        self.connector.update_ngram(("der", "linksdenker"), 20)
+        self.connector.remove_ngram(("der", "linksabbieger"))
+        self.connector.upsert_ngrams([(("die", "linksdenker"), 1)])
+        assert self.connector.ngram_total(2) == 33
+        assert self.connector.context_count(("der",)) == 20
+        assert self.connector.context_count(("die",)) == 13
+
+        self.connector.delete_ngram_table(2)
+        assert not self.connector.has_metadata(2)
+        self.connector.execute_sql("DROP TABLE _totals;")
+
+    def test_upsert_ngrams(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.upsert_ngrams(
+            [(("der", "linksdenker"), 2), (("der", "linksabbieger"), 32)]
+        )
+        assert self.connector.ngram_count(("der", "linksdenker")) == 24
+        assert self.connector.ngram_count(("der", "linksabbieger")) == 32
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_iterate_sql(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngrams(
+            [(("der", "linksdenker"), 22), (("der", "linksabbieger"), 32)]
+            + [(("die", str(i)), i) for i in range(10)]
+        )
+        query = "SELECT word_1, word, count FROM _2_gram ORDER BY count;"
+        rows = self.connector.iterate_sql(query, batch_size=3)
+        assert next(rows) == ("die", "0", 0)
+        assert list(rows) == self.connector.execute_sql(query)[1:]
+        self.connector.cardinality = 2
+        ngrams = self.connector.ngrams(with_counts=True)
+        assert not isinstance(ngrams, list)
+        assert len(list(ngrams)) == 12
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_query_statistics(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngrams(
+            [(("der", "linksdenker"), 22), (("der", "linksabbieger"), 32)]
+        )
+        stats = pressagio.dbconnector.QueryStatistics(slow_query_threshold=0)
+        self.connector.stats = stats
+        with stats.scope() as totals:
+            assert self.connector.ngram_count(("der", "linksdenker")) == 22
+            assert self.connector.ngram_count(("der", "linksabbieger")) == 32
+            self.connector.ngram_like_table(["der", ""])
+        assert stats.last_totals() is totals
+        assert totals.queries == 3
+        assert totals.rows == 4
+        statement = self.connector._statement("ngram_count", 2)
+        assert totals.statements[statement] == 2
+        assert stats.statements[statement].count == 2
+        assert stats.statements[statement].rows == 2
+        assert sum(stats.statements[statement].histogram) == 2
+        assert len(stats.slow_queries) == 3
+        slow_query = stats.slow_queries[0]
+        assert slow_query.statement == statement
+        assert slow_query.params == ["der", "linksdenker"]
+        assert any("_2_gram" in line for line in slow_query.plan)
+        assert stats.totals().queries == 3
+        stats.reset()
+        assert stats.totals().queries == 0
+        assert len(stats.slow_queries) == 0
+        # batches are explained with their first parameters
+        self.connector.insert_ngrams(
+            [(("die", "linkskurve"), 5), (("die", "linksabbieger"), 3)]
+        )
+        slow_query = stats.slow_queries[-1]
+        assert slow_query.statement == self.connector._statement("insert_ngram", 2)
+        assert slow_query.params == ["die", "linkskurve", 5]
+        assert slow_query.plan is not None
+        stats.reset()
+        self.connector.stats = None
+        self.connector.ngram_count(("der", "linksdenker"))
+        assert stats.totals().queries == 0
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_query_statistics_concurrent(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.commit()
+        stats = pressagio.dbconnector.QueryStatistics()
+        self.connector.stats = stats
+
+        async def lookups():
+            # the queries of the scope run in the threads of the executor
+            with stats.scope() as totals:
+                counts = await asyncio.gather(
+                    *[
+                        self.connector.angram_count(("der", "linksdenker"))
+                        for i in range(200)
+                    ]
+                )
+            return counts, totals
+
+        counts, totals = asyncio.run(lookups())
+        assert counts == [22] * 200
+        assert totals.queries == 200
+        assert totals.rows == 200
+        assert sum(totals.statements.values()) == 200
+        assert stats.totals().queries == 200
+        self.connector.stats = None
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_read_only(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.commit()
+
+        reader = pressagio.dbconnector.SqliteDatabaseConnector(
+            self.filename, 2, read_only=True
+        )
+        assert reader.execute_sql("PRAGMA query_only;") == [(1,)]
+        assert reader.execute_sql("PRAGMA mmap_size;")[0][0] > 0
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(reader.ngram_count(("der", "linksdenker")))
+        )
+        thread.start()
+        thread.join()
+        assert result == [22]
+        with self.assertRaises(sqlite3.DatabaseError):
+            reader.insert_ngram(("der", "linksabbieger"), 32)
+        reader.close_database()
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_thread_local(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.commit()
+
+        shared = pressagio.dbconnector.SqliteDatabaseConnector(
+            self.filename, 2, thread_local=True
+        )
+        connections = []
+        counts = []
+
+        def count():
+            connections.append(shared._connection())
+            counts.append(shared.ngram_count(("der", "linksdenker")))
+
+        threads = [threading.Thread(target=count) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert counts == [22] * 4
+        assert len(set(map(id, connections + [shared.con]))) == 5
+        shared.close_database()
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_thread_local_cleanup(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.commit()
+
+        shared = pressagio.dbconnector.SqliteDatabaseConnector(
+            self.filename, 2, thread_local=True
+        )
+        counts = []
+        for i in range(50):
+            thread = threading.Thread(
+                target=lambda: counts.append(
+                    shared.ngram_count(("der", "linksdenker"))
+                )
+            )
+            thread.start()
+            thread.join()
+        gc.collect()
+        assert counts == [22] * 50
+        # the connections of the finished threads are closed
+        assert shared._connections == {shared.con}
+        shared.close_database()
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_async(self):
+        self.connector.create_bigram_table()
+        self.connector.insert_ngram(("der", "linksdenker"), 22)
+        self.connector.insert_ngram(("der", "linksabbieger"), 32)
+        self.connector.commit()
+
+        async def lookup():
+            return await asyncio.gather(
+                self.connector.angram_like_table(("der", "links"), 1),
+                self.connector.angram_like_table_filtered(("der", "links"), "d"),
+                self.connector.angram_count(("der", "linksdenker")),
+                self.connector.angram_counts(
+                    [("der", "linksdenker"), ("der", "rechts")]
+                ),
+                self.connector.angram_total(2),
+            )
+
+        result = asyncio.run(lookup())
+        assert result == [
+            [("der", "linksabbieger", 32)],
+            [("der", "linksdenker", 22)],
+            22,
+            {("der", "linksdenker"): 22, ("der", "rechts"): 0},
+            54,
+        ]
+        self.connector.execute_sql("DROP TABLE _2_gram;")
+
+    def test_integer_ids(self):
+        self.connector.close_database()
+        infile = os.path.join(
+            os.path.dirname(__file__), "test_data", "der_linksdenker.txt"
+        )
+        filename = os.path.join(os.path.dirname(__file__), "test_data", "test_ids.db")
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(infile, ngram_size)
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, self.filename, create_index=True
+            )
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, filename, create_index=True, integer_ids=True
+            )
+        text = pressagio.dbconnector.SqliteDatabaseConnector(self.filename, 3)
+        ids = pressagio.dbconnector.SqliteDatabaseConnector(filename, 3)
+        try:
+            assert ids.integer_ids and not text.integer_ids
+            result = ids.execute_sql("SELECT typeof(word) FROM _3_gram LIMIT 1;")
+            assert result == [("integer",)]
+            for cardinality in range(1, 4):
+                text.cardinality = ids.cardinality = cardinality
+                assert sorted(ids.ngrams(with_counts=True)) == sorted(
+                    text.ngrams(with_counts=True)
+                )
+                assert ids.ngram_total(cardinality) == text.ngram_total(cardinality)
+            assert ids.context_count(("Der",)) == text.context_count(("Der",))
+            ngrams = [("Der", "Linksdenker"), ("der", "rechts"), ("nicht",)]
+            assert ids.ngram_counts(ngrams) == text.ngram_counts(ngrams)
+            for ngram in [("d",), ("Der", ""), ("Der", "L"), ("ist", "ein", "")]:
+                assert sorted(ids.ngram_like_table(ngram)) == sorted(
+                    text.ngram_like_table(ngram)
+                )
+                assert sorted(
+                    ids.ngram_like_table_filtered(ngram, ["a", "e"])
+                ) == sorted(text.ngram_like_table_filtered(ngram, ["a", "e"]))
+            ngrams = [("ist", "ein", "e"), ("ein", "e"), ("e",)]
+            assert sorted(ids.backoff_candidates(ngrams, 100)) == sorted(
+                text.backoff_candidates(ngrams, 100)
+            )
+
+            ids.insert_ngram(("Der", "Neuling"), 3)
+            ids.update_ngram(("Der", "Linksdenker"), 5)
+            assert ids.ngram_count(("Der", "Neuling")) == 3
+            assert ids.ngram_count(("Der", "Linksdenker")) == 5
+            ids.remove_ngram(("Der", "Neuling"))
+            assert ids.ngram_count(("Der", "Neuling")) == 0
+            ids.commit()
+
+            # appending keeps the existing metadata in sync
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(infile, 2)
+            for outfile, integer_ids in [(self.filename, False), (filename, True)]:
+                pressagio.dbconnector.insert_ngram_map_sqlite(
+                    ngram_map,
+                    2,
+                    outfile,
+                    append=True,
+                    metadata=False,
+                    integer_ids=integer_ids,
+                )
+            for connector in [text, ids]:
+                connector.cardinality = 2
+                counts = list(connector.ngrams(with_counts=True))
+                assert connector.ngram_total(2) == sum(row[-1] for row in counts)
+                assert connector.context_count(("Der",)) == sum(
+                    row[-1] for row in counts if row[0] == "Der"
+                )
+        finally:
+            text.close_database()
+            ids.close_database()
+            os.remove(filename)
+
+    def test_without_rowid(self):
+        self.connector.close_database()
+        infile = os.path.join(
+            os.path.dirname(__file__), "test_data", "der_linksdenker.txt"
+        )
+        filename = os.path.join(
+            os.path.dirname(__file__), "test_data", "test_without_rowid.db"
+        )
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(infile, ngram_size)
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, self.filename, create_index=True
+            )
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, filename, create_index=True
+            )
+        pressagio.dbconnector.convert_sqlite_to_without_rowid(filename, 3)
+        assert os.path.getsize(filename) < os.path.getsize(self.filename)
+
+        rowid = pressagio.dbconnector.SqliteDatabaseConnector(self.filename, 3)
+        clustered = pressagio.dbconnector.SqliteDatabaseConnector(filename, 3)
+        try:
+            for cardinality in range(1, 4):
+                assert not rowid.is_without_rowid(cardinality)
+                assert clustered.is_without_rowid(cardinality)
+                rowid.cardinality = clustered.cardinality = cardinality
+                assert sorted(clustered.ngrams(with_counts=True)) == sorted(
+                    rowid.ngrams(with_counts=True)
+                )
+            ngrams = [("Der", "Linksdenker"), ("der", "rechts"), ("nicht",)]
+            assert clustered.ngram_counts(ngrams) == rowid.ngram_counts(ngrams)
+            assert sorted(clustered.ngram_like_table(("Der", "L"))) == sorted(
+                rowid.ngram_like_table(("Der", "L"))
+            )
+            statement = clustered._statement("ngram_count", 2)
+            plan = clustered.execute_sql(
+                "EXPLAIN QUERY PLAN " + statement, ["Der", "Linksdenker"]
+            )
+            assert "PRIMARY KEY" in plan[0][-1]
+            clustered.upsert_ngrams([(("Der", "Linksdenker"), 2)])
+            assert clustered.ngram_count(("Der", "Linksdenker")) == rowid.ngram_count(
+                ("Der", "Linksdenker")
+            ) + 2
+        finally:
+            rowid.close_database()
+            clustered.close_database()
+            os.remove(filename)
+
+    def test_prune_ngrams_sqlite(self):
+        self.connector.close_database()
+        infile = os.path.join(
+            os.path.dirname(__file__), "test_data", "der_linksdenker.txt"
+        )
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(infile, ngram_size)
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, self.filename, create_index=True
+            )
+        self.connector.open_database()
+        self.connector.cardinality = 3
+        rows = [self.connector.count_ngrams(c) for c in range(1, 4)]
+        context_count = self.connector.context_count(("der", "Saal"))
+        entropies = dict(self.connector.relative_entropies(3))
+        assert len(entropies) == rows[2]
+        threshold = sorted(entropies.values())[len(entropies) // 2]
+        self.connector.close_database()
+
+        report = pressagio.dbconnector.prune_ngrams_sqlite(
+            self.filename, 3, min_counts={2: 2}, top_k=3, threshold=threshold, probes=10
+        )
+        assert report["size"][1] < report["size"][0]
+        assert len(report["latency"]) == 2
+        assert report["pruned"][1] == 0
+
+        self.connector.open_database()
+        assert [self.connector.count_ngrams(c) for c in range(1, 4)] == [
+            rows[c - 1] - report["pruned"][c] for c in range(1, 4)
+        ]
+        assert report["pruned"][3] > 0
+        for ngram in self.connector.ngrams(with_counts=True):
+            assert entropies[ngram[:-1]] >= threshold
+        result = self.connector.execute_sql("SELECT MIN(count) FROM _2_gram;")
+        assert result == [(2,)]
+        result = self.connector.execute_sql(
+            "SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM _3_gram GROUP BY word_2, word_1);"
+        )
+        assert result[0][0] <= 3
+        assert self.connector.context_count(("der", "Saal")) == context_count
+        assert "idx_3_gram_prefix" in self.connector.index_names(3)
+
+    def tearDown(self):
         self.connector.close_database()
         if os.path.isfile(self.filename):
             os.remove(self.filename)
 
 
+class TestMemoryDatabaseConnector(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "test.db")
+        )
+        self.infile = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "der_linksdenker.txt")
+        )
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(
+                self.infile, ngram_size, False
+            )
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, self.filename
+            )
+        self.sqlite = pressagio.dbconnector.SqliteDatabaseConnector(self.filename, 3)
+        self.connector = pressagio.dbconnector.MemoryDatabaseConnector(
+            self.filename, 3
+        )
+
+    def test_load_sqlite(self):
+        for cardinality in range(1, 4):
+            self.sqlite.cardinality = cardinality
+            self.connector.cardinality = cardinality
+            assert sorted(self.connector.ngrams(with_counts=True)) == sorted(
+                self.sqlite.ngrams(with_counts=True)
+            )
+            assert self.connector.ngram_total(cardinality) == self.sqlite.ngram_total(
+                cardinality
+            )
+        assert self.connector.unigram_counts_sum() == self.sqlite.unigram_counts_sum()
+        assert self.connector.context_count(("der",)) == self.sqlite.context_count(
+            ("der",)
+        )
+
+    def test_ngram_like_table(self):
+        for ngram in [("d",), ("D",), ("der", ""), ("der", "l"), ("Der", "", "")]:
+            assert sorted(self.connector.ngram_like_table(ngram)) == sorted(
+                self.sqlite.ngram_like_table(ngram)
+            )
+            assert sorted(
+                self.connector.ngram_like_table_filtered(ngram, "ae")
+            ) == sorted(self.sqlite.ngram_like_table_filtered(ngram, "ae"))
+        result = self.connector.ngram_like_table(("d",), 3)
+        assert [row[-1] for row in result] == [
+            row[-1] for row in self.sqlite.ngram_like_table(("d",), 3)
+        ]
+        for ngrams in [[("Der", "L", "d"), ("L", "d"), ("d",)], [("der", ""), ("",)]]:
+            assert sorted(self.connector.backoff_candidates(ngrams, 1000)) == sorted(
+                self.sqlite.backoff_candidates(ngrams, 1000)
+            )
+        assert self.connector.ngram_like_table(("unbekannt", "")) == []
+
+    def test_write(self):
+        self.connector.insert_ngram(("der", "linksabbieger"), 32)
+        assert self.connector.ngram_count(("der", "linksabbieger")) == 32
+        self.connector.upsert_ngrams([(("der", "linksabbieger"), 2)])
+        assert self.connector.ngram_count(("der", "linksabbieger")) == 34
+        self.connector.update_ngram(("der", "linksabbieger"), 30)
+        assert self.connector.ngram_count(("der", "linksabbieger")) == 30
+        assert self.connector.ngram_total(2) == self.sqlite.ngram_total(2) + 30
+        assert self.connector.ngram_like_table(("der", "linksa")) == [
+            ("der", "linksabbieger", 30)
+        ]
+        self.connector.remove_ngram(("der", "linksabbieger"))
+        assert self.connector.ngram_count(("der", "linksabbieger")) == 0
+        assert self.connector.ngram_total(2) == self.sqlite.ngram_total(2)
+        assert self.connector.context_count(("der",)) == self.sqlite.context_count(
+            ("der",)
+        )
+
+    def tearDown(self):
+        self.sqlite.close_database()
+        self.connector.close_database()
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+
+class TestShardedDatabaseConnector(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "test.db")
+        )
+        self.sharded_filename = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "test_sharded.db")
+        )
+        infile = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "der_linksdenker.txt")
+        )
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(
+                infile, ngram_size, False
+            )
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, self.filename
+            )
+            pressagio.dbconnector.insert_ngram_map_sharded(
+                ngram_map, ngram_size, self.sharded_filename, 3, processes=2
+            )
+        self.sqlite = pressagio.dbconnector.SqliteDatabaseConnector(self.filename, 3)
+        self.connector = pressagio.dbconnector.ShardedDatabaseConnector(
+            self.sharded_filename, 3
+        )
+
+    def test_shards(self):
+        assert self.connector.shards == 3
+        for index, shard in enumerate(self.connector.connectors):
+            shard.cardinality = 3
+            ngrams = list(shard.ngrams())
+            assert len(ngrams) > 0
+            for ngram in ngrams:
+                assert pressagio.dbconnector.shard_index(ngram[0], 3) == index
+        assert not self.connector.meta._table_exists("_2_gram")
+
+    def test_lookups(self):
+        for cardinality in range(1, 4):
+            self.sqlite.cardinality = cardinality
+            self.connector.cardinality = cardinality
+            assert sorted(self.connector.ngrams(with_counts=True)) == sorted(
+                self.sqlite.ngrams(with_counts=True)
+            )
+            assert self.connector.has_metadata(cardinality)
+            assert self.connector.ngram_total(cardinality) == self.sqlite.ngram_total(
+                cardinality
+            )
+        assert self.connector.context_count(("der",)) == self.sqlite.context_count(
+            ("der",)
+        )
+        ngrams = [("Der", "Linksdenker"), ("der", "rechts"), ("nicht",)]
+        assert self.connector.ngram_counts(ngrams) == self.sqlite.ngram_counts(ngrams)
+        for ngram in [("d",), ("Der", ""), ("Der", "L"), ("ist", "ein", "")]:
+            assert sorted(self.connector.ngram_like_table(ngram)) == sorted(
+                self.sqlite.ngram_like_table(ngram)
+            )
+            assert sorted(
+                self.connector.ngram_like_table_filtered(ngram, ["a", "e"])
+            ) == sorted(self.sqlite.ngram_like_table_filtered(ngram, ["a", "e"]))
+
+        async def lookups():
+            return await asyncio.gather(
+                self.connector.angram_total(2),
+                self.connector.angram_counts(ngrams),
+                self.connector.angram_like_table(("Der", "L")),
+            )
+
+        total, counts, like = asyncio.run(lookups())
+        assert total == self.sqlite.ngram_total(2)
+        assert counts == self.sqlite.ngram_counts(ngrams)
+        assert sorted(like) == sorted(self.sqlite.ngram_like_table(("Der", "L")))
+
+    def test_write(self):
+        total = self.connector.ngram_total(2)
+        self.connector.insert_ngrams([(("der", "Neuling"), 2), (("die", "Neue"), 3)])
+        self.connector.update_ngram(("der", "Neuling"), 4)
+        assert self.connector.ngram_count(("der", "Neuling")) == 4
+        assert self.connector.ngram_total(2) == total + 7
+        self.connector.remove_ngram(("die", "Neue"))
+        assert self.connector.ngram_total(2) == total + 4
+        assert self.connector.ngram_total(2) == sum(
+            shard.ngram_total(2) for shard in self.connector.connectors
+        )
+
+    def test_read_only(self):
+        connector = pressagio.dbconnector.ShardedDatabaseConnector(
+            self.sharded_filename, 3, read_only=True
+        )
+        assert connector.shards == 3
+        assert connector.ngram_total(2) == self.sqlite.ngram_total(2)
+        connector.close_database()
+
+        new_filename = os.path.join(
+            os.path.dirname(self.sharded_filename), "test_new_sharded.db"
+        )
+        with self.assertRaises(ValueError):
+            pressagio.dbconnector.ShardedDatabaseConnector(
+                new_filename, 3, shards=2, read_only=True
+            )
+        assert not os.path.exists(new_filename)
+        with self.assertRaises(ValueError):
+            pressagio.dbconnector.ShardedDatabaseConnector(
+                self.filename, 3, read_only=True
+            )
+
+    def tearDown(self):
+        self.sqlite.close_database()
+        self.connector.close_database()
+        for filename in [self.filename, self.sharded_filename] + [
+            pressagio.dbconnector.shard_filename(self.sharded_filename, index)
+            for index in range(3)
+        ]:
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+
+class TestBinaryDatabaseConnector(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "test.db")
+        )
+        self.binfile = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "test.bin")
+        )
+        self.infile = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "der_linksdenker.txt")
+        )
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(
+                self.infile, ngram_size, False
+            )
+            pressagio.dbconnector.insert_ngram_map_sqlite(
+                ngram_map, ngram_size, self.filename
+            )
+        pressagio.dbconnector.convert_sqlite_to_binary(self.filename, self.binfile, 3)
+        self.sqlite = pressagio.dbconnector.SqliteDatabaseConnector(self.filename, 3)
+        self.connector = pressagio.dbconnector.BinaryDatabaseConnector(self.binfile, 3)
+
+    def test_convert_sqlite_to_binary(self):
+        for cardinality in range(1, 4):
+            self.sqlite.cardinality = cardinality
+            self.connector.cardinality = cardinality
+            ngrams = sorted(self.sqlite.ngrams(with_counts=True))
+            assert sorted(self.connector.ngrams(with_counts=True)) == ngrams
+            assert self.connector.ngram_total(cardinality) == self.sqlite.ngram_total(
+                cardinality
+            )
+            for ngram in ngrams[:50]:
+                assert self.connector.ngram_count(ngram[:-1]) == ngram[-1]
+                assert self.connector.context_count(
+                    ngram[:-2]
+                ) == self.sqlite.context_count(ngram[:-2])
+        assert self.connector.ngram_count(("der", "unbekannt")) == 0
+
+    def test_ngram_like_table(self):
+        for ngram in [("d",), ("D",), ("der", ""), ("der", "l"), ("Der", "", "")]:
+            assert sorted(self.connector.ngram_like_table(ngram)) == sorted(
+                self.sqlite.ngram_like_table(ngram)
+            )
+            assert sorted(
+                self.connector.ngram_like_table_filtered(ngram, "aeE")
+            ) == sorted(self.sqlite.ngram_like_table_filtered(ngram, "aeE"))
+        result = self.connector.ngram_like_table(("d",), 3)
+        assert [row[-1] for row in result] == [
+            row[-1] for row in self.sqlite.ngram_like_table(("d",), 3)
+        ]
+        for ngrams in [[("Der", "L", "d"), ("L", "d"), ("d",)], [("der", ""), ("",)]]:
+            assert sorted(self.connector.backoff_candidates(ngrams, 1000)) == sorted(
+                self.sqlite.backoff_candidates(ngrams, 1000)
+            )
+        assert self.connector.ngram_like_table(("unbekannt", "")) == []
+
+    def test_completion_index(self):
+        index = pressagio.dbconnector.CompletionIndex(
+            self.sqlite.ngram_like_table([""]), 4
+        )
+        assert len(index) == len(self.sqlite.ngram_like_table([""]))
+        for prefix in ["", "d", "D", "de", "lin", "x"]:
+            for limit in [2, 4, 10, -1]:
+                expected = self.sqlite.ngram_like_table([prefix], limit)
+                result = index.complete(prefix, limit)
+                assert [row[-1] for row in result] == [row[-1] for row in expected]
+                if limit == -1:
+                    assert sorted(result) == sorted(expected)
+            expected = self.sqlite.ngram_like_table_filtered([prefix], "ae")
+            assert sorted(index.complete_filtered(prefix, "ae")) == sorted(expected)
+
+    def test_prefix_range(self):
+        model = self.connector.model
+        start, end = model.prefix_range("de")
+        words = [model.word(i) for i in range(model.vocabulary_size)]
+        assert words[start:end] == [
+            w for w in words if w.encode("utf-8").lower().startswith(b"de")
+        ]
+        assert model.word_id("Der") is not None
+        assert model.word_id("DER") is None
+
+    def tearDown(self):
+        self.sqlite.close_database()
+        self.connector.close_database()
+        for filename in (self.filename, self.binfile):
+            if os.path.isfile(filename):
+                os.remove(filename)
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.queries = 0
+
+    def cursor(self):
+        if self.closed:
+            raise RuntimeError("connection already closed")
+        self.queries += 1
+        return self
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return [(1,)]
+
+    def close(self):
+        self.closed = 1
+
+
+class TestPostgresConnectionPool(unittest.TestCase):
+    def setUp(self):
+        self.connections = []
+
+        def connect():
+            self.connections.append(FakeConnection())
+            return self.connections[-1]
+
+        self.pool = pressagio.dbconnector.PostgresConnectionPool(
+            connect, min_size=1, max_size=2, timeout=0.05, health_check_interval=0
+        )
+
+    def test_reuse(self):
+        assert self.pool.size == 1
+        with self.pool.connection() as con:
+            assert con.autocommit
+        with self.pool.connection() as other:
+            assert other is con
+        assert len(self.connections) == 1
+
+    def test_max_size(self):
+        first = self.pool.getconn()
+        second = self.pool.getconn()
+        assert first is not second
+        assert self.pool.size == 2
+        with self.assertRaises(pressagio.dbconnector.PoolTimeoutException):
+            self.pool.getconn()
+        self.pool.putconn(second)
+        assert self.pool.getconn() is second
+
+    def test_health_check(self):
+        con = self.pool.getconn()
+        self.pool.putconn(con)
+        con.closed = 1
+        other = self.pool.getconn()
+        assert other is not con
+        assert self.pool.size == 1
+        self.pool.putconn(other)
+        assert self.pool.getconn() is other
+        assert other.queries == 1
+
+    def test_close(self):
+        con = self.pool.getconn()
+        self.pool.close()
+        self.pool.putconn(con)
+        assert con.closed
+        assert self.pool.size == 0
+        with self.assertRaises(pressagio.dbconnector.PoolException):
+            self.pool.getconn()
+
+
+class TestPostgresPredictionFunction(unittest.TestCase):
+    def test_prediction_function_statement(self):
+        connector = pressagio.dbconnector.PostgresDatabaseConnector("test", 3)
+        statement = connector._statement("prediction_function", 3)
+        assert "FUNCTION pressagio_predict_3(" in statement
+        # all parameters of the candidate statement are function arguments
+        assert re.search(r"\$\d", statement) is None
+        assert "WHERE word_2 = context[1] AND word_1 = context[2]" in statement
+        assert "g3.word_2 = context[1] AND g3.word_1 = context[2]" in statement
+        assert "WHERE word_1 = context[1] AND word = context[2]" in statement
+        query = connector._smoothed_ngram_prediction_query(
+            ["der", "linke", "L"], [0.01, 0.1, 0.89], 6
+        )
+        assert query == (
+            "SELECT word, probability FROM pressagio_predict_3($1, $2, $3, $4)",
+            [["der", "linke"], "L", [0.01, 0.1, 0.89], 6],
+        )
+
+
 if psycopg2_installed:
 
     class TestPostgresDatabaseConnector(unittest.TestCase):
@@ -247,6 +1255,100 @@ if psycopg2_installed:
             self.connector.normalize = False
             self.connector.lowercase = False
 
+        def test_insert_ngram_map_postgres(self):
+            ngram_map = pressagio.tokenizer.NgramMap()
+            ngram_map.add([ngram_map.add_token("der"), ngram_map.add_token("tab\t")])
+            ngram_map.add([ngram_map.add_token("der"), ngram_map.add_token("links")])
+            pressagio.dbconnector.insert_ngram_map_postgres(ngram_map, 2, "test")
+            assert self.connector.ngram_count(("der", "tab\t")) == 1
+
+            pressagio.dbconnector.insert_ngram_map_postgres(
+                ngram_map, 2, "test", append=True
+            )
+            assert self.connector.ngram_count(("der", "tab\t")) == 2
+            assert self.connector.ngram_count(("der", "links")) == 2
+            self.connector.execute_sql("DROP TABLE _2_gram;")
+
+        def test_insert_ngram_map_postgres_without_metadata(self):
+            ngram_map = pressagio.tokenizer.NgramMap()
+            ngram_map.add([ngram_map.add_token("der"), ngram_map.add_token("links")])
+            ngram_map.add([ngram_map.add_token("die"), ngram_map.add_token("links")])
+            pressagio.dbconnector.insert_ngram_map_postgres(ngram_map, 2, "test")
+            assert self.connector.has_metadata(2)
+
+            # the existing metadata is kept in sync
+            pressagio.dbconnector.insert_ngram_map_postgres(
+                ngram_map, 2, "test", append=True, metadata=False
+            )
+            connector = pressagio.dbconnector.PostgresDatabaseConnector("test", 2)
+            connector.open_database()
+            assert connector.has_metadata(2)
+            assert connector.ngram_total(2) == 4
+            assert connector.context_count(("der",)) == 2
+            connector.close_database()
+            self.connector.delete_ngram_table(2)
+
+        def test_merge_staging_table(self):
+            self.connector.create_bigram_table()
+            self.connector.insert_ngrams(
+                [(("der", "linksdenker"), 22), (("die", "linkskurve"), 5)]
+            )
+            self.connector.update_metadata(2)
+            self.connector.create_staging_table(2)
+            self.connector.copy_ngrams(
+                [(("der", "linksdenker"), 2), (("der", "linksabbieger"), 32)],
+                staging=True,
+            )
+            self.connector.merge_staging_table(2)
+            assert self.connector.ngram_count(("der", "linksdenker")) == 24
+            assert self.connector.ngram_total(2) == 61
+            assert self.connector.context_count(("der",)) == 56
+            assert self.connector.context_count(("die",)) == 5
+            self.connector.delete_ngram_table(2)
+
+        def test_smoothed_ngram_prediction(self):
+            self.connector.create_prediction_function(2)
+            self.connector.create_unigram_table()
+            self.connector.create_bigram_table()
+            self.connector.insert_ngrams(
+                [(("der",), 10), (("linksdenker",), 4), (("linksabbieger",), 2)]
+            )
+            self.connector.insert_ngrams(
+                [(("der", "linksdenker"), 3), (("der", "linksabbieger"), 1)]
+            )
+            self.connector.update_metadata(1)
+            self.connector.commit()
+            result = self.connector.smoothed_ngram_prediction(
+                ["der", "links"], [0.1, 0.9], 6
+            )
+            assert [(word, round(p, 6)) for word, p in result] == [
+                ("linksdenker", 0.295),
+                ("linksabbieger", 0.1025),
+            ]
+            result = self.connector.smoothed_ngram_prediction(["", "d"], [0.1, 0.9], 6)
+            assert [(word, round(p, 6)) for word, p in result] == [("der", 0.0625)]
+            self.connector.execute_sql("DROP TABLE _1_gram;")
+            self.connector.execute_sql("DROP TABLE _2_gram;")
+
+        def test_pooled_connector(self):
+            self.connector.create_bigram_table()
+            self.connector.insert_ngram(("der", "linksdenker"), 22)
+            self.connector.commit()
+            pooled = pressagio.dbconnector.PooledPostgresDatabaseConnector(
+                "test", 2, min_size=1, max_size=2
+            )
+            pooled.open_database()
+            other = pressagio.dbconnector.PooledPostgresDatabaseConnector("test", 2)
+            other.open_database()
+            assert pooled.pool is other.pool
+            assert pooled.ngram_count(("der", "linksdenker")) == 22
+            assert other.ngram_count(("der", "linksdenker")) == 22
+            assert pooled.pool.size == 1
+            pooled.pool.close()
+            pooled.close_database()
+            other.close_database()
+            self.connector.execute_sql("DROP TABLE _2_gram;")
+
         def tearDown(self):
             self.connector.close_database()
             con = psycopg2.connect(
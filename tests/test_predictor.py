@@ -1,4 +1,6 @@
+import asyncio
 import os
+import threading
 import unittest
 
 try:
@@ -6,12 +8,21 @@ try:
 except ImportError:
     import ConfigParser as configparser
 
+import pressagio
 import pressagio.predictor
 import pressagio.tokenizer
 import pressagio.dbconnector
 import pressagio.context_tracker
 import pressagio.callback
 
+psycopg2_installed = False
+try:
+    import psycopg2
+
+    psycopg2_installed = True
+except ImportError:
+    pass
+
 
 class TestSuggestion(unittest.TestCase):
     def setUp(self):
@@ -84,6 +95,7 @@ class TestSmoothedNgramPredictor(unittest.TestCase):
         config = configparser.ConfigParser()
         config.read(config_file)
         config.set("Database", "database", self.dbfilename)
+        self.config = config
 
         self.predictor_registry = pressagio.predictor.PredictorRegistry(config)
 
@@ -129,6 +141,207 @@ class TestSmoothedNgramPredictor(unittest.TestCase):
         assert "den" in words
         assert "des" in words
 
+        self.callback.stream = "d"
+        predictions = predictor.predict(6, "e")
+        assert len(predictions) == 6
+        for p in predictions:
+            assert p.word.lower().startswith("de")
+
+    def test_predict_without_completion_index(self):
+        predictor = self.predictor_registry[0]
+        assert len(predictor.completion_index) > 0
+        self.config.set("Database", "completion_index", "False")
+        registry = pressagio.predictor.PredictorRegistry(self.config)
+        pressagio.context_tracker.ContextTracker(self.config, registry, self.callback)
+        assert registry[0].completion_index is None
+        for stream, filter in [("", None), ("d", None), ("de", None), ("d", "e")]:
+            self.callback.stream = stream
+            expected = [(p.word, p.probability) for p in predictor.predict(6, filter)]
+            predictions = registry[0].predict(6, filter)
+            assert [(p.word, p.probability) for p in predictions] == expected
+        registry.close_database()
+
+    def test_completion_index_cached(self):
+        predictor = self.predictor_registry[0]
+        index = predictor.completion_index
+        predictor.deltas = predictor.deltas
+        predictor.learn_mode = predictor.learn_mode
+        assert predictor.completion_index is index
+        predictor.database = predictor.database
+        assert predictor.completion_index is index
+
+    @unittest.skipUnless(psycopg2_installed, "psycopg2 is not installed")
+    def test_completion_index_case_sensitive(self):
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(
+                self.infile, ngram_size, False
+            )
+            pressagio.dbconnector.insert_ngram_map_postgres(
+                ngram_map, ngram_size, "test", create_index=True
+            )
+        self.config.set("Database", "class", "PostgresDatabaseConnector")
+        self.config.set("Database", "database", "test")
+        self.config.set("Database", "host", "localhost")
+        self.config.set("Database", "port", "5432")
+        self.config.set("Database", "user", "postgres")
+        self.config.set("Database", "password", "")
+        self.config.set("Database", "lowercase_mode", "False")
+        self.config.set("Database", "normalize_mode", "False")
+        predictions = {}
+        for completion_index in ["True", "False"]:
+            self.config.set("Database", "completion_index", completion_index)
+            registry = pressagio.predictor.PredictorRegistry(self.config)
+            pressagio.context_tracker.ContextTracker(
+                self.config, registry, self.callback
+            )
+            assert registry[0].completion_index is None
+            for stream in ["d", "D", "Der L"]:
+                self.callback.stream = stream
+                predictions[completion_index, stream] = [
+                    (p.word, p.probability) for p in registry[0].predict(6, None)
+                ]
+            registry.close_database()
+        for stream in ["d", "D", "Der L"]:
+            assert predictions["True", stream] == predictions["False", stream]
+        assert all(
+            word.startswith("d") for word, _ in predictions["True", "d"]
+        )
+        con = psycopg2.connect(host="localhost", database="postgres", user="postgres")
+        con.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        con.cursor().execute("DROP DATABASE test;")
+        con.close()
+
+    def test_apredict(self):
+        predictor = self.predictor_registry[0]
+        for stream, filter in [("", None), ("d", None), ("de", None), ("d", "e")]:
+            self.callback.stream = stream
+            expected = [(p.word, p.probability) for p in predictor.predict(6, filter)]
+            predictions = asyncio.run(predictor.apredict(6, filter))
+            assert [(p.word, p.probability) for p in predictions] == expected
+
+    def test_predict_memory(self):
+        self.config.set("Database", "class", "MemoryDatabaseConnector")
+        registry = pressagio.predictor.PredictorRegistry(self.config)
+        pressagio.context_tracker.ContextTracker(self.config, registry, self.callback)
+        predictor = self.predictor_registry[0]
+        for stream, filter in [("", None), ("d", None), ("de", None), ("d", "e")]:
+            self.callback.stream = stream
+            expected = [(p.word, p.probability) for p in predictor.predict(6, filter)]
+            predictions = registry[0].predict(6, filter)
+            assert sorted((p.word, p.probability) for p in predictions) == sorted(
+                expected
+            )
+
+    def test_predict_binary(self):
+        binfile = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "test.bin")
+        )
+        pressagio.dbconnector.convert_sqlite_to_binary(self.dbfilename, binfile, 3)
+        self.config.set("Database", "class", "BinaryDatabaseConnector")
+        self.config.set("Database", "database", binfile)
+        registry = pressagio.predictor.PredictorRegistry(self.config)
+        pressagio.context_tracker.ContextTracker(self.config, registry, self.callback)
+        predictor = self.predictor_registry[0]
+        for stream, filter in [("", None), ("d", None), ("de", None), ("d", "e")]:
+            self.callback.stream = stream
+            expected = [(p.word, p.probability) for p in predictor.predict(6, filter)]
+            predictions = registry[0].predict(6, filter)
+            assert sorted((p.word, p.probability) for p in predictions) == sorted(
+                expected
+            )
+        registry.close_database()
+        os.remove(binfile)
+
+    def test_predict_sharded(self):
+        shardfile = os.path.abspath(
+            os.path.join(os.path.dirname(__file__), "test_data", "test_sharded.db")
+        )
+        for ngram_size in range(1, 4):
+            ngram_map = pressagio.tokenizer.forward_tokenize_file(
+                self.infile, ngram_size, False
+            )
+            pressagio.dbconnector.insert_ngram_map_sharded(
+                ngram_map, ngram_size, shardfile, 2, processes=2
+            )
+        self.config.set("Database", "class", "ShardedDatabaseConnector")
+        self.config.set("Database", "database", shardfile)
+        registry = pressagio.predictor.PredictorRegistry(self.config)
+        pressagio.context_tracker.ContextTracker(self.config, registry, self.callback)
+        predictor = self.predictor_registry[0]
+        for stream, filter in [("", None), ("d", None), ("Der L", None), ("d", "e")]:
+            self.callback.stream = stream
+            expected = [(p.word, p.probability) for p in predictor.predict(6, filter)]
+            predictions = registry[0].predict(6, filter)
+            assert sorted((p.word, p.probability) for p in predictions) == sorted(
+                expected
+            )
+        registry.close_database()
+        for filename in [shardfile] + [
+            pressagio.dbconnector.shard_filename(shardfile, index) for index in range(2)
+        ]:
+            os.remove(filename)
+
+    def test_predict_threads(self):
+        self.config.set("Database", "thread_local", "True")
+        callback = pressagio.callback.ThreadLocalCallback()
+        prsgio = pressagio.Pressagio(callback, self.config)
+        streams = ["", "d", "de", "Der Links"]
+        expected = {}
+        for stream in streams:
+            callback.stream = stream
+            expected[stream] = prsgio.predict()
+
+        results = {}
+
+        def predict(stream):
+            callback.stream = stream
+            for i in range(10):
+                results.setdefault(stream, []).append(prsgio.predict())
+
+        threads = [threading.Thread(target=predict, args=(s,)) for s in streams]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for stream in streams:
+            assert results[stream] == [expected[stream]] * 10
+        prsgio.close_database()
+
+    def test_prediction_stats(self):
+        callback = pressagio.callback.ThreadLocalCallback()
+        prsgio = pressagio.Pressagio(callback, self.config)
+        assert prsgio.prediction_stats() is None
+        stats = prsgio.enable_stats()
+        callback.stream = ""
+        prsgio.predict()
+        for stream, filter, queries in [
+            ("d", None, 4),
+            ("Der L", None, 6),
+            ("d", "e", 4),
+        ]:
+            callback.stream = stream
+            prsgio.predict(filter)
+            totals = prsgio.prediction_stats()
+            assert totals.queries == queries
+            assert sum(totals.statements.values()) == queries
+            assert totals.rows > 0
+
+        async def apredict():
+            await prsgio.apredict()
+            return prsgio.prediction_stats()
+
+        # the async prediction looks up all cardinalities with one query
+        callback.stream = "Der L"
+        assert asyncio.run(apredict()).queries == 5
+        assert stats.totals().queries == 6 + 4 + 6 + 4 + 5
+        assert len(stats.slow_queries) == 0
+
+        prsgio.disable_stats()
+        assert prsgio.predictor_registry[0].db.stats is None
+        prsgio.predict()
+        assert prsgio.prediction_stats() is None
+        prsgio.close_database()
+
     def tearDown(self):
         if self.predictor_registry[0].db:
             self.predictor_registry[0].db.close_database()